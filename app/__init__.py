@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Web admin dashboard
+===================
+
+A Flask app that reviews orders and manages products through bot.py's own data layer
+(same SQLite file: BOT_DB_PATH). It runs as a separate process next to the bot and is
+served by waitress (see run.py / Procfile):
+
+• reads  — per-thread read-only connections (mode=ro), never take the write lock;
+• writes — the bot's DBWriter: one short BEGIN IMMEDIATE transaction per bulk action.
+
+Bulk accept/reject only touches pending orders (accept also needs a payment proof). Decision
+notices are sent from this process under its own rate limiter (DASHBOARD_NOTIFY_RATE, default
+5/s): it does not share the bot's broadcast budget, so keep BROADCAST_RATE + it under Telegram's
+~30 messages/s per token.
+
+Environment: DASHBOARD_PASSWORD (required), DASHBOARD_SECRET_KEY, PORT, DASHBOARD_THREADS,
+DASHBOARD_NOTIFY_RATE.
+"""
+
+import os
+
+from flask import Flask, redirect, url_for
+
+
+def create_app() -> Flask:
+    app = Flask(__name__, template_folder="templates")
+    password = os.environ.get("DASHBOARD_PASSWORD", "")
+    if not password:
+        raise RuntimeError("DASHBOARD_PASSWORD is not set")
+    app.config.update(
+        # بدون مفتاح ثابت تنتهي الجلسات عند إعادة التشغيل فقط
+        SECRET_KEY=os.environ.get("DASHBOARD_SECRET_KEY") or os.urandom(32),
+        DASHBOARD_PASSWORD=password,
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_SAMESITE="Lax",
+    )
+
+    import bot as core
+    # المخطط والترحيلات (آمنة للتكرار): قد تُشغَّل اللوحة قبل البوت على قاعدة جديدة
+    core.db_init()
+
+    from .admin import admin_bp
+    app.register_blueprint(admin_bp, url_prefix="/admin")
+
+    @app.get("/")
+    def index():
+        return redirect(url_for("admin.orders"))
+
+    return app
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""لوحة الإدارة: جداول الطلبات والمنتجات (keyset)، GET شرطي بـ ETag، وإجراءات جماعية."""
+
+import functools
+import hashlib
+import hmac
+import os
+from typing import Any, Callable, List, Sequence
+
+from flask import (Blueprint, Response, abort, current_app, flash, make_response, redirect,
+                   render_template, request, session, url_for)
+
+import bot as core
+
+admin_bp = Blueprint("admin", __name__)
+
+PAGE_SIZE = 50
+BULK_MAX = 500
+STATUSES = ("pending", "accepted", "rejected", "expired")
+# حصة اللوحة من حد إرسال تيليجرام (~30 رسالة/ث للتوكن كله). اللوحة عملية منفصلة لا تشارك
+# محدِّد البث في البوت، فحصتها صغيرة ثابتة: BROADCAST_RATE + هذه تبقى تحت الحد؛ و429 يُحترم عبر retry_after
+NOTIFY_LIMITER = core.RateLimiter(float(os.environ.get("DASHBOARD_NOTIFY_RATE", "5")))
+
+
+# ===================== الدخول و CSRF =====================
+
+def login_required(view: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(view)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not session.get("admin"):
+            return redirect(url_for("admin.login", next=request.full_path))
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def csrf_token() -> str:
+    token = session.get("csrf")
+    if token is None:
+        token = session["csrf"] = os.urandom(16).hex()
+    return token
+
+
+def local_url(url: str, default: str) -> str:
+    # إعادة توجيه داخلية فقط
+    return url if url.startswith("/") and not url.startswith("//") else default
+
+
+def check_csrf() -> None:
+    if not hmac.compare_digest(request.form.get("csrf", ""), session.get("csrf", "")):
+        abort(400)
+
+
+admin_bp.app_context_processor(lambda: {"csrf_token": csrf_token})
+
+
+@admin_bp.route("/login", methods=["GET", "POST"])
+def login():
+    if request.method == "POST":
+        if hmac.compare_digest(request.form.get("password", ""), current_app.config["DASHBOARD_PASSWORD"]):
+            session.clear()
+            session["admin"] = True
+            return redirect(local_url(request.args.get("next", ""), url_for("admin.orders")))
+        flash("كلمة المرور غير صحيحة")
+    return render_template("login.html")
+
+
+@admin_bp.post("/logout")
+def logout():
+    check_csrf()
+    session.clear()
+    return redirect(url_for("admin.login"))
+
+
+# ===================== GET شرطي =====================
+# الـ ETag يُحسب من صفوف الصفحة نفسها (استعلام keyset محدود بـ PAGE_SIZE)، فلا حاجة لعدّاد
+# إصدارات يحدّثه البوت: إن لم يتغير شيء في الصفحة يُرد 304 دون تنفيذ القالب ولا إرسال الجسم.
+
+def render_conditional(template: str, rows: Sequence[Any], **ctx: Any) -> Response:
+    if session.get("_flashes"):
+        # رسالة معلّقة يجب أن تظهر: لا 304
+        return make_response(render_template(template, rows=rows, **ctx))
+    digest = hashlib.sha1(request.full_path.encode())
+    digest.update(csrf_token().encode())
+    for row in rows:
+        digest.update(repr(tuple(row)).encode())
+    etag = digest.hexdigest()
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = make_response(render_template(template, rows=rows, **ctx))
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def selected_ids() -> List[int]:
+    ids = [int(x) for x in request.form.getlist("ids") if x.isdigit()]
+    if len(ids) > BULK_MAX:
+        abort(400)
+    return ids
+
+
+# ===================== الطلبات =====================
+
+@admin_bp.get("/orders")
+@login_required
+def orders():
+    status = request.args.get("status", "")
+    if status and status not in STATUSES:
+        abort(400)
+    before = request.args.get("before", 0, type=int)
+    rows = core.orders_page(before, PAGE_SIZE + 1, status or None)
+    has_more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    next_before = rows[-1]["id"] if has_more else None
+    return render_conditional("orders.html", rows, status=status, statuses=STATUSES, next_before=next_before)
+
+
+def notify_decisions(changed: List[Any], status: str) -> None:
+    # بمحدِّد اللوحة الخاص (NOTIFY_LIMITER) لا BROADCASTER.limiter: ذاك نسخة في هذه العملية لا يراها البوت
+    for oid, uid in changed:
+        core.send_limited(NOTIFY_LIMITER, uid, core.text_order_decision(oid, status, core.user_lang(uid)))
+
+
+@admin_bp.post("/orders/bulk")
+@login_required
+def orders_bulk():
+    check_csrf()
+    status = {"accept": "accepted", "reject": "rejected"}.get(request.form.get("action", ""))
+    ids = selected_ids()
+    if status is None:
+        abort(400)
+    if ids:
+        changed = core.orders_set_status(ids, status)
+        # الإشعارات بمعدل الإرسال المحدود في الخلفية؛ الرد لا ينتظرها
+        core.tenant_thread(notify_decisions, changed, status, name="web-notify").start()
+        flash(f"تم تحديث {len(changed)} طلب إلى {status}")
+        if len(changed) < len(ids):
+            skipped = "ليست معلّقة أو بلا إثبات دفع" if status == "accepted" else "ليست معلّقة"
+            flash(f"تُرك {len(ids) - len(changed)} طلب دون تغيير ({skipped})")
+    return redirect(local_url(request.form.get("back", ""), url_for("admin.orders")))
+
+
+# ===================== المنتجات =====================
+
+@admin_bp.get("/products")
+@login_required
+def products():
+    after = request.args.get("after", 0, type=int)
+    rows = core.products_page(after, PAGE_SIZE + 1)
+    has_more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    next_after = rows[-1]["id"] if has_more else None
+    return render_conditional("products.html", rows, next_after=next_after)
+
+
+@admin_bp.post("/products/bulk")
+@login_required
+def products_bulk():
+    check_csrf()
+    if request.form.get("action") != "delete":
+        abort(400)
+    ids = selected_ids()
+    if ids:
+        flash(f"تم حذف {core.products_delete(ids)} منتج")
+    return redirect(local_url(request.form.get("back", ""), url_for("admin.products")))
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: money-path latency under a catalog-browsing flood (admission control)
+================================================================================
+
+Runs bot.py (either runtime) against bench/fake_bot_api.py with a fixed number of handler slots
+(BOT_WORKERS for sync, BOT_HANDLER_CONCURRENCY for async) and a simulated Bot API round-trip, so
+capacity is known. Then:
+
+1. prepare — MONEY users walk new order → pick → quantity; half of them also confirm, creating
+             pending orders for the admin to accept.
+2. flood   — fresh users tap "Games & prices" at --rate per second for --seconds (well above
+             capacity). Every --every seconds a prepared user taps Confirm, and the admin taps
+             Accept on one of the pending orders.
+
+Measured from the moment each update is pushed:
+
+• confirm / accept  — p50 / p95 / max until the user's chat gets its reply
+• browse            — how many got the full screen, and p50 of those; busy answers and drops come
+                      from the bot's /metrics "admission" counters
+
+Each runtime is run twice: with admission control (BOT_ADMIT_TARGET, default 1s) and with
+BOT_ADMIT_TARGET=0 (a single FIFO queue, the previous behaviour).
+
+Usage:  python bench/bench_admission.py [--runtime sync|async|both] [--rate 100] [--seconds 15]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+MONEY_BASE = 700_000
+BROWSE_BASE = 800_000
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed(db_path: str, products: int) -> None:
+    env = dict(os.environ, BOT_DB_PATH=db_path)
+    subprocess.run([sys.executable, "-c", f"import sys; sys.path.insert(0, {ROOT!r}); import bot; bot.db_init()"],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO products(name, price) VALUES(?,?)", [(f"Product {i}", 1.0 + i) for i in range(products)])
+    conn.commit()
+    conn.close()
+
+
+def admin_id() -> int:
+    out = subprocess.run([sys.executable, "-c", f"import sys; sys.path.insert(0, {ROOT!r}); import bot; print(bot.ADMIN_IDS[0])"],
+                         check=True, capture_output=True, text=True, env=dict(os.environ, BOT_DB_PATH=":memory:"))
+    return int(out.stdout.strip().splitlines()[-1])
+
+
+def metrics(port: int) -> Dict[str, Any]:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as r:
+        return json.loads(r.read())
+
+
+def step(api: FakeBotAPI, users: List[int], make: Any, timeout: float = 30.0) -> None:
+    t0 = time.monotonic()
+    for uid in users:
+        api.push_update(make(uid))
+    for uid in users:
+        api.wait_reply(uid, t0, timeout=max(0.0, t0 + timeout - time.monotonic()))
+
+
+def pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(runtime: str, target: float, admin: int, args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix=f"admission-{runtime}-")
+    db_path = os.path.join(workdir, "data.db")
+    seed(db_path, 20)
+    api = FakeBotAPI(latency=args.latency).start()
+    port = free_port()
+    env = dict(os.environ, TELEGRAM_API_URL=api.url, BOT_RUNTIME=runtime, BOT_DB_PATH=db_path,
+               BOT_HEALTH_PORT=str(port), BOT_HEALTH_HOST="127.0.0.1", BOT_ADMIT_TARGET=str(target),
+               BOT_WORKERS=str(args.slots), BOT_HANDLER_CONCURRENCY=str(args.slots))
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot.py")], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                metrics(port)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+        taps = int(args.seconds / args.every)
+        money = list(range(MONEY_BASE, MONEY_BASE + 2 * taps))
+        confirmers, owners = money[:taps], money[taps:]
+        step(api, money, lambda uid: api.make_callback(uid, "user:new_order"))
+        step(api, money, lambda uid: api.make_callback(uid, f"user:product:{1 + uid % 20}"))
+        step(api, money, lambda uid: api.make_message(uid, "1"))
+        step(api, owners, lambda uid: api.make_callback(uid, "user:confirm_order"))
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        orders = dict(conn.execute("SELECT user_id, id FROM orders").fetchall())
+        conn.close()
+        # فاصل يعيد ملء دلو الحماية من الإغراق قبل ضغطات التأكيد
+        time.sleep(2.5)
+
+        before = metrics(port)["admission"]
+        api.reset_replies()
+        pushed: Dict[int, float] = {}
+        money_at: Dict[str, List[tuple]] = {"confirm": [], "accept": []}
+        t0 = time.monotonic()
+        total = int(args.rate * args.seconds)
+        next_money = 0
+        for i in range(total):
+            at = t0 + i / args.rate
+            now = time.monotonic()
+            if at > now:
+                time.sleep(at - now)
+            uid = BROWSE_BASE + i
+            pushed[uid] = time.monotonic()
+            api.push_update(api.make_callback(uid, "user:list_products"))
+            if next_money < taps and time.monotonic() - t0 >= next_money * args.every:
+                c, o = confirmers[next_money], owners[next_money]
+                money_at["confirm"].append((c, time.monotonic()))
+                api.push_update(api.make_callback(c, "user:confirm_order"))
+                money_at["accept"].append((o, time.monotonic()))
+                api.push_update(api.make_callback(admin, f"admin:accept:{orders[o]}"))
+                next_money += 1
+
+        lat: Dict[str, List[float]] = {}
+        for kind, items in money_at.items():
+            lat[kind] = []
+            for uid, ts in items:
+                got = api.wait_reply(uid, ts, timeout=max(0.0, t0 + args.seconds + args.drain - time.monotonic()))
+                if got is not None:
+                    lat[kind].append(got - ts)
+        # ما بقي من التصفح: ينتظر حتى يفرغ الطابور أو تنتهي المهلة
+        drain = t0 + args.seconds + args.drain
+        done = -1
+        while time.monotonic() < drain:
+            n = metrics(port)["default"]["updates"]
+            if n == done and not api.pending_updates():
+                break
+            done = n
+            time.sleep(0.5)
+        browse = []
+        for uid, ts in pushed.items():
+            got = api.wait_reply(uid, ts, timeout=0)
+            if got is not None:
+                browse.append(got - ts)
+        after = metrics(port)["admission"]
+        adm = {v: sum(after[c][v] - before[c][v] for c in ("money", "user", "browse")) for v in ("run", "busy", "drop")}
+        return {"lat": lat, "taps": taps, "browse": browse, "pushed": len(pushed), "admission": adm}
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        api.stop()
+
+
+def ms(v: Optional[float]) -> str:
+    return "-" if v is None else f"{v * 1000:.0f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runtime", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--slots", type=int, default=4, help="handler slots (BOT_WORKERS / BOT_HANDLER_CONCURRENCY)")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated Bot API round-trip (s)")
+    parser.add_argument("--rate", type=float, default=100.0, help="catalog taps per second during the flood")
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--every", type=float, default=1.0, help="seconds between confirm/accept taps")
+    parser.add_argument("--target", type=float, default=1.0, help="BOT_ADMIT_TARGET for the admission run")
+    parser.add_argument("--drain", type=float, default=60.0, help="extra seconds to wait for replies")
+    args = parser.parse_args()
+    admin = admin_id()
+    runtimes = ["sync", "async"] if args.runtime == "both" else [args.runtime]
+    print(f"{args.rate:.0f} catalog taps/s for {args.seconds:.0f}s, {args.slots} handler slots, "
+          f"API round-trip {args.latency * 1000:.0f}ms")
+    print(f"{'rt':<6}{'mode':<10}{'kind':<9}{'n':>5}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for runtime in runtimes:
+        for mode, target in (("fifo", 0.0), ("admit", args.target)):
+            res = run(runtime, target, admin, args)
+            for kind in ("confirm", "accept"):
+                v = res["lat"][kind]
+                print(f"{runtime:<6}{mode:<10}{kind:<9}{len(v):>2}/{res['taps']:<2}{ms(pct(v, 0.5)):>9}"
+                      f"{ms(pct(v, 0.95)):>9}{ms(max(v) if v else None):>9}")
+            b, adm = res["browse"], res["admission"]
+            print(f"{runtime:<6}{mode:<10}{'browse':<9}{len(b):>5}{ms(statistics.median(b) if b else None):>9}"
+                  f"{ms(pct(b, 0.95)):>9}{ms(max(b) if b else None):>9}"
+                  f"   of {res['pushed']} · busy {adm['busy']} · dropped {adm['drop']}")
+
+
+if __name__ == "__main__":
+    main()
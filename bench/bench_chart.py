@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: /chart data from hourly rollups vs scanning orders
+=============================================================
+
+Seeds a database with --orders orders spread over --days days (through bot.db_init, so the
+sales_hourly triggers are live), then measures:
+
+• raw scan   — the per-bucket GROUP BY over `orders` that /chart would need without rollups
+• rollup     — bot.sales_series over sales_hourly for the same range
+• render     — bot.render_sales_chart (Pillow PNG), what a cache miss costs on top
+• insert     — order inserts per second with and without the rollup triggers (write overhead)
+
+Both queries are checked to return the same totals.
+
+Usage:  python bench/bench_chart.py [--orders 1000000] [--days 120]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+WORKDIR = tempfile.mkdtemp(prefix="chart-")
+os.environ["BOT_DB_PATH"] = os.path.join(WORKDIR, "data.db")
+sys.path.insert(0, ROOT)
+
+import bot  # noqa: E402
+
+
+def seed(path: str, orders: int, days: int, products: int) -> None:
+    rnd = random.Random(3)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO products(name, price) VALUES(?,?)", [(f"Product {i}", 1.0 + i) for i in range(products)])
+    now = time.time()
+    batch = []
+    for _ in range(orders):
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - rnd.uniform(0, days * 86400)))
+        batch.append((rnd.randrange(1, 10_000), 1 + rnd.randrange(products), 1, 1.0 + rnd.randrange(20),
+                      rnd.choice(("accepted", "accepted", "pending", "rejected", "expired")), ts, ts))
+        if len(batch) == 50_000:
+            conn.executemany("INSERT INTO orders(user_id, product_id, qty, total, status, created_at, updated_at) "
+                             "VALUES(?,?,?,?,?,?,?)", batch)
+            batch.clear()
+    conn.executemany("INSERT INTO orders(user_id, product_id, qty, total, status, created_at, updated_at) "
+                     "VALUES(?,?,?,?,?,?,?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def timed(fn: Callable[[], object], runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def raw_series(first_hour: int, buckets: int, hours: int, pid: int) -> List[tuple]:
+    # بدون تجميع: مسح الطلبات في المدى وتجميعها عند كل طلب
+    sql = ("SELECT (CAST(strftime('%s', created_at) AS INTEGER) / 3600 - ?) / ? AS b, COUNT(*), "
+           "SUM(status = 'accepted'), SUM(CASE WHEN status = 'accepted' THEN total ELSE 0 END) "
+           "FROM orders WHERE created_at >= datetime(? * 3600, 'unixepoch')")
+    params = [first_hour, hours, first_hour]
+    if pid:
+        sql += " AND product_id = ?"
+        params.append(pid)
+    return bot.db_fetchall(sql + " GROUP BY b", tuple(params))
+
+
+def insert_rate(path: str, n: int, triggers: bool) -> float:
+    conn = sqlite3.connect(path)
+    if not triggers:
+        conn.executescript("DROP TRIGGER IF EXISTS trg_sales_order_created; DROP TRIGGER IF EXISTS trg_sales_order_accepted;")
+    t0 = time.perf_counter()
+    for i in range(n):
+        # طلب في معاملته الخاصة كما في order_create_once (بلا fsync كامل في WAL + synchronous=NORMAL)
+        conn.execute("INSERT INTO orders(user_id, product_id, qty, total, status) VALUES(?,?,?,?,?)",
+                     (1, 1 + i % 20, 1, 1.0, "pending"))
+        conn.commit()
+    dt = time.perf_counter() - t0
+    conn.close()
+    return n / dt
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    path = os.environ["BOT_DB_PATH"]
+    bot.db_init()
+    t0 = time.perf_counter()
+    seed(path, args.orders, args.days, args.products)
+    print(f"seeded {args.orders} orders over {args.days} days in {time.perf_counter() - t0:.1f}s "
+          f"({os.path.getsize(path) / 1e6:.0f} MB)")
+    print(f"{'range':<6}{'product':>8}{'raw ms':>10}{'rollup ms':>11}{'render ms':>11}  totals match")
+    for rng, (buckets, hours, _label) in bot.CHART_RANGES.items():
+        for pid in (0, 1):
+            end = int(time.time()) // 3600 // hours
+            first = (end - buckets + 1) * hours
+            raw = timed(lambda: raw_series(first, buckets, hours, pid), args.runs)
+            roll = timed(lambda: bot.sales_series(first, buckets, hours, pid), args.runs)
+            series, title, _caption = bot.chart_data((rng, pid, 0, end))
+            render = timed(lambda: bot.render_sales_chart(series, hours, title), args.runs)
+            rows = raw_series(first, buckets, hours, pid)
+            same = (sum(r[1] for r in rows), sum(r[2] for r in rows)) == \
+                   (sum(s[1] for s in series), sum(s[2] for s in series))
+            print(f"{rng:<6}{pid or 'all':>8}{raw * 1000:>10.1f}{roll * 1000:>11.2f}{render * 1000:>11.1f}  {same}")
+    with_t = insert_rate(path, 2000, True)
+    without = insert_rate(path, 2000, False)
+    print(f"order inserts/s: {without:.0f} without triggers → {with_t:.0f} with rollup triggers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: time-to-first-reply after a deploy (cold start)
+==========================================================
+
+Simulates a restart of bot.py (either runtime) against bench/fake_bot_api.py. Users who tapped
+while the bot was down are already queued in the fake API when the process starts. For every
+run we measure, from the moment the process is spawned:
+
+• first reply     — the first sendMessage/editMessageText reaching any waiting chat
+• all replied     — every queued user has been answered
+• ready           — GET /readyz returns 200 (warm-up finished)
+• after ready     — reply latency of a fresh tap once the bot reports ready
+
+Scenarios:
+• fresh    — empty database file: schema is created from scratch
+• restart  — seeded database (products, users, orders): schema version matches, DDL is skipped
+
+The [BOOT] phase breakdown printed by the bot is shown under each run. --drop-caches writes to
+/proc/sys/vm/drop_caches before each restart (needs root) to include cold disk pages.
+
+Usage:  python bench/bench_cold_start.py [--runtime sync|async|both] [--runs 3] [--waiting 50]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed(db_path: str, products: int, users: int, orders: int) -> None:
+    """ينشئ المخطط عبر bot.db_init ثم يملأ القاعدة ببيانات تشبه الإنتاج."""
+    env = dict(os.environ, BOT_DB_PATH=db_path)
+    subprocess.run([sys.executable, "-c", f"import sys; sys.path.insert(0, {ROOT!r}); import bot; bot.db_init()"],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+    rnd = random.Random(7)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO products(name, price) VALUES(?,?)",
+                     [(f"Product {i}", round(rnd.uniform(0.5, 50), 2)) for i in range(products)])
+    conn.executemany("INSERT INTO users(user_id, username, first_name, lang) VALUES(?,?,?,?)",
+                     [(100_000 + i, f"user{i}", f"u{i}", rnd.choice(["ar", "en", "tr"])) for i in range(users)])
+    conn.executemany(
+        "INSERT INTO orders(user_id, product_id, qty, total, status) VALUES(?,?,?,?,?)",
+        [(100_000 + rnd.randrange(users), 1 + rnd.randrange(products), 1, 1.0,
+          rnd.choice(["pending", "accepted", "accepted", "rejected"])) for _ in range(orders)])
+    conn.commit()
+    conn.close()
+
+
+def drop_caches() -> bool:
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def wait_ready(port: int, t0: float, timeout: float) -> Optional[float]:
+    deadline = t0 + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=1) as r:
+                if r.status == 200:
+                    return time.monotonic() - t0
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.005)
+    return None
+
+
+def one_run(runtime: str, db_path: str, args: argparse.Namespace, run: int) -> Dict[str, object]:
+    api = FakeBotAPI(latency=args.latency).start()
+    port = free_port()
+    base = 1_000_000 + run * 10_000
+    chats = list(range(base, base + args.waiting))
+    # مستخدمون ضغطوا أثناء التوقف: تحديثاتهم في الطابور قبل أن تبدأ العملية
+    for i, chat_id in enumerate(chats):
+        api.push_update(api.make_message(chat_id, "/start") if i % 2 else api.make_callback(chat_id, "user:list_products"))
+    env = dict(os.environ, TELEGRAM_API_URL=api.url, BOT_RUNTIME=runtime, BOT_DB_PATH=db_path,
+               BOT_HEALTH_PORT=str(port), BOT_HEALTH_HOST="127.0.0.1", PYTHONUNBUFFERED="1")
+    boot_lines: List[str] = []
+    t0 = time.monotonic()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot.py")], cwd=os.path.dirname(db_path), env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8")
+
+    def reader() -> None:
+        for line in proc.stdout:  # type: ignore[union-attr]
+            if line.startswith("[BOOT]"):
+                boot_lines.append(line.strip())
+    threading.Thread(target=reader, daemon=True).start()
+    res: Dict[str, object] = {}
+    # الجاهزية تُراقب بالتوازي مع الردود، من لحظة بدء العملية
+    ready = threading.Thread(target=lambda: res.__setitem__("ready", wait_ready(port, t0, args.timeout)), daemon=True)
+    ready.start()
+    try:
+        replies = [api.wait_reply(c, t0, timeout=max(0.0, t0 + args.timeout - time.monotonic())) for c in chats]
+        done = [ts - t0 for ts in replies if ts is not None]
+        res["first"] = min(done) if done else None
+        res["all"] = max(done) if len(done) == len(chats) else None
+        ready.join(args.timeout)
+        t1 = time.monotonic()
+        api.push_update(api.make_callback(base + 9_999, "user:list_products"))
+        ts = api.wait_reply(base + 9_999, t1, timeout=args.timeout)
+        res["after_ready"] = None if ts is None else ts - t1
+        time.sleep(0.05)
+        res["boot"] = list(boot_lines)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        api.stop()
+    return res
+
+
+def ms(v: object) -> str:
+    return f"{v * 1000:.0f}" if isinstance(v, float) else "-"
+
+
+def bench(runtime: str, scenario: str, args: argparse.Namespace) -> None:
+    rows: Dict[str, List[float]] = {"first": [], "all": [], "ready": [], "after_ready": []}
+    for run in range(args.runs):
+        workdir = tempfile.mkdtemp(prefix=f"cold-{runtime}-{scenario}-")
+        db_path = os.path.join(workdir, "data.db")
+        if scenario == "restart":
+            seed(db_path, args.products, args.users, args.orders)
+        if args.drop_caches and not drop_caches():
+            print("  (cannot drop page cache: not root)")
+        res = one_run(runtime, db_path, args, run)
+        print(f"{runtime:<6}{scenario:<9}{run:>4}{ms(res['first']):>10}{ms(res['all']):>10}"
+              f"{ms(res['ready']):>10}{ms(res['after_ready']):>12}")
+        for line in res.get("boot", []):  # type: ignore[union-attr]
+            print(f"{'':<19}{line}")
+        for key in rows:
+            if isinstance(res[key], float):
+                rows[key].append(res[key])  # type: ignore[arg-type]
+    print(f"{runtime:<6}{scenario:<9}{'med':>4}" + "".join(
+        f"{ms(statistics.median(v)) if v else '-':>{w}}" for v, w in zip(rows.values(), (10, 10, 10, 12))))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runtime", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--waiting", type=int, default=50, help="users queued while the bot was down")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated Bot API round-trip (s)")
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--orders", type=int, default=500_000)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--drop-caches", action="store_true")
+    args = parser.parse_args()
+    runtimes = ["sync", "async"] if args.runtime == "both" else [args.runtime]
+    print(f"{'rt':<6}{'scenario':<9}{'run':>4}{'first ms':>10}{'all ms':>10}{'ready ms':>10}{'after ms':>12}")
+    for runtime in runtimes:
+        for scenario in ("fresh", "restart"):
+            bench(runtime, scenario, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: keyboard templates vs. building InlineKeyboardMarkup per call
+===============================================================================
+
+Compares what TeleBot ends up doing for every request (build markup + to_json)
+between the original builders (_build_kb_*) and the precomputed templates (kb_*).
+
+Usage:  python bench/bench_keyboards.py [iterations]
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+CASES = [
+    ("kb_main(admin)", lambda: bot._build_kb_main(True).to_json(), lambda: bot.kb_main(True).to_json()),
+    ("kb_admin_panel", lambda: bot._build_kb_admin_panel().to_json(), lambda: bot.kb_admin_panel().to_json()),
+    ("kb_back(cb)", lambda: bot._build_kb_back("admin:panel").to_json(), lambda: bot.kb_back("admin:panel").to_json()),
+    ("kb_order_review(oid)", lambda: bot._build_kb_order_review(123456).to_json(), lambda: bot.kb_order_review(123456).to_json()),
+    ("kb_product_actions(pid)", lambda: bot._build_kb_product_actions(42).to_json(), lambda: bot.kb_product_actions(42).to_json()),
+]
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{'keyboard':<26}{'builder µs':>12}{'template µs':>13}{'speedup':>10}")
+    for name, old, new in CASES:
+        # نفس JSON بالضبط — وإلا فالمقارنة بلا معنى
+        assert old() == new(), name
+        t_old = min(timeit.repeat(old, number=n, repeat=3)) / n * 1e6
+        t_new = min(timeit.repeat(new, number=n, repeat=3)) / n * 1e6
+        print(f"{name:<26}{t_old:>12.2f}{t_new:>13.2f}{t_old / t_new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: reacting to accepted orders — outbox long-poll vs polling `orders` on a timer
+========================================================================================
+
+Seeds --orders pending orders, then accepts them one by one at --rate per second (through
+bot.order_set_status, exactly what the admin button does) while a downstream consumer watches:
+
+• timer   — what the fulfilment script did before: every --interval seconds, SELECT accepted
+            orders newer than the last one it handled
+• outbox  — bot.outbox_poll long-poll on the order event feed (after = last seq, wait 25s)
+
+For each consumer: latency from the accept's COMMIT until the consumer holds the order
+(p50 / p95 / max), and SQLite reads per second — while accepts are flowing and while idle.
+A third line measures what the outbox costs the writer: accepts per second with and without it.
+
+Usage:  python bench/bench_outbox.py [--orders 2000] [--rate 50] [--interval 1.0]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+WORKDIR = tempfile.mkdtemp(prefix="outbox-")
+os.environ["BOT_DB_PATH"] = os.path.join(WORKDIR, "data.db")
+sys.path.insert(0, ROOT)
+
+import bot  # noqa: E402
+
+
+def seed(orders: int) -> List[int]:
+    conn = sqlite3.connect(os.environ["BOT_DB_PATH"])
+    conn.execute("INSERT INTO products(name, price) VALUES('Product', 1.5)")
+    conn.commit()
+    conn.close()
+    return [bot.order_create(1_000 + i, 1, 1) for i in range(orders)]
+
+
+def timer_consumer(seen: Dict[int, float], stop: threading.Event, interval: float) -> None:
+    last = 0
+    while not stop.wait(interval):
+        rows = bot.db_fetchall("SELECT id FROM orders WHERE status='accepted' AND id > ? ORDER BY id", (last,))
+        now = time.monotonic()
+        for r in rows:
+            seen.setdefault(r["id"], now)
+            last = max(last, r["id"])
+
+
+def outbox_consumer(seen: Dict[int, float], stop: threading.Event) -> None:
+    after = None
+    while not stop.is_set():
+        events, after = bot.outbox_poll("bench", after, limit=500, wait=1.0)
+        now = time.monotonic()
+        for e in events:
+            if e["status"] == "accepted":
+                seen.setdefault(e["order_id"], now)
+
+
+def run(kind: str, oids: List[int], args: argparse.Namespace) -> Dict[str, float]:
+    seen: Dict[int, float] = {}
+    stop = threading.Event()
+    target = (lambda: timer_consumer(seen, stop, args.interval)) if kind == "timer" else (lambda: outbox_consumer(seen, stop))
+    th = threading.Thread(target=target, daemon=True)
+    th.start()
+    time.sleep(0.5)
+    m = bot.DEFAULT_TENANT.metrics
+    reads0, t0 = m["reads"], time.monotonic()
+    accepted: Dict[int, float] = {}
+    for i, oid in enumerate(oids):
+        at = t0 + i / args.rate
+        now = time.monotonic()
+        if at > now:
+            time.sleep(at - now)
+        bot.order_set_status(oid, "accepted")
+        accepted[oid] = time.monotonic()
+    busy_s = time.monotonic() - t0
+    # ما بقي: ننتظر أن يلتقط المستهلك آخر طلب
+    deadline = time.monotonic() + args.interval + 5
+    while len(seen) < len(oids) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    busy_reads = m["reads"] - reads0
+    reads1 = m["reads"]
+    time.sleep(args.idle)
+    idle_reads = m["reads"] - reads1
+    stop.set()
+    th.join(args.interval + 30)
+    lat = sorted(seen[o] - accepted[o] for o in oids if o in seen)
+    return {"n": len(lat), "p50": statistics.median(lat), "p95": lat[int(0.95 * (len(lat) - 1))], "max": lat[-1],
+            "busy": busy_reads / busy_s, "idle": idle_reads / args.idle}
+
+
+def accept_rate(oids: List[int], outbox: bool) -> float:
+    if not outbox:
+        # بدون الصندوق: نفس UPDATE بلا قراءة الحالة السابقة ولا إدراج الحدث
+        def job(conn: sqlite3.Connection, oid: int) -> None:
+            conn.execute("UPDATE orders SET status='rejected', updated_at=datetime('now') WHERE id=?", (oid,))
+            conn.execute("DELETE FROM review_leases WHERE order_id=?", (oid,))
+        t0 = time.perf_counter()
+        for oid in oids:
+            bot.db_transaction(lambda conn, oid=oid: job(conn, oid)).result()
+        return len(oids) / (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    for oid in oids:
+        bot.order_set_status(oid, "rejected")
+    return len(oids) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=50.0, help="accepts per second")
+    parser.add_argument("--interval", type=float, default=1.0, help="timer consumer polling interval (s)")
+    parser.add_argument("--idle", type=float, default=5.0, help="seconds measured with no accepts")
+    args = parser.parse_args()
+    bot.db_init()
+    # أربع دفعات معلّقة: مستهلكا القياس الأول، ثم معدّل الكتابة بلا صندوق ومعه
+    # (القرار يمسّ الطلبات المعلّقة فقط، فلكل قياس طلباته)
+    oids = seed(args.orders * 4)
+    half = args.orders
+    print(f"{args.orders} accepts at {args.rate:.0f}/s; timer polls every {args.interval:.1f}s")
+    print(f"{'consumer':<10}{'n':>6}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'reads/s busy':>14}{'reads/s idle':>14}")
+    for kind, batch in (("timer", oids[:half]), ("outbox", oids[half:2 * half])):
+        r = run(kind, batch, args)
+        print(f"{kind:<10}{r['n']:>6}{r['p50'] * 1000:>9.1f}{r['p95'] * 1000:>9.1f}{r['max'] * 1000:>9.1f}"
+              f"{r['busy']:>14.1f}{r['idle']:>14.1f}")
+    without = accept_rate(oids[2 * half:3 * half], False)
+    with_outbox = accept_rate(oids[3 * half:], True)
+    print(f"status writes/s: {without:.0f} without outbox → {with_outbox:.0f} with outbox")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: DB queries per update with and without the batch prefetch stage
+==========================================================================
+
+Runs bot.py (either runtime) against bench/fake_bot_api.py and drives a population of users
+through the full order flow in lock-step rounds, each round pushed as one burst so the bot
+receives full getUpdates batches:
+
+  /start → products → new order → pick product → quantity → confirm → track → order number → /start
+
+The bot's /metrics endpoint (BOT_HEALTH_PORT) is read after every round; the table shows SQLite
+reads and writer jobs per update for each step, once with the prefetch stage (default) and once
+with BOT_PREFETCH=0.
+
+Usage:  python bench/bench_prefetch.py [--users 300] [--runtime sync|async|both]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Callable, Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+BASE_USER = 500_000
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed(db_path: str, products: int) -> None:
+    env = dict(os.environ, BOT_DB_PATH=db_path)
+    subprocess.run([sys.executable, "-c", f"import sys; sys.path.insert(0, {ROOT!r}); import bot; bot.db_init()"],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO products(name, price) VALUES(?,?)", [(f"Product {i}", 1.0 + i) for i in range(products)])
+    conn.commit()
+    conn.close()
+
+
+def metrics(port: int) -> Dict[str, float]:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as r:
+        return json.loads(r.read())["default"]
+
+
+def user_orders(db_path: str) -> Dict[int, int]:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = conn.execute("SELECT user_id, MAX(id) FROM orders GROUP BY user_id").fetchall()
+    conn.close()
+    return {int(u): int(o) for u, o in rows}
+
+
+def steps(db_path: str) -> List[Tuple[str, Callable[[FakeBotAPI, int], Dict[str, Any]]]]:
+    orders: Dict[int, int] = {}
+
+    def track_id(api: FakeBotAPI, uid: int) -> Dict[str, Any]:
+        if not orders:
+            orders.update(user_orders(db_path))
+        return api.make_message(uid, str(orders.get(uid, 1)))
+    return [
+        ("/start", lambda api, uid: api.make_message(uid, "/start")),
+        ("products", lambda api, uid: api.make_callback(uid, "user:list_products")),
+        ("new order", lambda api, uid: api.make_callback(uid, "user:new_order")),
+        ("pick", lambda api, uid: api.make_callback(uid, f"user:product:{1 + uid % 20}")),
+        ("qty", lambda api, uid: api.make_message(uid, "2")),
+        ("confirm", lambda api, uid: api.make_callback(uid, "user:confirm_order")),
+        ("track", lambda api, uid: api.make_callback(uid, "user:track_order")),
+        ("order id", track_id),
+        ("/start 2nd", lambda api, uid: api.make_message(uid, "/start")),
+    ]
+
+
+def run(runtime: str, prefetch: bool, args: argparse.Namespace) -> List[Tuple[str, int, float, float]]:
+    workdir = tempfile.mkdtemp(prefix=f"prefetch-{runtime}-")
+    db_path = os.path.join(workdir, "data.db")
+    seed(db_path, 20)
+    api = FakeBotAPI(latency=args.latency).start()
+    port = free_port()
+    env = dict(os.environ, TELEGRAM_API_URL=api.url, BOT_RUNTIME=runtime, BOT_DB_PATH=db_path,
+               BOT_HEALTH_PORT=str(port), BOT_HEALTH_HOST="127.0.0.1", BOT_PREFETCH="1" if prefetch else "0")
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot.py")], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rows = []
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                metrics(port)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        users = range(BASE_USER, BASE_USER + args.users)
+        for name, make in steps(db_path):
+            before = metrics(port)
+            api.reset_replies()
+            t0 = time.monotonic()
+            for uid in users:
+                api.push_update(make(api, uid))
+            for uid in users:
+                api.wait_reply(uid, t0, timeout=max(0.0, t0 + 30 - time.monotonic()))
+            # التحديث يُحسب بعد انتهاء معالجته (بعد الرد)
+            while metrics(port)["updates"] - before["updates"] < args.users and time.monotonic() - t0 < 30:
+                time.sleep(0.01)
+            after = metrics(port)
+            n = after["updates"] - before["updates"] or 1
+            rows.append((name, int(n), (after["reads"] - before["reads"]) / n, (after["writes"] - before["writes"]) / n))
+            # فاصل يتجاوز نافذة كشف التكرار ويعيد ملء دلو الحماية من الإغراق
+            time.sleep(args.pause)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        api.stop()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runtime", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Bot API round-trip (s)")
+    parser.add_argument("--pause", type=float, default=2.2, help="seconds between rounds")
+    args = parser.parse_args()
+    runtimes = ["sync", "async"] if args.runtime == "both" else [args.runtime]
+    for runtime in runtimes:
+        on, off = run(runtime, True, args), run(runtime, False, args)
+        print(f"\n{runtime}: {args.users} users, per update   reads (off → on)   writer jobs (off → on)")
+        tot = [0.0, 0.0, 0.0, 0.0, 0]
+        for (name, n, r_on, w_on), (_n, _m, r_off, w_off) in zip(on, off):
+            print(f"  {name:<10}{n:>6}{r_off:>12.2f} →{r_on:>5.2f}{w_off:>16.2f} →{w_on:>5.2f}")
+            for i, v in enumerate((r_off, r_on, w_off, w_on)):
+                tot[i] += v * n
+            tot[4] += n
+        n = tot[4] or 1
+        print(f"  {'all':<10}{tot[4]:>6}{tot[0] / n:>12.2f} →{tot[1] / n:>5.2f}{tot[2] / n:>16.2f} →{tot[3] / n:>5.2f}")
+
+
+if __name__ == "__main__":
+    main()
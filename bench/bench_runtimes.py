@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: concurrent users sustained by the sync (TeleBot) vs. async (AsyncTeleBot) runtime
+==========================================================================================
+
+Each runtime is started as a subprocess against bench/fake_bot_api.py (with a simulated
+Telegram round-trip latency). For increasing numbers of concurrent users, every user taps
+at once (/start or "user:list_products"); we measure the time until the bot's reply for that
+chat reaches the fake API, and report the largest concurrency whose p95 stays under the target.
+
+Usage:  python bench/bench_runtimes.py [--latency 0.05] [--p95 1.0] [--rounds 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+LEVELS = [5, 10, 25, 50, 100, 200, 400, 800]
+
+
+def p95(values: List[float]) -> float:
+    if not values:
+        return float("inf")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+
+def run_level(api: FakeBotAPI, users: int, rounds: int, timeout: float) -> List[float]:
+    latencies: List[float] = []
+    for r in range(rounds):
+        api.reset_replies()
+        started: Dict[int, float] = {}
+        # مستخدمون جدد في كل جولة كي لا يتدخل دلو الحماية من الإغراق في القياس
+        base = 10_000 + users * 1_000 + r * users
+        for uid in range(1, users + 1):
+            chat_id = base + uid
+            update = api.make_message(chat_id, "/start") if (uid + r) % 2 else api.make_callback(chat_id, "user:list_products")
+            started[chat_id] = time.monotonic()
+            api.push_update(update)
+        for chat_id, t0 in started.items():
+            t1 = api.wait_reply(chat_id, t0, timeout=max(0.0, t0 + timeout - time.monotonic()))
+            latencies.append((t1 - t0) if t1 is not None else float("inf"))
+    return latencies
+
+
+def bench_runtime(runtime: str, args: argparse.Namespace) -> List[str]:
+    api = FakeBotAPI(latency=args.latency).start()
+    workdir = tempfile.mkdtemp(prefix=f"bench-{runtime}-")
+    env = dict(os.environ, TELEGRAM_API_URL=api.url, BOT_RUNTIME=runtime, BOT_DB_PATH=os.path.join(workdir, "data.db"))
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot.py")], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rows = []
+    try:
+        # الإحماء: ننتظر أول رد حتى نعرف أن الحلقة تعمل
+        t0 = time.monotonic()
+        api.push_update(api.make_message(9_999, "/start"))
+        if api.wait_reply(9_999, t0, timeout=30) is None:
+            return [f"{runtime:<6} did not start"]
+        best = 0
+        for users in LEVELS:
+            lat = run_level(api, users, args.rounds, timeout=args.p95 * 10)
+            value = p95(lat)
+            ok = value <= args.p95
+            finite = [x for x in lat if x != float("inf")]
+            mean = statistics.mean(finite) if finite else float("inf")
+            rows.append(f"{runtime:<6}{users:>7}{mean * 1000:>11.0f}{value * 1000:>11.0f}  {'ok' if ok else 'over'}")
+            if not ok:
+                break
+            best = users
+        rows.append(f"{runtime:<6} sustains {best} concurrent users at p95 <= {args.p95 * 1000:.0f} ms")
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        api.stop()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated Bot API round-trip (s)")
+    parser.add_argument("--p95", type=float, default=1.0, help="p95 latency target (s)")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--runtime", choices=["sync", "async", "both"], default="both")
+    args = parser.parse_args()
+    runtimes = ["sync", "async"] if args.runtime == "both" else [args.runtime]
+    print(f"{'rt':<6}{'users':>7}{'mean ms':>11}{'p95 ms':>11}")
+    for runtime in runtimes:
+        for row in bench_runtime(runtime, args):
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
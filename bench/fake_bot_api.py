@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Local fake Telegram Bot API for benchmarks and soak runs
+========================================================
+
+A tiny threaded HTTP server that speaks enough of https://api.telegram.org/bot<token>/<method>
+for bot.py / bot_async.py to run against it:
+
+• getUpdates      — long-polls an in-memory update queue filled by push_update(); updates pushed
+                    with token=... go only to the bot using that token (multi-tenant runs).
+• sendMessage / editMessageText / answerCallbackQuery / sendPhoto / sendDocument / ...
+                  — answered after a configurable latency, and reported to waiters per chat.
+
+Point the bot at it with:  TELEGRAM_API_URL=http://127.0.0.1:<port> python bot.py
+"""
+
+from __future__ import annotations
+
+import email.parser
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # العميل (البوت) يُغلق اتصالاته عند إيقافه — ليس خطأً في القياس
+        pass
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.calls_by_token: Dict[str, int] = defaultdict(int)
+        self.on_call: Optional[Callable[[str, Dict[str, str]], None]] = None
+        self._queues: Dict[str, Deque[Dict[str, Any]]] = {"*": deque()}
+        self._next_update_id = 1
+        self._next_message_id = 1000
+        self._cond = threading.Condition()
+        self._replies: Dict[int, List[float]] = defaultdict(list)
+        self._reply_cond = threading.Condition()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # الرؤوس والجسم يُكتبان في دفعتين؛ مع Nagle و delayed-ACK يتأخر كل ردّ ~40ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, *_args: Any) -> None:
+                pass
+
+            def _params(self) -> Dict[str, str]:
+                parts = urlsplit(self.path)
+                params = dict(parse_qsl(parts.query))
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    raw = self.rfile.read(length)
+                    body = raw.decode("utf-8", "replace")
+                    ctype = self.headers.get("Content-Type", "")
+                    if "multipart/form-data" in ctype:
+                        # رفع ملف: الحقول النصية كقيم، والملفات بحجمها فقط
+                        msg = email.parser.BytesParser().parsebytes(f"Content-Type: {ctype}\r\n\r\n".encode() + raw)
+                        for part in msg.get_payload():
+                            name = part.get_param("name", header="content-disposition")
+                            data = part.get_payload(decode=True) or b""
+                            params[name] = (f"<file {len(data)} bytes>" if part.get_filename()
+                                            else data.decode("utf-8", "replace"))
+                    elif "json" in ctype:
+                        params.update({k: v if isinstance(v, str) else json.dumps(v) for k, v in json.loads(body).items()})
+                    else:
+                        params.update(dict(parse_qsl(body)))
+                return params
+
+            def _handle(self) -> None:
+                path = urlsplit(self.path).path
+                method = path.rsplit("/", 1)[-1]
+                token = path.rsplit("/", 2)[-2][3:] if path.count("/") >= 2 else ""
+                result = api.dispatch(method, self._params(), token)
+                payload = json.dumps({"ok": True, "result": result}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _handle
+            do_POST = _handle
+
+        self.server = _QuietServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------------------------------------------------------- lifecycle
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeBotAPI":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    # ---------------------------------------------------------------- updates
+
+    def push_update(self, update: Dict[str, Any], token: str = "*") -> int:
+        with self._cond:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+            update["update_id"] = update_id
+            self._queues.setdefault(token, deque()).append(update)
+            self._cond.notify_all()
+        return update_id
+
+    def pending_updates(self) -> int:
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    def make_message(self, user_id: int, text: str) -> Dict[str, Any]:
+        user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "language_code": "ar"}
+        msg: Dict[str, Any] = {
+            "message_id": self._new_message_id(),
+            "from": user,
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "date": int(time.time()),
+            "text": text,
+        }
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"message": msg}
+
+    def make_callback(self, user_id: int, data: str, message_id: Optional[int] = None) -> Dict[str, Any]:
+        user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "language_code": "ar"}
+        message = {
+            "message_id": message_id or self._new_message_id(),
+            "from": BOT_USER,
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "date": int(time.time()),
+            "text": "menu",
+        }
+        return {"callback_query": {"id": f"cq{time.monotonic_ns()}", "from": user, "message": message,
+                                   "chat_instance": str(user_id), "data": data}}
+
+    # ---------------------------------------------------------------- replies
+
+    def wait_reply(self, chat_id: int, after: float, timeout: float) -> Optional[float]:
+        """ينتظر أول ردّ (send/edit) إلى chat_id بعد اللحظة after؛ يعيد وقت وصوله."""
+        deadline = time.monotonic() + timeout
+        with self._reply_cond:
+            while True:
+                for ts in self._replies.get(chat_id, ()):
+                    if ts >= after:
+                        return ts
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._reply_cond.wait(remaining)
+
+    def reset_replies(self) -> None:
+        with self._reply_cond:
+            self._replies.clear()
+
+    # ---------------------------------------------------------------- API
+
+    def _new_message_id(self) -> int:
+        with self._cond:
+            self._next_message_id += 1
+            return self._next_message_id
+
+    def dispatch(self, method: str, params: Dict[str, str], token: str = "") -> Any:
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return self._get_updates(params, token)
+        self.calls_by_token[token] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.on_call:
+            self.on_call(method, params)
+        if method == "getMe":
+            return BOT_USER
+        if method in ("answerCallbackQuery", "deleteWebhook", "setMyCommands"):
+            return True
+        chat_id = int(params.get("chat_id") or 0)
+        if chat_id:
+            with self._reply_cond:
+                self._replies[chat_id].append(time.monotonic())
+                self._reply_cond.notify_all()
+        message_id = int(params.get("message_id") or 0) or self._new_message_id()
+        result = {
+            "message_id": message_id,
+            "from": BOT_USER,
+            "chat": {"id": chat_id, "type": "private"},
+            "date": int(time.time()),
+            "text": params.get("text", ""),
+        }
+        if method == "sendPhoto":
+            # ملف مرفوع يحصل على file_id جديد؛ file_id مُعاد إرساله يبقى كما هو
+            photo = params.get("photo", "")
+            file_id = f"photo{message_id}" if not photo or photo.startswith("<file") else photo
+            result["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 960, "height": 540}]
+            result["caption"] = params.get("caption", "")
+        return result
+
+    def _get_updates(self, params: Dict[str, str], token: str = "") -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + min(timeout, 30)
+        with self._cond:
+            while True:
+                # طابور خاص بالتوكن إن وُجد، وإلا الطابور العام "*"
+                updates = self._queues.get(token, self._queues["*"])
+                while updates and updates[0]["update_id"] < offset:
+                    updates.popleft()
+                remaining = deadline - time.monotonic()
+                if updates or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [updates[i] for i in range(min(limit, len(updates)))]
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Soak test: memory growth and handle leaks over millions of updates
+==================================================================
+
+Runs bot.py (either runtime) against bench/fake_bot_api.py and feeds it synthetic traffic from a
+large simulated user population: /start, catalog browsing, full and abandoned order flows,
+tracking, free text. While it runs, the harness samples the bot process:
+
+• RSS and thread count        — /proc/<pid>/status (RSS minus tracemalloc's own trace tables)
+• open fds / SQLite fds       — /proc/<pid>/fd (links to data.db, -wal, -shm)
+• tracemalloc current size, len(SESSIONS), live sqlite3.Connection objects
+                              — reported by the bot process itself (see child())
+• top allocators              — one tracemalloc snapshot at the end of the warm-up and one at the
+                                last sample only: a snapshot copies every live trace, and its peak
+                                stays in RSS and grows with the heap
+
+After the warm-up, a least-squares slope per 100k updates is computed for each metric; the run
+fails (exit code 1) when any slope exceeds its threshold.
+
+Usage:  python bench/soak.py [--updates 2000000] [--users 200000] [--runtime sync|async]
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+# الحد الأقصى لطابور التحديثات غير المستلمة في الخادم الوهمي — يمنع تضخم المُشغِّل نفسه
+MAX_BACKLOG = 2_000
+PRODUCT_IDS = [1, 2, 3, 4]  # /adddemo على قاعدة فارغة
+
+
+# ---------------------------------------------------------------- child (bot process)
+
+def child() -> None:
+    """يعمل داخل عملية البوت: يشغّل tracemalloc ويكتب سطر إحصاءات كل SOAK_SAMPLE ثانية،
+    وأكبر المخصِّصين فقط حين يطلبهم المُشغِّل (ملف SOAK_STATS.top)."""
+    import tracemalloc
+
+    frames = int(os.environ.get("SOAK_TRACEMALLOC", "1"))
+    if frames:
+        tracemalloc.start(frames)
+    sys.path.insert(0, ROOT)
+    import bot
+
+    path = os.environ["SOAK_STATS"]
+    want_top = path + ".top"
+    interval = float(os.environ.get("SOAK_SAMPLE", "2"))
+
+    def report() -> None:
+        while True:
+            time.sleep(interval)
+            top: List[Tuple[str, int]] = []
+            # اللقطة تنسخ كل الكتل الحية، وذروتها تبقى في RSS وتكبر معها: لا تؤخذ في كل دورة
+            asked = os.path.exists(want_top)
+            if asked and tracemalloc.is_tracing():
+                snap = tracemalloc.take_snapshot().filter_traces(
+                    [tracemalloc.Filter(False, tracemalloc.__file__)]
+                )
+                for st in snap.statistics("lineno")[:25]:
+                    fr = st.traceback[0]
+                    top.append((f"{os.path.relpath(fr.filename, ROOT)}:{fr.lineno}", st.size))
+            conns = sum(1 for o in gc.get_objects() if isinstance(o, bot.sqlite3.Connection))
+            row = {
+                "t": time.time(),
+                "traced": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0,
+                "tracer": tracemalloc.get_tracemalloc_memory(),
+                "sessions": len(bot.SESSIONS),
+                "sqlite_conns": conns,
+                "top": top,
+            }
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+            if asked:
+                os.remove(want_top)
+
+    threading.Thread(target=report, name="soak-report", daemon=True).start()
+    bot.main()
+
+
+# ---------------------------------------------------------------- parent (harness)
+
+def proc_status(pid: int) -> Dict[str, int]:
+    out = {"rss": 0, "threads": 0}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                out["rss"] = int(line.split()[1]) * 1024
+            elif line.startswith("Threads:"):
+                out["threads"] = int(line.split()[1])
+    return out
+
+
+def proc_fds(pid: int, db_path: str) -> Tuple[int, int]:
+    fd_dir = f"/proc/{pid}/fd"
+    total = sqlite = 0
+    for fd in os.listdir(fd_dir):
+        total += 1
+        try:
+            if os.readlink(os.path.join(fd_dir, fd)).startswith(db_path):
+                sqlite += 1
+        except OSError:
+            pass
+    return total, sqlite
+
+
+def request_top(stats_path: str, timeout: float = 300.0) -> List[Any]:
+    """يطلب من البوت لقطة tracemalloc واحدة وينتظر السطر الذي يحملها."""
+    flag = stats_path + ".top"
+    open(flag, "w").close()
+    deadline = time.monotonic() + timeout
+    while os.path.exists(flag) and time.monotonic() < deadline:
+        time.sleep(0.2)
+    return (last_child_stats(stats_path) or {}).get("top", [])
+
+
+def last_child_stats(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 65536))
+            lines = f.read().decode("utf-8", "replace").strip().splitlines()
+    except FileNotFoundError:
+        return None
+    for line in reversed(lines):
+        try:
+            return json.loads(line)
+        except ValueError:
+            continue
+    return None
+
+
+class Traffic:
+    """يولّد سيناريوهات مستخدمين عشوائية كقوائم تحديثات."""
+
+    def __init__(self, api: FakeBotAPI, users: int, seed: int):
+        self.api = api
+        self.users = users
+        self.rng = random.Random(seed)
+        self.base = 1_000_000
+
+    def scenario(self) -> List[Dict[str, Any]]:
+        api, rng = self.api, self.rng
+        uid = self.base + rng.randrange(self.users)
+        roll = rng.random()
+        if roll < 0.25:
+            return [api.make_message(uid, "/start")]
+        if roll < 0.45:
+            return [api.make_callback(uid, "user:list_products")]
+        if roll < 0.60:
+            pid = rng.choice(PRODUCT_IDS)
+            return [
+                api.make_callback(uid, "user:new_order"),
+                api.make_callback(uid, f"user:product:{pid}"),
+                api.make_message(uid, str(rng.randint(1, 50))),
+                api.make_callback(uid, "user:confirm_order"),
+            ]
+        if roll < 0.72:
+            # طلب متروك في المنتصف: الجلسة يجب أن تنتهي صلاحيتها لا أن تتراكم
+            return [api.make_callback(uid, "user:new_order")]
+        if roll < 0.82:
+            return [api.make_callback(uid, "user:track_order"), api.make_message(uid, str(rng.randint(1, 10_000)))]
+        if roll < 0.90:
+            return [api.make_callback(uid, "user:help")]
+        if roll < 0.95:
+            return [api.make_callback(uid, "back:main")]
+        return [api.make_message(uid, rng.choice(["hi", "مرحبا", "?", "123"]))]
+
+
+def slope_per_100k(points: List[Tuple[int, float]]) -> float:
+    if len(points) < 3:
+        return 0.0
+    n = len(points)
+    mx = sum(x for x, _ in points) / n
+    my = sum(y for _, y in points) / n
+    var = sum((x - mx) ** 2 for x, _ in points)
+    if var == 0:
+        return 0.0
+    return sum((x - mx) * (y - my) for x, y in points) / var * 100_000
+
+
+def run(args: argparse.Namespace) -> int:
+    workdir = tempfile.mkdtemp(prefix="soak-")
+    db_path = os.path.join(workdir, "data.db")
+    stats_path = os.path.join(workdir, "stats.jsonl")
+    api = FakeBotAPI(latency=args.latency).start()
+    env = dict(
+        os.environ,
+        TELEGRAM_API_URL=api.url,
+        BOT_RUNTIME=args.runtime,
+        BOT_DB_PATH=db_path,
+        SOAK_STATS=stats_path,
+        SOAK_SAMPLE=str(args.child_interval),
+        SOAK_TRACEMALLOC=str(args.tracemalloc),
+    )
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child"], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    samples: List[Dict[str, Any]] = []
+    try:
+        sys.path.insert(0, ROOT)
+        from bot import ADMIN_IDS  # noqa: E402 — فقط لمعرفة آي دي الأدمن لـ /adddemo
+
+        t0 = time.monotonic()
+        api.push_update(api.make_message(ADMIN_IDS[0], "/adddemo"))
+        if api.wait_reply(ADMIN_IDS[0], t0, timeout=30) is None:
+            print("bot did not start")
+            return 2
+
+        traffic = Traffic(api, args.users, args.seed)
+        pushed = 0
+        next_sample = 0
+        baseline_top: Optional[List[Any]] = None
+        started = time.monotonic()
+        print(f"{'updates':>10}{'upd/s':>8}{'rss MB':>9}{'traced MB':>11}{'fds':>6}{'sqlite':>8}"
+              f"{'conns':>7}{'sessions':>10}{'threads':>9}")
+        while True:
+            processed = pushed - api.pending_updates()
+            if processed >= next_sample:
+                if proc.poll() is not None:
+                    print(f"bot exited with {proc.returncode}")
+                    return 2
+                # لقطتا tracemalloc فقط: عند نهاية الإحماء قبل قراءة RSS فيدخل أثرها في خط الأساس،
+                # وفي آخر عينة بعد قراءتها
+                top: List[Any] = []
+                if args.tracemalloc and processed >= args.warmup and baseline_top is None:
+                    top = baseline_top = request_top(stats_path)
+                st = proc_status(proc.pid)
+                fds, sqlite_fds = proc_fds(proc.pid, db_path)
+                child_stats = last_child_stats(stats_path) or {}
+                if args.tracemalloc and processed >= args.updates and not top:
+                    top = request_top(stats_path)
+                row = {
+                    "updates": processed,
+                    # جداول tracemalloc نفسها تكبر مع عدد الكتل الحية: أداة القياس لا البوت
+                    "rss": st["rss"] - child_stats.get("tracer", 0),
+                    "threads": st["threads"],
+                    "fds": fds,
+                    "sqlite_fds": sqlite_fds,
+                    "traced": child_stats.get("traced", 0),
+                    "sessions": child_stats.get("sessions", 0),
+                    "sqlite_conns": child_stats.get("sqlite_conns", 0),
+                    "top": top,
+                }
+                samples.append(row)
+                rate = processed / max(time.monotonic() - started, 1e-6)
+                print(f"{processed:>10}{rate:>8.0f}{row['rss'] / 2**20:>9.1f}{row['traced'] / 2**20:>11.1f}"
+                      f"{fds:>6}{sqlite_fds:>8}{row['sqlite_conns']:>7}{row['sessions']:>10}{row['threads']:>9}",
+                      flush=True)
+                next_sample += args.sample_every
+                if processed >= args.updates:
+                    break
+            if api.pending_updates() > MAX_BACKLOG or pushed >= args.updates + MAX_BACKLOG:
+                time.sleep(0.01)
+                continue
+            for update in traffic.scenario():
+                api.push_update(update)
+                pushed += 1
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        api.stop()
+    return verdict(samples, args)
+
+
+def verdict(samples: List[Dict[str, Any]], args: argparse.Namespace) -> int:
+    warm = [s for s in samples if s["updates"] >= args.warmup]
+    if len(warm) < 3:
+        print("not enough samples after warm-up; increase --updates or lower --sample-every")
+        return 2
+    checks = [
+        ("rss", 2**20, "MB", args.max_rss_mb),
+        ("traced", 2**20, "MB", args.max_traced_mb),
+        ("fds", 1, "", args.max_fds),
+        ("sqlite_fds", 1, "", args.max_sqlite),
+        ("sqlite_conns", 1, "", args.max_sqlite),
+        ("threads", 1, "", args.max_threads),
+    ]
+    print()
+    print(f"growth per 100k updates (after {args.warmup} warm-up updates):")
+    failed = False
+    for key, scale, unit, limit in checks:
+        slope = slope_per_100k([(s["updates"], s[key] / scale) for s in warm])
+        bad = slope > limit
+        failed |= bad
+        print(f"  {key:<13}{slope:>10.2f} {unit:<3} limit {limit:<6} {'FAIL' if bad else 'ok'}")
+
+    first, last = warm[0], warm[-1]
+    if last["top"]:
+        before = dict(map(tuple, first["top"]))
+        growth = sorted(((size - before.get(loc, 0), loc, size) for loc, size in last["top"]), reverse=True)
+        print()
+        print("top allocators (size now, growth since warm-up):")
+        for delta, loc, size in growth[:10]:
+            print(f"  {size / 1024:>9.0f} KiB  {delta / 1024:>+9.0f} KiB  {loc}")
+    return 1 if failed else 0
+
+
+def main() -> None:
+    if "--child" in sys.argv[1:]:
+        child()
+        return
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=200_000, help="simulated user population")
+    parser.add_argument("--runtime", choices=["sync", "async"], default="sync")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Bot API round-trip (s)")
+    parser.add_argument("--sample-every", type=int, default=50_000, help="updates between samples")
+    parser.add_argument("--warmup", type=int, default=200_000, help="updates ignored by the growth check")
+    parser.add_argument("--child-interval", type=float, default=5.0, help="bot-side stats period (s)")
+    parser.add_argument("--tracemalloc", type=int, default=1, help="frames per trace; 0 disables")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-rss-mb", type=float, default=8.0, help="allowed RSS growth per 100k updates")
+    parser.add_argument("--max-traced-mb", type=float, default=4.0)
+    parser.add_argument("--max-fds", type=float, default=2.0)
+    parser.add_argument("--max-sqlite", type=float, default=1.0)
+    parser.add_argument("--max-threads", type=float, default=1.0)
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -29,18 +29,41 @@ Tested with: pyTelegramBotAPI==4.14.0
 
 from __future__ import annotations
 
+import io
 import os
 import sys
 import time
 import math
 import json
+import queue
+import re
+import functools
+import glob
+import gzip
+import contextvars
+import hashlib
+import html
+import ipaddress
 import sqlite3
+import string
+import threading
 import traceback
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
-
-import telebot
-from telebot import types
+import urllib.parse
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# بداية الإقلاع: زمن استيراد telebot وبقية الملف يُحسب ضمن مرحلة "import"
+# (لذلك تأتي استيرادات telebot بعد هذا السطر عمداً: noqa: E402)
+BOOT_T0 = time.perf_counter()
+
+import telebot  # noqa: E402
+from telebot import apihelper, types  # noqa: E402
+from telebot.handler_backends import BaseMiddleware, CancelUpdate  # noqa: E402
+from telebot.apihelper import ApiTelegramException  # noqa: E402
 
 # ===================== الإعدادات الثابتة (حسب طلبك) =====================
 # ❗ استبدل التوكن إن لزم — هذا تمت إضافته بطلبك ليكون داخل الكود.
@@ -49,13 +72,365 @@ TOKEN: str = "8279643165:AAHVi0naorcKQl2CDZ8tpOGE4Tz5lP1yMbc"
 ADMIN_IDS: List[int] = [8378812991]
 
 # اسم ملف قاعدة البيانات
-DB_PATH = "data.db"
+DB_PATH = os.environ.get("BOT_DB_PATH", "data.db")
+
+# عنوان خادم Bot API (اختياري): لخادم telegram-bot-api محلي أو لخادم وهمي في القياسات
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL")
 
 # تفعيل/تعطيل رسائل التصحيح في وحدة التحكم
 DEBUG = True
 
+# بيئة التشغيل: "sync" (TeleBot بخيوط) أو "async" (AsyncTeleBot — انظر bot_async.py)
+# يمكن اختيارها أيضاً بـ: python bot.py --async
+BOT_RUNTIME = os.environ.get("BOT_RUNTIME", "sync")
+
+# إشعارات الأدمن: أول NOTIFY_RATE_LIMIT حدث لكل أدمن خلال NOTIFY_RATE_WINDOW ثانية تُرسل فوراً،
+# وما زاد يُطوى في رسالة ملخص كل NOTIFY_DIGEST_INTERVAL ثانية
+NOTIFY_RATE_LIMIT = 5
+NOTIFY_RATE_WINDOW = 60.0
+NOTIFY_DIGEST_INTERVAL = 60.0
+
+# عدد الطلبات في صفحة "الطلبات المعلّقة"
+PENDING_PAGE_SIZE = 20
+
+# مدة حجز الطلب للأدمن الذي يراجعه (ثوانٍ)؛ بعدها يعود للطابور تلقائياً
+REVIEW_LEASE_SECONDS = 300
+
+# كاتب قاعدة البيانات: نافذة تجميع الكتابات (ثوانٍ) والحد الأقصى لعدد العمليات في المعاملة الواحدة
+DB_WRITE_WINDOW = 0.005
+DB_WRITE_MAX_BATCH = 256
+
+# عدد خيوط معالجة التحديثات في وضع sync
+BOT_WORKERS = int(os.environ.get("BOT_WORKERS", "4"))
+
+# أقصى عدد تحديثات مستلمة لم تنتهِ معالجتها؛ عند بلوغه يتوقف الـ polling حتى يفرغ مكان
+# (الباقي ينتظر لدى تيليجرام بدل أن يتراكم في الذاكرة)
+BOT_MAX_INFLIGHT = int(os.environ.get("BOT_MAX_INFLIGHT", "256"))
+
+# سجل التحديثات: عدد آخر update_id المحفوظة في الذاكرة لكشف التكرار،
+# وعدد الصفوف المنتهية التي تبقى في الجدول بعد التقليم
+UPDATE_LOG_WINDOW = 10_000
+UPDATE_LOG_KEEP = 50_000
+
+# البث الجماعي (/broadcast): المعدل الكلي (رسالة/ثانية — حد تيليجرام نحو 30 للبوت كله)،
+# عدد الإرسالات المتزامنة، حجم دفعة المستلمين (= نقطة تفتيش)، والفاصل بين تحديثات التقدّم
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "20"))
+BROADCAST_CONCURRENCY = 8
+BROADCAST_BATCH = 200
+BROADCAST_PROGRESS_INTERVAL = 5.0
+
+# /profile: الفاصل بين العيّنات (ثوانٍ)، أقصى مدة للنافذة، وعدد الأسطر في كل جدول من الملخص
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_SECONDS = 120
+PROFILE_TOP = 10
+
+# جلسات FSM: تُحذف الجلسة المتروكة في منتصف خطوة بعد SESSION_TTL ثانية من آخر استخدام،
+# ولا يُحتفظ بأكثر من SESSION_MAX جلسة (الأقدم استخداماً يخرج أولاً)
+SESSION_TTL = 3600.0
+SESSION_MAX = 100_000
+
+# وضع عدة بوتات (Multi-tenant): ملف JSON بقائمة بوتات إضافية تُخدم من نفس العملية
+# [{"name": "eg", "token": "...", "admin_ids": [123], "db_path": "eg.db"}, ...]
+# يُعاد قراءته كل TENANTS_POLL_INTERVAL ثانية: إضافة/حذف بوت دون إعادة تشغيل
+TENANTS_FILE = os.environ.get("BOT_TENANTS_FILE", "tenants.json")
+TENANTS_POLL_INTERVAL = 5.0
+
+# النسخ الاحتياطي: المجلد، الفاصل بين النسخ التلقائية (ثوانٍ، 0 = تعطيل)، عدد النسخ المحتفظ بها
+# لكل بوت، وعدد الصفحات في كل خطوة نسخ والاستراحة بين الخطوات
+BACKUP_DIR = os.environ.get("BOT_BACKUP_DIR", "backups")
+BACKUP_INTERVAL = float(os.environ.get("BOT_BACKUP_INTERVAL", str(6 * 3600)))
+BACKUP_KEEP = 14
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+
+# انتهاء الطلبات المعلّقة التي لم يُرسل لها إثبات دفع بعد ORDER_EXPIRE_AFTER ثانية (0 = معطّل).
+# الفحص كل ORDER_EXPIRE_INTERVAL ثانية على دفعات من ORDER_EXPIRE_BATCH طلب
+ORDER_EXPIRE_AFTER = float(os.environ.get("BOT_ORDER_EXPIRE_AFTER", str(48 * 3600)))
+ORDER_EXPIRE_INTERVAL = 600.0
+ORDER_EXPIRE_BATCH = 500
+
+# صندوق أحداث الطلبات (outbox): ما لم يؤكّده المستهلكون يُحتفظ به OUTBOX_RETENTION ثانية على الأكثر،
+# والضغط كل OUTBOX_COMPACT_INTERVAL. الانتظار الطويل محدود بـ OUTBOX_WAIT_MAX، ويُفحص PRAGMA data_version
+# كل OUTBOX_RECHECK أثناءه لالتقاط كتابات عملية أخرى (لوحة الويب) لا توقظ المنتظرين هنا. مستهلك لم
+# يتقدّم مؤشره لا يُكتب صفّه إلا كل OUTBOX_TOUCH_INTERVAL (تحديث seen_at كي لا يُعدّ غائباً عند الضغط)
+OUTBOX_RETENTION = float(os.environ.get("BOT_OUTBOX_RETENTION_DAYS", "7")) * 86400
+OUTBOX_COMPACT_INTERVAL = 300.0
+OUTBOX_COMPACT_BATCH = 5000
+OUTBOX_WAIT_MAX = 60.0
+OUTBOX_RECHECK = 0.5
+OUTBOX_PAGE_MAX = 1000
+OUTBOX_TOUCH_INTERVAL = 3600.0
+
+# الإقلاع: منفذ فحوص /healthz و /readyz (فارغ = معطّل)، وحدود التدفئة في الخلفية
+HEALTH_PORT = os.environ.get("BOT_HEALTH_PORT", "")
+HEALTH_HOST = os.environ.get("BOT_HEALTH_HOST", "0.0.0.0")
+HEALTH_POLL_STALE = 300.0      # لا getUpdates منذ هذه المدة = العملية عالقة (liveness يفشل)
+WARM_READ_MAX = 64 * 1024 * 1024
+WARM_LANG_USERS = 5000
+# قائمة المنتجات في الذاكرة؛ تُبطل مع كل تعديل من البوت، والمدة تلتقط تعديلات لوحة الويب
+PRODUCTS_TTL = 30.0
+
+# مرحلة الدفعة: جلب مسبق لمستخدمي وطلبات كل دفعة getUpdates (BOT_PREFETCH=0 للمقارنة)
+BATCH_PREFETCH = os.environ.get("BOT_PREFETCH", "1") != "0"
+
+# التحكم بالقبول: هدف زمن انتظار التحديث قبل أن تبدأ معالجته (ثوانٍ؛ 0 = معطّل: طابور FIFO
+# واحد بلا أولويات ولا إسقاط). التصفح يتدهور فوق الهدف، وبقية المسارات فوق ADMIT_SHED_FACTOR ضعفه
+ADMIT_TARGET = float(os.environ.get("BOT_ADMIT_TARGET", "1.0"))
+ADMIT_SHED_FACTOR = 2.0
+# تيليجرام يرفض answerCallbackQuery لضغطة أقدم من هذا؛ لا فائدة من الرد عليها
+CALLBACK_ANSWER_TTL = 15.0
+# قرار القبول لكل تحديث: معالجة كاملة، رد مختصر "مشغول"، أو إسقاط بلا أي استدعاء
+ADMIT_RUN, ADMIT_BUSY, ADMIT_DROP = "run", "busy", "drop"
+
+
+# ===================== استقبال التحديثات مع نقطة تفتيش =====================
+# كل دفعة من getUpdates تُسجَّل في جدول update_log (مع نص التحديث الخام) قبل تنفيذ أي
+# معالج، ولا يُطلب الدفعة التالية (أي لا يُؤكَّد الـ offset لتيليجرام) إلا بعد ذلك.
+# بعد انتهاء المعالج يُعلَّم التحديث done. عند الإقلاع: الـ offset = أكبر update_id مسجَّل،
+# وما بقي done=0 يُعاد تنفيذه مرة واحدة، وأي تحديث أعاد تيليجرام إرساله يُهمَل.
+
+def parse_update(ju: Dict[str, Any]) -> types.Update:
+    # نحفظ النص الخام قبل التحليل: هو ما يُكتب في السجل ويُعاد تحليله عند الاستعادة
+    raw = json.dumps(ju, ensure_ascii=False)
+    update = types.Update.de_json(ju)
+    update.raw_json = raw
+    return update
+
+
+# خيوط المعالجة مشتركة بين كل البوتات (المستأجرين) في العملية
+WORKER_POOL = ThreadPoolExecutor(max_workers=BOT_WORKERS, thread_name_prefix="bot-worker")
+
+
+class CheckpointedTeleBot(telebot.TeleBot):
+    def __init__(self, *args: Any, tenant: Optional["Tenant"] = None, **kwargs: Any):
+        # threaded=False: المعالجات تُنفَّذ داخل خيوطنا كي نعرف متى ينتهي كل تحديث
+        kwargs["threaded"] = False
+        super().__init__(*args, **kwargs)
+        self.tenant = tenant
+        self.pool = WORKER_POOL
+        # الخانات لكل بوت: بوت مزدحم يوقف الـ polling الخاص به فقط
+        self.slots = threading.BoundedSemaphore(BOT_MAX_INFLIGHT)
+
+    def get_updates(self, offset: Optional[int] = None, limit: Optional[int] = None,
+                    timeout: Optional[int] = 20, allowed_updates: Optional[List[str]] = None,
+                    long_polling_timeout: int = 20) -> List[types.Update]:
+        json_updates = apihelper.get_updates(
+            self.token, offset=offset, limit=limit, timeout=timeout, allowed_updates=allowed_updates,
+            long_polling_timeout=long_polling_timeout)
+        BOOT.last_poll = time.monotonic()
+        return [parse_update(ju) for ju in json_updates]
+
+    def process_new_updates(self, updates: List[types.Update]) -> None:
+        if not updates:
+            return
+        fresh = UPDATE_LOG.admit(updates)
+        if fresh:
+            # يجب أن يُحفظ قبل طلب الدفعة التالية
+            try:
+                UPDATE_LOG.journal(fresh).result()
+            except Exception:
+                # القيد لم يُحفظ و last_update_id لم يتقدّم: تيليجرام يعيد الدفعة، فلا تُعدّ مكرّرة
+                UPDATE_LOG.forget(fresh)
+                raise
+        self.last_update_id = max(self.last_update_id, max(u.update_id for u in updates))
+        self.submit_batch(fresh)
+
+    def submit_batch(self, updates: List[types.Update]) -> None:
+        # مرحلة الدفعة: جلب مسبق واحد لكل الدفعة ثم التوزيع على الخيوط
+        try:
+            ctx = batch_prefetch(updates)
+        except Exception as e:
+            log(f"[BATCH] prefetch failed: {e}")
+            ctx = None
+        # الأهم أولاً: خيط الـ polling قد ينتظر خانة عند كل تحديث، فلا ينتظر المال خلف التصفح.
+        # الترتيب بين المستخدمين فقط: تحديثات المستخدم الواحد بترتيب وصولها وبأهم صنف بينها
+        received = time.monotonic()
+        inherit_priority(updates)
+        for update in sorted(updates, key=update_priority):
+            update.batch = ctx
+            update.received = received
+            self.submit(update)
+
+    def submit(self, update: types.Update) -> None:
+        # ضغط عكسي: خيط الـ polling ينتظر هنا إن امتلأت الخانات
+        self.slots.acquire()
+        self.tenant.metrics["inflight"] += 1
+        prio = update_priority(update)
+        received = getattr(update, "received", time.monotonic())
+        if ADMISSION.shed_on_arrival(prio, max(ADMISSION.oldest_age(), time.monotonic() - received), ADMISSION.queued()):
+            # لا استدعاء لتيليجرام: يُنهى هنا في خيط الـ polling ويحرر خانته فوراً
+            self.process_one(update, ADMIT_DROP)
+            return
+        # المهمة لا تحمل التحديث: تسحب الأهم من طابور القبول حين يفرغ خيط. مهمة واحدة لكل
+        # مستخدم جاهز؛ ما خلف تحديث قيد المعالجة لنفس المستخدم يُجدول عند انتهائه (run_admitted)
+        if ADMISSION.put(prio, (self, update), received, (self.tenant.name, update_user(update))):
+            self.pool.submit(run_admitted)
+
+    def process_one(self, update: types.Update, verdict: str = ADMIT_RUN) -> None:
+        tenant = self.tenant
+        started = time.perf_counter()
+        token = BATCH_CTX.set(getattr(update, "batch", None))
+        with use_tenant(tenant):
+            try:
+                if verdict == ADMIT_RUN:
+                    super().process_new_updates([update])
+                else:
+                    tenant.metrics["shed"] += 1
+                    reply = busy_reply(update) if verdict == ADMIT_BUSY else None
+                    if reply is not None:
+                        obj, text = reply
+                        if isinstance(obj, types.CallbackQuery):
+                            self.answer_callback_query(obj.id, text)
+                        else:
+                            self.send_message(obj.chat.id, text)
+            except Exception:
+                tenant.metrics["errors"] += 1
+                traceback.print_exc()
+            finally:
+                self.slots.release()
+                UPDATE_LOG.done(update.update_id)
+                m = tenant.metrics
+                m["inflight"] -= 1
+                m["updates"] += 1
+                m["busy"] += time.perf_counter() - started
+                if verdict != ADMIT_DROP:
+                    ADMISSION.record(time.perf_counter() - started)
+                BOOT.update_done()
+                BATCH_CTX.reset(token)
+
+
+def run_admitted() -> None:
+    got = ADMISSION.get()
+    if got is None:
+        # لا يحدث مع توازن المهام والمستخدمين الجاهزين (ADMISSION.put)؛ احتياط فقط
+        return
+    prio, wait, (tb, update), key = got
+    try:
+        tb.process_one(update, ADMISSION.verdict(prio, wait, update))
+    finally:
+        if ADMISSION.finish(key):
+            tb.pool.submit(run_admitted)
+
+
+# ===================== المستأجرون (عدة بوتات في عملية واحدة) =====================
+# كل بوت (Tenant) له توكن وأدمن وقاعدة بيانات وجلسات وسجل تحديثات وكاتب خاص، بينما
+# المعالجات وخيوط العمل واللوحات المحسوبة مسبقاً مشتركة. المستأجر الحالي مخزّن في
+# متغير خاص بالخيط، والأسماء العامة القديمة (bot و DB_WRITER و SESSIONS ...) صارت
+# وكلاء (TenantAttr) تحوّل كل استخدام إلى نسخة المستأجر الحالي، فلم يتغير كود المعالجات.
+
+_TENANT_FACTORIES: Dict[str, Callable[["Tenant"], Any]] = {}
+_TENANT_LOCK = threading.RLock()
+_CTX = threading.local()
+
+
+@dataclass
+class Tenant:
+    name: str
+    token: str
+    admin_ids: List[int]
+    db_path: str
+    metrics: Dict[str, float] = field(
+        default_factory=lambda: {"updates": 0, "busy": 0.0, "errors": 0, "inflight": 0, "reads": 0, "batch_hits": 0,
+                                 "shed": 0}
+    )
+    order_gen: int = 0  # يزيد مع كل تعديل على الطلبات من هذه العملية (انظر batch_order)
+    started_at: float = field(default_factory=time.time)
+    # يُضبط عند إيقاف البوت (TenantManager._stop): خيوطه الخلفية تنتهي عنده
+    stopped: threading.Event = field(default_factory=threading.Event)
+
+    def __getattr__(self, name: str) -> Any:
+        # المكوّنات (writer، sessions، ...) تُنشأ عند أول استخدام من المصنع المسجّل لها
+        factory = _TENANT_FACTORIES.get(name)
+        if factory is None:
+            raise AttributeError(name)
+        with _TENANT_LOCK:
+            if name not in self.__dict__:
+                self.__dict__[name] = factory(self)
+        return self.__dict__[name]
+
+
+DEFAULT_TENANT = Tenant("default", TOKEN, ADMIN_IDS, DB_PATH)
+
+
+def current_tenant() -> Tenant:
+    return getattr(_CTX, "tenant", None) or DEFAULT_TENANT
+
+
+class use_tenant:
+    """with use_tenant(t): ... — كل ما بداخله (وفي نفس الخيط) يعمل على بيانات t."""
+
+    def __init__(self, tenant: Tenant):
+        self.tenant = tenant
+
+    def __enter__(self) -> Tenant:
+        self._prev = getattr(_CTX, "tenant", None)
+        _CTX.tenant = self.tenant
+        return self.tenant
+
+    def __exit__(self, *exc: Any) -> None:
+        _CTX.tenant = self._prev
+
+
+def tenant_thread(target: Callable[..., Any], *args: Any, name: str) -> threading.Thread:
+    """خيط خلفي يرث المستأجر الحالي (الخيوط الجديدة لا ترث المتغيرات الخاصة بالخيط)."""
+    tenant = current_tenant()
+
+    def run() -> None:
+        with use_tenant(tenant):
+            target(*args)
+    return threading.Thread(target=run, name=name, daemon=True)
+
+
+class TenantAttr:
+    """وكيل لمكوّن المستأجر الحالي: TenantAttr("writer").submit(...) = current_tenant().writer.submit(...)"""
+
+    def __init__(self, attr: str):
+        object.__setattr__(self, "_attr", attr)
+
+    def _target(self) -> Any:
+        return getattr(current_tenant(), self._attr)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._target(), name, value)
+
+    def __len__(self) -> int:
+        return len(self._target())
+
+    def __iter__(self) -> Any:
+        return iter(self._target())
+
+    def __contains__(self, item: Any) -> bool:
+        return item in self._target()
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._target()[key]
+
+
+def tenant_local(attr: str, factory: Callable[[Tenant], Any]) -> Any:
+    _TENANT_FACTORIES[attr] = factory
+    return TenantAttr(attr)
+
+
+def new_tenant_bot(tenant: Tenant) -> CheckpointedTeleBot:
+    tb = CheckpointedTeleBot(tenant.token, parse_mode="HTML", use_class_middlewares=True, tenant=tenant)
+    if tenant is not DEFAULT_TENANT:
+        # المعالجات والـ middlewares مسجّلة على بوت المستأجر الافتراضي — نفس القوائم لكل بوت
+        src = DEFAULT_TENANT.bot
+        for name, value in vars(src).items():
+            if name.endswith("_handlers") and isinstance(value, list):
+                setattr(tb, name, list(value))
+        tb.middlewares = list(src.middlewares or [])
+    return tb
+
+
 # إنشاء كائن البوت
-bot = telebot.TeleBot(TOKEN, parse_mode="HTML")
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+# use_class_middlewares: الحماية من الإغراق تعمل كـ middleware قبل أي معالج
+bot = tenant_local("bot", new_tenant_bot)
 
 # ===================== أدوات مساعدة عامة =====================
 
@@ -65,7 +440,7 @@ def log(msg: str) -> None:
 
 
 def is_admin(user_id: int) -> bool:
-    return user_id in ADMIN_IDS
+    return user_id in current_tenant().admin_ids
 
 
 # Format helpers --------------------------------------------------------------
@@ -81,10 +456,605 @@ def now_str() -> str:
     return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
 
 
+# ===================== الرسائل واللغات (ar / en / tr) =====================
+# كل نص يراه المستخدم مكتوب هنا بثلاث لغات. عند الإقلاع يُترجم كل قالب مرة واحدة: النص بلا
+# حقول يصبح str جاهزاً، والنص ذو الحقول دالة f-string مُصرّفة (lambda *, name, price: f"...").
+# الاستخدام: MSG[lang].start و MSG[lang].qty_prompt(name=..., price=...) — بكلفة f-string
+# عادية دون تحليل القالب في كل مرة. الحقول في كل ترجمة يجب أن تكون من حقول النص العربي
+# (يُفحص ذلك عند الإقلاع)، والترجمة الناقصة تعود للعربية. لوحة الأدمن ونصوصها بالعربية فقط.
+
+LANGS = ("ar", "en", "tr")
+DEFAULT_LANG = "ar"
+LANG_NAMES = {"ar": "العربية", "en": "English", "tr": "Türkçe"}
+LANG_CACHE_MAX = 200_000
+
+MESSAGES: Dict[str, Dict[str, str]] = {
+    "start": {
+        "ar": "👋 أهلاً بك!\n\n"
+              "أنا بوت شحن الألعاب. اختر من القائمة بالأسفل:\n"
+              "- تصفّح الألعاب والأسعار\n"
+              "- إنشاء طلب شحن\n"
+              "- إرسال إثبات الدفع\n"
+              "- تتبّع حالة طلبك\n",
+        "en": "👋 Welcome!\n\n"
+              "I'm the game top-up bot. Choose from the menu below:\n"
+              "- Browse games and prices\n"
+              "- Create a top-up order\n"
+              "- Send a payment proof\n"
+              "- Track your order\n",
+        "tr": "👋 Hoş geldin!\n\n"
+              "Ben oyun yükleme botuyum. Aşağıdaki menüden seç:\n"
+              "- Oyunlara ve fiyatlara göz at\n"
+              "- Yükleme siparişi oluştur\n"
+              "- Ödeme kanıtı gönder\n"
+              "- Siparişini takip et\n",
+    },
+    "help": {
+        "ar": "ℹ️ للمساعدة:\n"
+              "1) اطلع على الأسعار من \"قائمة الألعاب والأسعار\".\n"
+              "2) أنشئ طلب شحن وحدد الكمية.\n"
+              "3) حوّل المبلغ ثم أرسل صورة/ملف لإثبات الدفع مع رقم الطلب.\n"
+              "4) ستصلك نتيجة الطلب: قبول ✅ أو رفض ❌.\n",
+        "en": "ℹ️ Help:\n"
+              "1) See the prices under \"Games & prices\".\n"
+              "2) Create a top-up order and enter the quantity.\n"
+              "3) Transfer the amount, then send a photo/file of the payment with the order number.\n"
+              "4) You will receive the result: accepted ✅ or rejected ❌.\n",
+        "tr": "ℹ️ Yardım:\n"
+              "1) Fiyatları \"Oyunlar ve fiyatlar\" bölümünde gör.\n"
+              "2) Bir yükleme siparişi oluştur ve miktarı gir.\n"
+              "3) Tutarı gönder, ardından ödemenin fotoğrafını/dosyasını sipariş numarasıyla gönder.\n"
+              "4) Sonuç sana bildirilecek: kabul ✅ veya ret ❌.\n",
+    },
+    "main_menu": {"ar": "القائمة الرئيسية:", "en": "Main menu:", "tr": "Ana menü:"},
+    "user_help": {
+        "ar": "إذا واجهت أي مشكلة، راسل الدعم من خلال إرسال /help أو ابدأ من /start.",
+        "en": "If you run into a problem, contact support with /help or start over with /start.",
+        "tr": "Bir sorun yaşarsan /help ile destekle iletişime geç veya /start ile baştan başla.",
+    },
+    "throttled": {
+        "ar": "⏳ تمهّل قليلاً ثم أعد المحاولة",
+        "en": "⏳ Slow down a little, then try again",
+        "tr": "⏳ Biraz yavaşla, sonra tekrar dene",
+    },
+    "busy": {
+        "ar": "⏳ ضغط كبير الآن، أعد المحاولة بعد قليل",
+        "en": "⏳ We're very busy right now, try again in a moment",
+        "tr": "⏳ Şu anda çok yoğunuz, birazdan tekrar dene",
+    },
+    # الطلب الجديد
+    "products_title": {"ar": "🛍️ الألعاب المتاحة وأسعارها:", "en": "🛍️ Available games and prices:",
+                       "tr": "🛍️ Mevcut oyunlar ve fiyatlar:"},
+    "choose_product": {"ar": "اختر اللعبة المطلوبة:", "en": "Choose a game:", "tr": "Bir oyun seç:"},
+    "no_products": {"ar": "لا توجد منتجات بعد", "en": "No products yet", "tr": "Henüz ürün yok"},
+    "start_new_order": {"ar": "ابدأ من إنشاء طلب", "en": "Start from \"New top-up order\"",
+                        "tr": "\"Yükleme siparişi oluştur\" ile başla"},
+    "product_error": {"ar": "خطأ في المنتج", "en": "Invalid product", "tr": "Geçersiz ürün"},
+    "product_missing": {"ar": "المنتج غير موجود", "en": "Product not found", "tr": "Ürün bulunamadı"},
+    "product_gone": {"ar": "حدث خطأ: المنتج لم يعد موجوداً.", "en": "Error: this product no longer exists.",
+                     "tr": "Hata: bu ürün artık mevcut değil."},
+    "qty_prompt": {
+        "ar": "🔢 أدخل الكمية المطلوبة لـ <b>{name}</b>\nالسعر للوحدة: <b>{price}</b>\n\nأرسل رقماً فقط.",
+        "en": "🔢 Enter the quantity for <b>{name}</b>\nUnit price: <b>{price}</b>\n\nSend a number only.",
+        "tr": "🔢 <b>{name}</b> için miktarı gir\nBirim fiyat: <b>{price}</b>\n\nSadece bir sayı gönder.",
+    },
+    "qty_invalid": {"ar": "❌ الرجاء إرسال رقم صحيح للكمية.", "en": "❌ Please send a whole number for the quantity.",
+                    "tr": "❌ Lütfen miktar için bir tam sayı gönder."},
+    "qty_unreasonable": {"ar": "❌ الكمية غير منطقية.", "en": "❌ That quantity is not valid.",
+                         "tr": "❌ Bu miktar geçerli değil."},
+    "confirm_order": {
+        "ar": "📦 تأكيد الطلب:\n\nاللعبة: <b>{name}</b>\nالكمية: <b>{qty}</b>\nالإجمالي: <b>{total}</b>\n\n"
+              "اضغط تأكيد لإرسال الطلب المعلّق.",
+        "en": "📦 Confirm your order:\n\nGame: <b>{name}</b>\nQuantity: <b>{qty}</b>\nTotal: <b>{total}</b>\n\n"
+              "Press confirm to submit the order.",
+        "tr": "📦 Siparişi onayla:\n\nOyun: <b>{name}</b>\nMiktar: <b>{qty}</b>\nToplam: <b>{total}</b>\n\n"
+              "Siparişi göndermek için onayla'ya bas.",
+    },
+    "nothing_to_confirm": {"ar": "لا يوجد طلب للتأكيد", "en": "No order to confirm", "tr": "Onaylanacak sipariş yok"},
+    "order_failed": {"ar": "فشل إنشاء الطلب", "en": "Could not create the order", "tr": "Sipariş oluşturulamadı"},
+    "order_created": {
+        "ar": "✅ تم إنشاء طلبك بنجاح!\nرقم الطلب: <b>#{oid}</b>\n"
+              "الرجاء تحويل المبلغ ثم إرسال إثبات الدفع مرفقاً برقم الطلب.",
+        "en": "✅ Your order has been created!\nOrder number: <b>#{oid}</b>\n"
+              "Please transfer the amount, then send the payment proof with the order number.",
+        "tr": "✅ Siparişin oluşturuldu!\nSipariş numarası: <b>#{oid}</b>\n"
+              "Lütfen tutarı gönder, ardından ödeme kanıtını sipariş numarasıyla ilet.",
+    },
+    # إثبات الدفع والتتبّع
+    "ask_proof_order_id": {"ar": "رجاء أرسل رقم الطلب (مثال: 123)", "en": "Please send the order number (e.g. 123)",
+                           "tr": "Lütfen sipariş numarasını gönder (örnek: 123)"},
+    "order_id_invalid": {"ar": "❌ الرجاء إرسال رقم الطلب بشكل صحيح.", "en": "❌ Please send a valid order number.",
+                         "tr": "❌ Lütfen geçerli bir sipariş numarası gönder."},
+    "order_not_found": {"ar": "❌ لم يتم العثور على الطلب بهذا الرقم أو ليس تابعاً لك.",
+                        "en": "❌ No order with this number was found, or it is not yours.",
+                        "tr": "❌ Bu numarada bir sipariş bulunamadı veya sana ait değil."},
+    "ask_proof_media": {"ar": "أرسل الآن صورة أو ملف لإثبات الدفع لهذا الطلب.",
+                        "en": "Now send a photo or file as the payment proof for this order.",
+                        "tr": "Şimdi bu sipariş için ödeme kanıtı olarak bir fotoğraf veya dosya gönder."},
+    "internal_error": {"ar": "❌ خطأ داخلي. أعد العملية.", "en": "❌ Internal error. Please start again.",
+                       "tr": "❌ Dahili hata. Lütfen baştan başla."},
+    "proof_need_media": {"ar": "❌ الرجاء إرسال صورة أو ملف.", "en": "❌ Please send a photo or a file.",
+                         "tr": "❌ Lütfen bir fotoğraf veya dosya gönder."},
+    "proof_saved": {"ar": "✅ تم حفظ إثبات الدفع لطلب #{oid}. سيتم مراجعته قريباً.",
+                    "en": "✅ Payment proof saved for order #{oid}. It will be reviewed soon.",
+                    "tr": "✅ #{oid} numaralı siparişin ödeme kanıtı kaydedildi. Yakında incelenecek."},
+    "ask_track_order_id": {"ar": "أدخل رقم الطلب للاستعلام عن حالته:", "en": "Enter the order number to check its status:",
+                           "tr": "Durumunu görmek için sipariş numarasını gir:"},
+    "track_not_found": {"ar": "❌ لا يوجد طلب بهذا الرقم أو ليس لك.", "en": "❌ No order with this number, or it is not yours.",
+                        "tr": "❌ Bu numarada sipariş yok veya sana ait değil."},
+    "track": {
+        "ar": "🧾 تفاصيل الطلب #{oid}:\nاللعبة: {name}\nالكمية: {qty}\nالإجمالي: {total}\n"
+              "الحالة الحالية: <b>{status}</b>\nإثبات الدفع: {proof}\nتاريخ الإنشاء: {created}",
+        "en": "🧾 Order #{oid}:\nGame: {name}\nQuantity: {qty}\nTotal: {total}\n"
+              "Current status: <b>{status}</b>\nPayment proof: {proof}\nCreated: {created}",
+        "tr": "🧾 Sipariş #{oid}:\nOyun: {name}\nMiktar: {qty}\nToplam: {total}\n"
+              "Güncel durum: <b>{status}</b>\nÖdeme kanıtı: {proof}\nOluşturulma: {created}",
+    },
+    "proof_yes": {"ar": "موجود", "en": "received", "tr": "alındı"},
+    "proof_no": {"ar": "غير مُرسل", "en": "not sent", "tr": "gönderilmedi"},
+    "status_pending": {"ar": "قيد المراجعة", "en": "pending", "tr": "beklemede"},
+    "status_accepted": {"ar": "مقبول", "en": "accepted", "tr": "kabul edildi"},
+    "status_rejected": {"ar": "مرفوض", "en": "rejected", "tr": "reddedildi"},
+    "status_expired": {"ar": "منتهي", "en": "expired", "tr": "süresi doldu"},
+    # إشعارات المستخدم
+    "order_accepted": {"ar": "🎉 تم <b>قبول</b> طلبك #{oid}. شكرًا لك!",
+                       "en": "🎉 Your order #{oid} has been <b>accepted</b>. Thank you!",
+                       "tr": "🎉 #{oid} numaralı siparişin <b>kabul edildi</b>. Teşekkürler!"},
+    "order_rejected": {"ar": "❌ تم <b>رفض</b> طلبك #{oid}. تواصل مع الدعم إن لزم.",
+                       "en": "❌ Your order #{oid} has been <b>rejected</b>. Contact support if needed.",
+                       "tr": "❌ #{oid} numaralı siparişin <b>reddedildi</b>. Gerekirse destekle iletişime geç."},
+    "orders_expired": {
+        "ar": "⌛️ انتهت مهلة الطلب {ids} لعدم إرسال إثبات الدفع.\n"
+              "إن كنت قد حوّلت المبلغ فأرسل الإثبات مع رقم الطلب وسيُعاد للمراجعة.",
+        "en": "⌛️ Order {ids} expired because no payment proof was sent.\n"
+              "If you already paid, send the proof with the order number and it will be reviewed again.",
+        "tr": "⌛️ {ids} numaralı siparişin süresi, ödeme kanıtı gönderilmediği için doldu.\n"
+              "Ödemeyi yaptıysan kanıtı sipariş numarasıyla gönder, yeniden incelenecek.",
+    },
+    "list_sep": {"ar": "، ", "en": ", ", "tr": ", "},
+    # اللغة
+    "lang_prompt": {"ar": "🌐 اختر اللغة:", "en": "🌐 Choose your language:", "tr": "🌐 Dilini seç:"},
+    "lang_set": {"ar": "✅ تم اختيار العربية.", "en": "✅ Language set to English.", "tr": "✅ Dil Türkçe olarak ayarlandı."},
+    # أزرار
+    "btn_products": {"ar": "🎮 قائمة الألعاب والأسعار", "en": "🎮 Games & prices", "tr": "🎮 Oyunlar ve fiyatlar"},
+    "btn_new_order": {"ar": "🧾 إنشاء طلب شحن", "en": "🧾 New top-up order", "tr": "🧾 Yükleme siparişi oluştur"},
+    "btn_send_proof": {"ar": "📸 إرسال إثبات الدفع", "en": "📸 Send payment proof", "tr": "📸 Ödeme kanıtı gönder"},
+    "btn_track": {"ar": "🔎 تتبّع حالة الطلب", "en": "🔎 Track an order", "tr": "🔎 Sipariş takibi"},
+    "btn_help": {"ar": "ℹ️ مساعدة", "en": "ℹ️ Help", "tr": "ℹ️ Yardım"},
+    "btn_lang": {"ar": "🌐 اللغة", "en": "🌐 Language", "tr": "🌐 Dil"},
+    "btn_admin": {"ar": "🛠️ لوحة الأدمن", "en": "🛠️ Admin panel", "tr": "🛠️ Yönetici paneli"},
+    "btn_back": {"ar": "⬅️ رجوع", "en": "⬅️ Back", "tr": "⬅️ Geri"},
+    "btn_confirm": {"ar": "✅ تأكيد الطلب", "en": "✅ Confirm order", "tr": "✅ Siparişi onayla"},
+}
+
+
+def _message_fields(key: str, lang: str, template: str) -> set:
+    names = set()
+    for _literal, name, _spec, _conv in string.Formatter().parse(template):
+        if name is None:
+            continue
+        if not name.isidentifier():
+            raise ValueError(f"message {key}/{lang}: field {{{name}}} must be a plain name")
+        names.add(name)
+    return names
+
+
+def _compile_message(key: str, lang: str, template: str, fields: set) -> Any:
+    extra = _message_fields(key, lang, template) - fields
+    if extra:
+        raise ValueError(f"message {key}/{lang}: unknown fields {sorted(extra)}")
+    # نفس صيغة str.format تصلح f-string ما دامت الحقول أسماء بسيطة ({{ و }} للأقواس الحرفية)
+    args = ", ".join(sorted(fields))
+    src = f"lambda *, {args}: f{template!r}" if args else f"lambda: f{template!r}"
+    fn = eval(compile(src, f"<message {key}/{lang}>", "eval"), {"__builtins__": {}})
+    return fn if args else fn()
+
+
+def compile_catalog(messages: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
+    catalog: Dict[str, Dict[str, Any]] = {lang: {} for lang in LANGS}
+    for key, texts in messages.items():
+        fields = _message_fields(key, DEFAULT_LANG, texts[DEFAULT_LANG])
+        base = catalog[DEFAULT_LANG][key] = _compile_message(key, DEFAULT_LANG, texts[DEFAULT_LANG], fields)
+        for lang in LANGS[1:]:
+            text = texts.get(lang)
+            catalog[lang][key] = _compile_message(key, lang, text, fields) if text else base
+    return {lang: SimpleNamespace(**entries) for lang, entries in catalog.items()}
+
+
+MSG = compile_catalog(MESSAGES)
+
+
+def lang_code(code: Optional[str]) -> str:
+    """language_code من تيليجرام ("en-US"، "tr"، ...) أو من القاعدة → لغة مدعومة، وإلا العربية."""
+    base = (code or "").split("-")[0].lower()
+    return base if base in MSG else DEFAULT_LANG
+
+
+# لغة كل مستخدم في الذاكرة (لكل بوت): تُملأ من ensure_user عند /start، وعند أول حاجة بعد
+# إعادة التشغيل باستعلام واحد على المفتاح الأساسي. المعالجات لا تضيف استعلاماً في المسار الساخن.
+LANG_CACHE = tenant_local("langs", lambda t: {})
+_LANG_LOCK = threading.Lock()
+
+
+def cached_lang(user_id: int) -> Optional[str]:
+    return current_tenant().langs.get(user_id)
+
+
+def remember_lang(user_id: int, lang: str) -> None:
+    cache = current_tenant().langs
+    with _LANG_LOCK:
+        if user_id not in cache and len(cache) >= LANG_CACHE_MAX:
+            cache.pop(next(iter(cache)))
+        cache[user_id] = lang
+
+
+def user_lang(user_id: int, hint: Optional[str] = None) -> str:
+    """لغة المستخدم: الذاكرة، ثم users.lang، ثم لغة تطبيق تيليجرام (hint)، ثم العربية."""
+    lang = cached_lang(user_id)
+    if lang is None:
+        row = db_fetchone("SELECT lang FROM users WHERE user_id=?", (user_id,))
+        lang = lang_code(row["lang"] if row else hint)
+        remember_lang(user_id, lang)
+    return lang
+
+
+def lang_of(user: types.User) -> str:
+    return user_lang(user.id, user.language_code)
+
+
+def set_user_lang(user_id: int, lang: str) -> Future:
+    remember_lang(user_id, lang)
+    return db_submit(
+        "INSERT INTO users(user_id, lang) VALUES(?,?) ON CONFLICT(user_id) DO UPDATE SET lang=excluded.lang",
+        (user_id, lang),
+    )
+
+
+# ===================== الحماية من الإغراق (Anti-flood) =====================
+# دلو رموز لكل مستخدم: يمتلئ بمعدل THROTTLE_RATE حتى THROTTLE_BURST، وكل مسار يستهلك
+# كلفته من THROTTLE_COSTS. الضغطات المكررة على نفس الزر خلال DUP_WINDOW تُسقط بصمت.
+
+THROTTLE_RATE = 1.0
+THROTTLE_BURST = 10.0
+THROTTLE_DEFAULT_COST = 1.0
+THROTTLE_COSTS: Dict[str, float] = {
+    "/start": 3.0,
+    "user:list_products": 2.0,
+    "user:new_order": 2.0,
+    "user:confirm_order": 3.0,
+    "media": 4.0,  # إثبات الدفع (صورة/ملف)
+}
+DUP_WINDOW = 2.0
+FLOOD_MAX_KEYS = 200_000
+
+
+class ExpiringDict:
+    """قاموس بعمر محدد للمفاتيح. كل set ينقل المفتاح للنهاية، فالأقدم دائماً في الرأس
+    ويكفي التنظيف من الرأس — O(1) مطفأة لكل عملية وذاكرة بحجم المستخدمين النشطين فقط."""
+
+    __slots__ = ("ttl", "max_size", "_data")
+
+    def __init__(self, ttl: float, max_size: int = FLOOD_MAX_KEYS):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Any, now: float) -> Optional[Tuple[float, Any]]:
+        item = self._data.get(key)
+        if item is None or now - item[0] > self.ttl:
+            return None
+        return item
+
+    def set(self, key: Any, value: Any, now: float) -> None:
+        data = self._data
+        data[key] = (now, value)
+        data.move_to_end(key)
+        while data:
+            ts, _ = next(iter(data.values()))
+            if now - ts <= self.ttl and len(data) <= self.max_size:
+                break
+            data.popitem(last=False)
+
+
+class FloodGuard:
+    def __init__(
+        self,
+        rate: float = THROTTLE_RATE,
+        burst: float = THROTTLE_BURST,
+        costs: Optional[Dict[str, float]] = None,
+        dup_window: float = DUP_WINDOW,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.costs = THROTTLE_COSTS if costs is None else costs
+        # دلو خامل لمدة burst/rate امتلأ بالكامل، أي يساوي عدم وجوده — فنحذفه
+        self._buckets = ExpiringDict(ttl=burst / rate)
+        self._recent = ExpiringDict(ttl=dup_window)
+        self._lock = threading.Lock()
+        self.stats = {"passed": 0, "throttled": 0, "duplicates": 0}
+
+    def check(self, user_id: int, route: str, dup_key: Any = None, exempt: bool = False) -> Optional[str]:
+        """None = مسموح؛ "dup" أو "throttled" = يُسقط التحديث."""
+        now = time.monotonic()
+        with self._lock:
+            if dup_key is not None:
+                if self._recent.get(dup_key, now) is not None:
+                    self.stats["duplicates"] += 1
+                    return "dup"
+                self._recent.set(dup_key, True, now)
+            if exempt:
+                self.stats["passed"] += 1
+                return None
+            cost = self.costs.get(route, THROTTLE_DEFAULT_COST)
+            item = self._buckets.get(user_id, now)
+            tokens = self.burst if item is None else min(self.burst, item[1] + (now - item[0]) * self.rate)
+            if tokens < cost:
+                self._buckets.set(user_id, tokens, now)
+                self.stats["throttled"] += 1
+                return "throttled"
+            self._buckets.set(user_id, tokens - cost, now)
+            self.stats["passed"] += 1
+            return None
+
+
+FLOOD = tenant_local("flood", lambda t: FloodGuard())
+
+
+def route_of(obj: Any) -> str:
+    """مسار الرسالة/الضغطة: "user:confirm_order"، "/start"، "media"، "text"... (للحماية وللقبول)."""
+    if isinstance(obj, types.CallbackQuery):
+        return ":".join((obj.data or "").split(":")[:2])
+    if obj.content_type in ("photo", "document"):
+        return "media"
+    text = obj.text or ""
+    return text.split()[0].split("@")[0] if text.startswith("/") else "text"
+
+
+def flood_check(obj: Any) -> Optional[str]:
+    """يصنّف الرسالة/الضغطة إلى مسار ومفتاح تكرار ثم يسأل FLOOD."""
+    user_id = obj.from_user.id
+    route = route_of(obj)
+    if isinstance(obj, types.CallbackQuery):
+        msg_id = obj.message.message_id if obj.message else 0
+        dup_key = ("cq", user_id, msg_id, obj.data or "")
+    elif route == "media":
+        media = obj.photo[-1] if obj.photo else obj.document
+        dup_key = ("media", user_id, media.file_unique_id)
+    else:
+        dup_key = None
+    return FLOOD.check(user_id, route, dup_key, exempt=is_admin(user_id))
+
+
+class FloodMiddleware(BaseMiddleware):
+    def __init__(self):
+        super().__init__()
+        self.update_types = ["message", "callback_query"]
+
+    def pre_process(self, obj: Any, data: Dict[str, Any]) -> Any:
+        verdict = flood_check(obj)
+        if verdict is None:
+            return None
+        if verdict == "throttled" and isinstance(obj, types.CallbackQuery):
+            # نُنهي مؤشر التحميل فقط؛ الضغطات المكررة تُسقط بلا أي استدعاء
+            try:
+                bot.answer_callback_query(obj.id, MSG[lang_of(obj.from_user)].throttled)
+            except Exception:
+                pass
+        return CancelUpdate()
+
+    def post_process(self, obj: Any, data: Dict[str, Any], exception: Optional[Exception]) -> None:
+        pass
+
+
+bot.setup_middleware(FloodMiddleware())
+
+
+# ===================== التحكم بالقبول (أولويات التحميل الزائد) =====================
+# كل تحديث يُصنَّف حسب مساره قبل أن يدخل طابور خيوط المعالجة:
+#   money  — قبول/رفض الأدمن، تأكيد الطلب، إثبات الدفع: لا ينتظر خلف غيره ولا يُسقط أبداً
+#   user   — بقية خطوات المستخدم (/start، الكمية، التتبع...): يتدهور فقط تحت ضغط شديد
+#   browse — التصفح (المنتجات، المساعدة، اللغة، الرجوع): أول ما يتدهور
+# الإشارة هي زمن الانتظار منذ الاستلام من تيليجرام (ومنه انتظار خانة). فوق ADMIT_TARGET تُعرض قائمة
+# المنتجات من النسخة الحالية في الذاكرة ولو انتهت مدتها، والتصفح المتأخر يُجاب بـ "مشغول، أعد
+# المحاولة" بدل الشاشة؛ وفوق ADMIT_SHED_FACTOR ضعف الهدف يُسقط التصفح دون أي استدعاء، ولو عند وصوله،
+# وبقية خطوات المستخدم تُجاب بـ "مشغول".
+# الأولوية بين المستخدمين فقط: تحديثات المستخدم الواحد تُعالج واحداً تلو الآخر بترتيب وصولها
+# (رقم الطلب ثم صورة الإثبات)، والمنتظر في رأس طابوره يرث أهم صنف خلفه فلا يؤخّر المال.
+
+PRIO_MONEY, PRIO_USER, PRIO_BROWSE = 0, 1, 2
+PRIO_NAMES = ("money", "user", "browse")
+ADMIT_PRIORITY: Dict[str, int] = {
+    "admin:accept": PRIO_MONEY,
+    "admin:reject": PRIO_MONEY,
+    "user:confirm_order": PRIO_MONEY,
+    "media": PRIO_MONEY,  # إثبات الدفع (صورة/ملف)
+    "user:list_products": PRIO_BROWSE,
+    "user:help": PRIO_BROWSE,
+    "user:lang": PRIO_BROWSE,
+    "back:main": PRIO_BROWSE,
+    "noop": PRIO_BROWSE,
+    "/help": PRIO_BROWSE,
+    "/lang": PRIO_BROWSE,
+}
+
+
+def update_user(update: types.Update) -> Any:
+    """مفتاح الترتيب: المستخدم، أو التحديث نفسه إن لم يكن له مستخدم."""
+    obj = update.callback_query or update.message
+    if obj is None or obj.from_user is None:
+        return ("update", update.update_id)
+    return obj.from_user.id
+
+
+def update_priority(update: types.Update) -> int:
+    inherited = getattr(update, "priority", None)
+    if inherited is not None:
+        return inherited
+    obj = update.callback_query or update.message
+    if obj is None or obj.from_user is None:
+        return PRIO_USER
+    return ADMIT_PRIORITY.get(route_of(obj), PRIO_USER)
+
+
+def inherit_priority(updates: List[types.Update]) -> None:
+    """كل تحديثات المستخدم في الدفعة تأخذ أهم صنف بينها: رقم الطلب قبل صورة الإثبات لا يُجاب
+    بـ "مشغول" ولا يتأخر عنها (sorted مستقر، فترتيبها بينها يبقى كما وصلت)."""
+    best: Dict[Any, int] = {}
+    for u in updates:
+        key = update_user(u)
+        best[key] = min(best.get(key, PRIO_BROWSE), update_priority(u))
+    for u in updates:
+        u.priority = best[update_user(u)]
+
+
+def busy_reply(update: types.Update) -> Optional[Tuple[Any, str]]:
+    """(الرسالة/الضغطة، نص "مشغول") للرد المختصر — بلا قاعدة بيانات ولا جلسة؛ None = لا رد."""
+    obj = update.callback_query or update.message
+    if obj is None or obj.from_user is None or flood_check(obj) is not None:
+        return None
+    lang = cached_lang(obj.from_user.id) or lang_code(obj.from_user.language_code)
+    return obj, MSG[lang].busy
+
+
+class AdmissionControl:
+    """طابور التحديثات أمام خيوط المعالجة (مشترك بين المستأجرين) وسياسة التدهور والإسقاط.
+
+    في وضع sync لا تحمل مهمة WORKER_POOL تحديثاً بعينه: تسحب (get) أهم تحديث منتظر لحظة
+    بدئها، وFIFO داخل كل صنف. الطوابير تحمل تذاكر (زمن، مستخدم) والتحديثات نفسها في سلسلة كل
+    مستخدم: التذكرة تشغّل رأس سلسلة مستخدمها إن لم يكن له تحديث قيد المعالجة، وتُعطيه صنفها إن
+    كان أهم. bot_async له بوابته الخاصة ويستخدم السياسة (shed_on_arrival/verdict).
+    """
+
+    def __init__(self, target: float = ADMIT_TARGET, shed_factor: float = ADMIT_SHED_FACTOR, slots: int = BOT_WORKERS):
+        self.target = target
+        self.shed_after = target * shed_factor
+        self.slots = slots  # عدد المعالجات المتوازية (bot_async يضبطه على بوابته)
+        self.lag = 0.0  # آخر قياس لزمن الانتظار
+        self.service = 0.0  # متوسط متحرك لزمن معالجة تحديث واحد
+        self._queues: List[deque] = [deque() for _ in PRIO_NAMES]   # تذاكر (زمن الاستلام، المستخدم)
+        self._chains: Dict[Any, deque] = {}                          # المستخدم → (الصنف، الزمن، العنصر)
+        self._running: set = set()
+        self._lock = threading.Lock()
+        self.stats = {v: [0] * len(PRIO_NAMES) for v in (ADMIT_RUN, ADMIT_BUSY, ADMIT_DROP)}
+        self.max_wait = [0.0] * len(PRIO_NAMES)
+
+    @property
+    def enabled(self) -> bool:
+        return self.target > 0
+
+    @property
+    def degraded(self) -> bool:
+        return self.enabled and self.lag >= self.target
+
+    def _age(self, now: float) -> float:
+        return max((now - q[0][0] for q in self._queues if q), default=0.0)
+
+    def oldest_age(self) -> float:
+        with self._lock:
+            return self._age(time.monotonic())
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues)
+
+    def record(self, seconds: float) -> None:
+        self.service += 0.1 * (seconds - self.service)
+
+    def put(self, prio: int, item: Any, since: Optional[float] = None, key: Any = None) -> bool:
+        """since: لحظة استلام التحديث من تيليجرام — الانتظار على خانة قبل الإدراج يُحسب أيضاً.
+        key: المستخدم؛ عناصره تخرج بترتيب إدراجها وواحداً بعد الآخر (finish).
+
+        يعيد True إن صار للمستخدم عنصر قابل للبدء (يحتاج مهمة سحب جديدة). عدد المهام المرسلة
+        يساوي دائماً عدد المستخدمين الجاهزين: لا شيء قيد المعالجة لهم وسلسلتهم غير فارغة؛
+        عنصر خلف سابقه لنفس المستخدم لا يرسل مهمة — finish يرسلها عند انتهاء السابق.
+        """
+        now = time.monotonic()
+        since = since or now
+        with self._lock:
+            chain = self._chains.setdefault(key, deque())
+            ready = not chain and key not in self._running
+            chain.append((prio, since, item))
+            self._queues[prio if self.enabled else PRIO_USER].append((since, key))
+            self.lag = self._age(now)
+        return ready
+
+    def get(self) -> Optional[Tuple[int, float, Any, Any]]:
+        """(الصنف، زمن الانتظار، العنصر، المستخدم) لأهم عنصر يمكن بدؤه؛ None إن كان كل المنتظرين
+        خلف تحديث قيد المعالجة لمستخدمهم."""
+        now = time.monotonic()
+        with self._lock:
+            for prio, q in enumerate(self._queues):
+                at = next((i for i, (_since, key) in enumerate(q) if key not in self._running), None)
+                if at is not None:
+                    break
+            else:
+                return None
+            _since, key = q[at]
+            del q[at]
+            own, queued, item = self._chains[key].popleft()
+            self._running.add(key)
+            wait = now - queued
+            self.lag = max(wait, self._age(now))
+        return min(prio, own), wait, item, key
+
+    def finish(self, key: Any) -> bool:
+        """انتهى عنصر المستخدم key؛ True إن بقي له ما ينتظر (يحتاج مهمة سحب جديدة)."""
+        with self._lock:
+            self._running.discard(key)
+            if self._chains.get(key):
+                return True
+            self._chains.pop(key, None)
+            return False
+
+    def shed_on_arrival(self, prio: int, age: float, ahead: int) -> bool:
+        """تصفح جديد والطابور متأخر جداً: يُسقط قبل أن يُدرج (فلا يشغل خانة من BOT_MAX_INFLIGHT).
+
+        age: أقدم انتظار معروف. ahead: عدد المنتظرين؛ بمتوسط زمن المعالجة يعطي الانتظار المتوقع، وهو
+        ما يكشف التراكم مبكراً — الانتظار المقاس لا يتجاوز سعة النافذة وما زاد عليها يبقى لدى تيليجرام.
+        """
+        if not self.enabled or prio != PRIO_BROWSE:
+            return False
+        if max(age, ahead * self.service / self.slots) >= self.shed_after:
+            self.stats[ADMIT_DROP][prio] += 1
+            return True
+        return False
+
+    def verdict(self, prio: int, wait: float, update: types.Update) -> str:
+        """ما يُفعل بتحديث انتظر wait ثانية: run (معالجة كاملة)، busy (رد مختصر)، drop (لا شيء)."""
+        v = ADMIT_RUN
+        if self.enabled and prio != PRIO_MONEY and wait >= (self.target if prio == PRIO_BROWSE else self.shed_after):
+            v = ADMIT_BUSY
+            if prio == PRIO_BROWSE and wait >= self.shed_after or \
+                    update.callback_query is not None and wait >= CALLBACK_ANSWER_TTL:
+                # حتى الرد المختصر يشغل خيطاً باستدعاء: التصفح المتأخر جداً يُترك ليُفرغ الطابور
+                v = ADMIT_DROP
+        self.stats[v][prio] += 1
+        if wait > self.max_wait[prio]:
+            self.max_wait[prio] = wait
+        return v
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            queued = [len(q) for q in self._queues]
+        return {
+            "target": self.target,
+            "lag": round(self.lag, 3),
+            "service_ms": round(self.service * 1000, 1),
+            "degraded": self.degraded,
+            **{name: {"queued": queued[p], "max_wait": round(self.max_wait[p], 3),
+                      **{v: self.stats[v][p] for v in self.stats}}
+               for p, name in enumerate(PRIO_NAMES)},
+        }
+
+
+ADMISSION = AdmissionControl()
+
+
 # ===================== قاعدة البيانات =====================
 
 SCHEMA_SQL = """
-PRAGMA journal_mode = WAL;
 CREATE TABLE IF NOT EXISTS users (
     user_id     INTEGER PRIMARY KEY,
     username    TEXT,
@@ -104,98 +1074,619 @@ CREATE TABLE IF NOT EXISTS orders (
     product_id      INTEGER NOT NULL,
     qty             INTEGER NOT NULL CHECK(qty > 0),
     total           REAL NOT NULL CHECK(total >= 0),
-    status          TEXT NOT NULL DEFAULT 'pending', -- pending/accepted/rejected
+    status          TEXT NOT NULL DEFAULT 'pending', -- pending/accepted/rejected/expired
     payment_file_id TEXT,                             -- photo/document file_id
     created_at      TEXT DEFAULT (datetime('now')),
     updated_at      TEXT DEFAULT (datetime('now')),
     FOREIGN KEY(user_id)    REFERENCES users(user_id),
     FOREIGN KEY(product_id) REFERENCES products(id)
 );
+
+CREATE INDEX IF NOT EXISTS idx_orders_status_id ON orders(status, id);
+-- انتهاء الطلبات المعلّقة: مسح مدى (status='pending', created_at < حدّ) بدل الجدول كله
+CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at);
+
+-- طابور المراجعة: حجز مؤقت لطلب معلّق من قبل أدمن واحد
+CREATE TABLE IF NOT EXISTS review_leases (
+    order_id    INTEGER PRIMARY KEY,
+    admin_id    INTEGER NOT NULL,
+    expires_at  REAL NOT NULL                         -- unix time
+);
+
+-- صندوق أحداث الطلبات: حدث لكل تغيير يُكتب في معاملة التغيير نفسها. AUTOINCREMENT يجعل seq
+-- رتيباً لا يُعاد استخدامه حتى بعد حذف الأحداث المؤكَّدة، فيصلح مؤشراً للمستهلكين
+CREATE TABLE IF NOT EXISTS order_events (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id    INTEGER NOT NULL,
+    kind        TEXT NOT NULL,                        -- created / payment / status
+    status      TEXT NOT NULL,                        -- حالة الطلب بعد الحدث
+    payload     TEXT NOT NULL,                        -- لقطة JSON من صف الطلب
+    created_at  TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- مستهلكو الصندوق: كل ما seq <= acked عولج؛ delivered أعلى ما سُلِّم (ما تحته يُعدّ إعادة تسليم)
+CREATE TABLE IF NOT EXISTS outbox_consumers (
+    name        TEXT PRIMARY KEY,
+    acked       INTEGER NOT NULL DEFAULT 0,
+    delivered   INTEGER NOT NULL DEFAULT 0,
+    redelivered INTEGER NOT NULL DEFAULT 0,
+    seen_at     TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- سجل التحديثات المستلمة (نقطة تفتيش الـ polling)؛ payload يُمسح بعد انتهاء المعالجة
+CREATE TABLE IF NOT EXISTS update_log (
+    update_id   INTEGER PRIMARY KEY,
+    done        INTEGER NOT NULL DEFAULT 0,
+    payload     TEXT,
+    ts          REAL NOT NULL
+);
+
+-- البث الجماعي: last_user_id هو نقطة التفتيش (المستلمون مرتبون حسب user_id)
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_id      INTEGER NOT NULL,
+    text          TEXT NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'running', -- running/done/cancelled
+    last_user_id  INTEGER NOT NULL DEFAULT 0,
+    total         INTEGER NOT NULL DEFAULT 0,
+    sent          INTEGER NOT NULL DEFAULT 0,
+    blocked       INTEGER NOT NULL DEFAULT 0,
+    failed        INTEGER NOT NULL DEFAULT 0,
+    chat_id       INTEGER,                          -- رسالة التقدّم لدى الأدمن
+    message_id    INTEGER,
+    created_at    TEXT DEFAULT (datetime('now'))
+);
+
+-- تجميع المبيعات بالساعة (UTC) لكل منتج، لـ /chart. القوادح تحدّثه في نفس معاملة تعديل الطلب،
+-- أياً كان الكاتب (البوت، لوحة الويب، سكربت خارجي). الطلب يُحسب في ساعة إنشائه، والقبول في ساعة
+-- القبول، والتراجع عنه يُطرح في ساعة التراجع
+CREATE TABLE IF NOT EXISTS sales_hourly (
+    hour        INTEGER NOT NULL,                   -- unix time / 3600
+    product_id  INTEGER NOT NULL,
+    orders      INTEGER NOT NULL DEFAULT 0,         -- طلبات أُنشئت
+    accepted    INTEGER NOT NULL DEFAULT 0,         -- طلبات قُبلت
+    revenue     REAL NOT NULL DEFAULT 0,            -- مجموع total للمقبولة
+    PRIMARY KEY (hour, product_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sales_product_hour ON sales_hourly(product_id, hour);
+
+-- نسخة التجميع لكل منتج (0 = كل المنتجات): تزيد مع كل تغيير فيه؛ جزء من مفتاح ذاكرة الرسوم
+CREATE TABLE IF NOT EXISTS sales_version (
+    product_id  INTEGER PRIMARY KEY,
+    version     INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_sales_order_created AFTER INSERT ON orders
+BEGIN
+    -- طلب يُدرج مقبولاً (استيراد) يُحسب قبوله في ساعة إنشائه
+    INSERT INTO sales_hourly(hour, product_id, orders, accepted, revenue)
+    VALUES (CAST(strftime('%s', COALESCE(NEW.created_at, 'now')) AS INTEGER) / 3600, NEW.product_id, 1,
+            NEW.status = 'accepted', CASE WHEN NEW.status = 'accepted' THEN NEW.total ELSE 0 END)
+    ON CONFLICT(hour, product_id) DO UPDATE SET orders = orders + 1, accepted = accepted + excluded.accepted,
+                                                revenue = revenue + excluded.revenue;
+    INSERT INTO sales_version(product_id, version) VALUES (NEW.product_id, 1), (0, 1)
+    ON CONFLICT(product_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sales_order_accepted AFTER UPDATE OF status ON orders
+WHEN (NEW.status = 'accepted') <> (OLD.status = 'accepted')
+BEGIN
+    INSERT INTO sales_hourly(hour, product_id, accepted, revenue)
+    VALUES (CAST(strftime('%s', 'now') AS INTEGER) / 3600, NEW.product_id,
+            CASE WHEN NEW.status = 'accepted' THEN 1 ELSE -1 END,
+            CASE WHEN NEW.status = 'accepted' THEN NEW.total ELSE -NEW.total END)
+    ON CONFLICT(hour, product_id) DO UPDATE SET accepted = accepted + excluded.accepted,
+                                                revenue = revenue + excluded.revenue;
+    INSERT INTO sales_version(product_id, version) VALUES (NEW.product_id, 1), (0, 1)
+    ON CONFLICT(product_id) DO UPDATE SET version = version + 1;
+END;
 """
 
+# تعبئة sales_hourly مرة واحدة عند إنشائه من الطلبات الموجودة (القبول بوقت آخر تعديل للطلب).
+# WHERE في SELECT مطلوبة قبل ON CONFLICT كي لا يقرأها المحلل قيد ربط (JOIN)
+SALES_BACKFILL_SQL = """
+INSERT INTO sales_hourly(hour, product_id, orders)
+SELECT CAST(strftime('%s', created_at) AS INTEGER) / 3600, product_id, COUNT(*)
+FROM orders WHERE created_at IS NOT NULL GROUP BY 1, 2
+ON CONFLICT(hour, product_id) DO UPDATE SET orders = orders + excluded.orders;
+INSERT INTO sales_hourly(hour, product_id, accepted, revenue)
+SELECT CAST(strftime('%s', COALESCE(updated_at, created_at)) AS INTEGER) / 3600, product_id, COUNT(*), SUM(total)
+FROM orders WHERE status = 'accepted' AND COALESCE(updated_at, created_at) IS NOT NULL GROUP BY 1, 2
+ON CONFLICT(hour, product_id) DO UPDATE SET accepted = accepted + excluded.accepted,
+                                            revenue = revenue + excluded.revenue;
+"""
 
-def db_connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# رقم نسخة المخطط في PRAGMA user_version: ارفعه مع أي تغيير في SCHEMA_SQL أو MIGRATIONS،
+# وإلا فلن تُطبَّق التغييرات على قواعد البيانات القائمة (db_init يتخطّى الـ DDL عند التطابق)
+SCHEMA_VERSION = 3
+
+# أعمدة أُضيفت بعد الإصدار الأول: (جدول، عمود، تعريف، استعلامات بعد الإضافة)
+MIGRATIONS: List[Tuple[str, str, str, Tuple[str, ...]]] = [
+    ("orders", "idem_key", "TEXT",
+     ("CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idem ON orders(idem_key)",)),
+    # 1 = حظر البوت أو حُذف حسابه؛ يُستثنى من البث ويعود 0 عند أول رسالة منه
+    ("users", "blocked", "INTEGER NOT NULL DEFAULT 0", ()),
+]
+
+
+def db_connect(readonly: bool = False) -> sqlite3.Connection:
+    path = current_tenant().db_path
+    if readonly:
+        # mode=ro: لا يأخذ هذا الاتصال قفل كتابة أبداً؛ timeout = busy_timeout عند نقطة التفتيش
+        uri = "file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=5.0, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def db_init() -> None:
+def sql_statements(script: str) -> Iterator[str]:
+    # executescript يُنهي أي معاملة مفتوحة بـ COMMIT؛ هنا تُنفَّذ الجمل واحدة واحدة (المشغّلات كاملة)
+    stmt = ""
+    for line in script.splitlines(keepends=True):
+        stmt += line
+        if sqlite3.complete_statement(stmt):
+            yield stmt.strip()
+            stmt = ""
+    if stmt.strip():
+        yield stmt.strip()
+
+
+def db_init() -> bool:
+    """ينشئ المخطط ويطبّق الترحيلات؛ يعيد False إن كان المخطط محدّثاً (لا DDL إطلاقاً)."""
     conn = db_connect()
-    cur = conn.cursor()
-    cur.executescript(SCHEMA_SQL)
-    conn.commit()
-    conn.close()
-    log("[DB] schema ready")
+    conn.isolation_level = None
+    try:
+        # قراءة رأس الملف فقط — بدل executescript كامل و PRAGMA table_info لكل ترحيل في كل إقلاع
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return False
+        # لا يتغير وضع السجل داخل معاملة؛ وهو دائم في الملف
+        conn.execute("PRAGMA journal_mode = WAL")
+        # الـ DDL والتعبئة ورفع النسخة معاملة واحدة تحت قفل الكتابة: البوت واللوحة يقلعان معاً
+        # (run.sh) فيرى الثاني نسخة الأول بعد القفل ولا يعبّئ sales_hourly مرتين، وانهيار في
+        # المنتصف لا يترك مخططاً جديداً بلا تعبئة
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                conn.execute("ROLLBACK")
+                return False
+            had_sales = conn.execute("SELECT 1 FROM sqlite_master WHERE name='sales_hourly'").fetchone() is not None
+            for sql in sql_statements(SCHEMA_SQL):
+                conn.execute(sql)
+            for table, column, decl, after in MIGRATIONS:
+                cols = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in cols:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+                for sql in after:
+                    conn.execute(sql)
+            if not had_sales:
+                for sql in sql_statements(SALES_BACKFILL_SQL):
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    log(f"[DB] schema ready (v{SCHEMA_VERSION})")
+    return True
+
+
+# كاتب وحيد (Group commit) -----------------------------------------------------
+# كل التعديلات تمر عبر خيط واحد يجمعها خلال نافذة قصيرة وينفّذها في معاملة واحدة،
+# فتُدفع كلفة القفل والـ fsync مرة واحدة لكل دفعة بدل مرة لكل استعلام.
+# المستدعي يحصل على Future لا تُحلّ إلا بعد COMMIT، فيرى كتاباته فور انتظارها.
+
+WriteJob = Callable[[sqlite3.Connection], Any]
+
+
+class DBWriter:
+    def __init__(self, path: str, window: float = DB_WRITE_WINDOW, max_batch: int = DB_WRITE_MAX_BATCH):
+        self.path = path
+        self.window = window
+        self.max_batch = max_batch
+        self.queue: "queue.Queue[Optional[Tuple[WriteJob, Future]]]" = queue.Queue()
+        self.stats = {"jobs": 0, "commits": 0, "failed": 0}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self.closed or (self._thread and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread and thread.is_alive():
+            self.queue.put(None)
+            thread.join(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        # إيقاف نهائي (بوت أُزيل): ما في الطابور يُنفَّذ، وما يُرسل بعده يفشل بدل أن يعيد تشغيل الخيط
+        with self._lock:
+            self.closed = True
+        self.stop(timeout)
+        # مهمة سبقت علامة الإغلاق بلحظة ودخلت الطابور بعد None: تفشل ولا تبقى معلّقة
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and not item[1].done():
+                item[1].set_exception(RuntimeError(f"DB writer for {self.path} is closed"))
+
+    def alive(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def submit(self, job: WriteJob) -> Future:
+        # لا تستدعِ submit(...).result() من داخل job نفسها — الخيط الكاتب سينتظر نفسه.
+        fut: Future = Future()
+        if self.closed:
+            fut.set_exception(RuntimeError(f"DB writer for {self.path} is closed"))
+            return fut
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            # أول استخدام، أو خيط كاتب مات: لا تبقى المهام في طابور لا يقرؤه أحد
+            self.start()
+        self.queue.put((job, fut))
+        return fut
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout = 5000")
+        # في وضع WAL يكفي NORMAL: لا فقدان تلف، وfsync عند نقاط التفتيش فقط
+        conn.execute("PRAGMA synchronous = NORMAL")
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    nxt = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stopping = True
+                    break
+                batch.append(nxt)
+            self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Tuple[WriteJob, Future]]) -> None:
+        done: List[Tuple[Future, Any, Optional[BaseException]]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job, fut in batch:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                # نقطة حفظ لكل عملية: فشل إحداها لا يُسقط بقية الدفعة
+                conn.execute("SAVEPOINT job")
+                try:
+                    res = job(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    done.append((fut, None, e))
+                else:
+                    conn.execute("RELEASE job")
+                    done.append((fut, res, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            log(f"[DB] group commit failed ({len(batch)} jobs): {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            self.stats["failed"] += len(batch)
+            # كل مهام الدفعة تفشل، بما فيها ما لم يُبدأ بعد (فشل BEGIN أو SAVEPOINT في منتصفها):
+            # Future تبقى PENDING تعني مستدعياً عالقاً في result() إلى الأبد
+            for _job, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self.stats["jobs"] += len(done)
+        self.stats["commits"] += 1
+        for fut, res, err in done:
+            if err is not None:
+                self.stats["failed"] += 1
+                fut.set_exception(err)
+            else:
+                fut.set_result(res)
+
+
+DB_WRITER = tenant_local("writer", lambda t: DBWriter(t.db_path))
 
 
 # CRUD helpers ---------------------------------------------------------------
 
+def db_submit(sql: str, params: Tuple = (), returning: bool = False) -> Future:
+    """يضع استعلام كتابة في طابور الكاتب. النتيجة: lastrowid، أو صفوف RETURNING إن returning=True."""
+    def job(conn: sqlite3.Connection) -> Any:
+        cur = conn.execute(sql, params)
+        if returning:
+            return cur.fetchall()
+        return cur.lastrowid
+    return DB_WRITER.submit(job)
+
+
+def db_transaction(job: WriteJob) -> Future:
+    """ينفّذ عدة استعلامات بشكل ذرّي داخل معاملة الكاتب (job تستقبل الاتصال)."""
+    return DB_WRITER.submit(job)
+
+
 def db_execute(sql: str, params: Tuple = ()) -> int:
-    conn = db_connect()
-    cur = conn.cursor()
-    cur.execute(sql, params)
-    conn.commit()
-    last_id = cur.lastrowid
-    conn.close()
-    return last_id
+    return db_submit(sql, params).result()
+
+
+# اتصال قراءة دائم لكل خيط بدل فتح اتصال وإغلاقه مع كل استعلام: عدد الاتصالات محدود بعدد
+# الخيوط، ويُغلق الاتصال تلقائياً بانتهاء خيطه. في وضع WAL كل SELECT يرى آخر COMMIT.
+# الاتصال للقراءة فقط: كل الكتابات تمر عبر الكاتب، حتى من عملية لوحة الويب (app/).
+_READ = threading.local()
+
+
+def db_reader() -> sqlite3.Connection:
+    conns = getattr(_READ, "conns", None)
+    if conns is None:
+        conns = _READ.conns = {}
+    path = current_tenant().db_path
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = db_connect(readonly=True)
+    return conn
 
 
 def db_fetchone(sql: str, params: Tuple = ()) -> Optional[sqlite3.Row]:
-    conn = db_connect()
-    cur = conn.cursor()
-    cur.execute(sql, params)
+    current_tenant().metrics["reads"] += 1
+    cur = db_reader().execute(sql, params)
     row = cur.fetchone()
-    conn.close()
+    # إغلاق المؤشر يُنهي معاملة القراءة فوراً (لا تبقى لقطة WAL قديمة مفتوحة)
+    cur.close()
     return row
 
 
 def db_fetchall(sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
-    conn = db_connect()
-    cur = conn.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    current_tenant().metrics["reads"] += 1
+    return db_reader().execute(sql, params).fetchall()
+
+
+def db_data_version() -> int:
+    # يتغيّر كلما التزم اتصال آخر (الكاتب هنا أو عملية أخرى)؛ يُقرأ من فهرس WAL المشترك لا من صفحات القاعدة
+    cur = db_reader().execute("PRAGMA data_version")
+    version = cur.fetchone()[0]
+    cur.close()
+    return version
+
+
+# سجل التحديثات ------------------------------------------------------------------
+# فحص التكرار في المسار الساخن لا يلمس القرص: نافذة من آخر UPDATE_LOG_WINDOW معرّف في
+# الذاكرة، وكل معرّف أقدم من النافذة (≤ floor) يُعدّ معالجاً لأن المعرّفات متزايدة.
+# الجدول لا يُقرأ إلا عند الإقلاع، ويُقلَّم دورياً فلا يبقى منه إلا الذيل الأخير.
+
+class UpdateLog:
+    def __init__(self, window: int = UPDATE_LOG_WINDOW, keep: int = UPDATE_LOG_KEEP):
+        self.window = window
+        self.keep = keep
+        self.offset = 0          # أكبر update_id سُجِّل
+        self.stats = {"fresh": 0, "dup": 0, "replayed": 0}
+        self._seen: set = set()
+        self._order: deque = deque()
+        self._floor = 0
+        self._done_since_prune = 0
+        self._done_buf: List[int] = []
+        self._done_fut: Optional[Future] = None
+        # RLock: load() يعلّم المنتهي وهو ممسك بالقفل، وقد يُستدعى _flushed في نفس الخيط
+        self._lock = threading.RLock()
+
+    def _remember(self, update_id: int) -> None:
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if update_id > self.offset:
+            self.offset = update_id
+        while len(self._order) > self.window:
+            old = self._order.popleft()
+            self._seen.discard(old)
+            if old > self._floor:
+                self._floor = old
+
+    def admit(self, updates: List[types.Update]) -> List[types.Update]:
+        """يعيد التحديثات التي لم تُرَ من قبل ويحجزها في النافذة."""
+        fresh = []
+        with self._lock:
+            for u in updates:
+                if u.update_id <= self._floor or u.update_id in self._seen:
+                    self.stats["dup"] += 1
+                    continue
+                self._remember(u.update_id)
+                fresh.append(u)
+            self.stats["fresh"] += len(fresh)
+        return fresh
+
+    def forget(self, updates: List[types.Update]) -> None:
+        """يلغي حجز admit لتحديثات لم يُحفظ قيدها (فشل journal)؛ إعادة تسليمها من تيليجرام تُعالج."""
+        ids = {u.update_id for u in updates}
+        with self._lock:
+            self._seen -= ids
+            self._order = deque(i for i in self._order if i not in ids)
+            self.offset = max(max(self._order, default=0), self._floor)
+            self.stats["fresh"] -= len(ids)
+
+    def journal(self, updates: List[types.Update]) -> Future:
+        rows = [(u.update_id, getattr(u, "raw_json", None), time.time()) for u in updates]
+
+        def job(conn: sqlite3.Connection) -> None:
+            conn.executemany(
+                "INSERT OR IGNORE INTO update_log(update_id, done, payload, ts) VALUES(?,0,?,?)", rows
+            )
+        return db_transaction(job)
+
+    def done(self, update_id: int) -> Future:
+        # العلامات تتجمع: مهمة كتابة واحدة تعلّم كل ما تراكم حتى يصل إليها دور الكاتب
+        with self._lock:
+            self._done_buf.append(update_id)
+            self._done_since_prune += 1
+            prune = self._done_since_prune >= self.keep // 10
+            if prune:
+                self._done_since_prune = 0
+        fut = self._flush()
+        if prune:
+            self.prune()
+        return fut
+
+    def _flush(self) -> Future:
+        taken: List[int] = []
+        with self._lock:
+            fut = self._done_fut
+            if fut is not None:
+                return fut
+            fut = self._done_fut = db_transaction(functools.partial(self._flush_done, taken))
+        # خارج القفل: إن حُلّت Future قبل هذا السطر يُستدعى _flushed فوراً هنا
+        fut.add_done_callback(functools.partial(self._flushed, taken))
+        return fut
+
+    def _flush_done(self, taken: List[int], conn: sqlite3.Connection) -> None:
+        with self._lock:
+            taken[:], self._done_buf = self._done_buf, []
+        conn.executemany("UPDATE update_log SET done=1, payload=NULL WHERE update_id=?", [(i,) for i in taken])
+
+    def _flushed(self, taken: List[int], fut: Future) -> None:
+        # يُصفَّر الـ Future هنا لا داخل المهمة: مهمة لم تُنفَّذ أبداً (فشل BEGIN) لا تترك Future ميتة
+        # تبتلع كل العلامات اللاحقة. عند الفشل تعود العلامات إلى المخزن وتُكتب مع الدفعة القادمة
+        failed = fut.cancelled() or fut.exception() is not None
+        with self._lock:
+            if self._done_fut is fut:
+                self._done_fut = None
+            if failed:
+                self._done_buf[:0] = taken
+            again = not failed and bool(self._done_buf)
+        if again:
+            # علامات وصلت بعد أخذ المهمة للمخزن وقبل COMMIT
+            self._flush()
+
+    def prune(self) -> Future:
+        return db_submit(
+            "DELETE FROM update_log WHERE done=1 AND update_id < (SELECT MAX(update_id) FROM update_log) - ?",
+            (self.keep,),
+        )
+
+    def load(self) -> List[types.Update]:
+        """عند الإقلاع: يملأ النافذة والـ offset من الجدول ويعيد التحديثات غير المنتهية."""
+        ids = db_fetchall("SELECT update_id FROM update_log ORDER BY update_id DESC LIMIT ?", (self.window,))
+        pending = db_fetchall("SELECT update_id, payload FROM update_log WHERE done=0 ORDER BY update_id")
+        replay = []
+        with self._lock:
+            for r in reversed(ids):
+                self._remember(int(r["update_id"]))
+            if len(ids) == self.window:
+                self._floor = max(self._floor, int(ids[-1]["update_id"]) - 1)
+            for r in pending:
+                if r["payload"]:
+                    replay.append(parse_update(json.loads(r["payload"])))
+                else:
+                    self.done(int(r["update_id"]))
+            self.stats["replayed"] += len(replay)
+        return replay
+
+
+UPDATE_LOG = tenant_local("update_log", lambda t: UpdateLog())
 
 
 # ===================== إدارة الواجهات (لوحات الأزرار) =====================
 
 # ملاحظة: telebot لا يحتوي مُنشئ صفوف جاهز مثل aiogram، لذا سنبنيها يدويًا
+#
+# اللوحات الثابتة تُبنى وتُسلسل إلى JSON مرة واحدة عند التحميل، والمُعاملة (برقم طلب/منتج)
+# تُسلسل مرة واحدة بعلامات @@name@@ ثم تُولّد باستبدال نصي رخيص. telebot يرسل ناتج
+# to_json() كما هو، فلا يُعاد بناء الكائنات ولا تسلسلها في كل طلب.
+
+_KB_PARAM_RE = re.compile(r"@@(\w+)@@")
+
+
+class JsonKeyboard(types.JsonSerializable):
+    """لوحة أزرار جاهزة بصيغة JSON؛ تُمرّر مباشرة كـ reply_markup."""
+
+    __slots__ = ("json",)
+
+    def __init__(self, json_str: str):
+        self.json = json_str
+
+    def to_json(self) -> str:
+        return self.json
 
 
-def kb_main(is_admin_flag: bool) -> types.InlineKeyboardMarkup:
+class KeyboardTemplate:
+    """قالب لوحة مُسلسل مسبقاً؛ template(oid=5) يعيد JsonKeyboard بعد الاستبدال."""
+
+    def __init__(self, markup: types.InlineKeyboardMarkup):
+        parts = _KB_PARAM_RE.split(markup.to_json())
+        self._literals: List[str] = parts[0::2]
+        self._names: List[str] = parts[1::2]
+
+    def __call__(self, **values: Any) -> JsonKeyboard:
+        lits, names = self._literals, self._names
+        out = [lits[0]]
+        for i, name in enumerate(names):
+            v = values[name]
+            out.append(str(v) if isinstance(v, int) else json.dumps(str(v))[1:-1])
+            out.append(lits[i + 1])
+        return JsonKeyboard("".join(out))
+
+
+def _build_kb_main(is_admin_flag: bool, lang: str = DEFAULT_LANG) -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup(row_width=1)
     kb.add(
-        types.InlineKeyboardButton("🎮 قائمة الألعاب والأسعار", callback_data="user:list_products"),
-        types.InlineKeyboardButton("🧾 إنشاء طلب شحن", callback_data="user:new_order"),
-        types.InlineKeyboardButton("📸 إرسال إثبات الدفع", callback_data="user:send_proof"),
-        types.InlineKeyboardButton("🔎 تتبّع حالة الطلب", callback_data="user:track_order"),
-        types.InlineKeyboardButton("ℹ️ مساعدة", callback_data="user:help"),
+        types.InlineKeyboardButton(MSG[lang].btn_products, callback_data="user:list_products"),
+        types.InlineKeyboardButton(MSG[lang].btn_new_order, callback_data="user:new_order"),
+        types.InlineKeyboardButton(MSG[lang].btn_send_proof, callback_data="user:send_proof"),
+        types.InlineKeyboardButton(MSG[lang].btn_track, callback_data="user:track_order"),
+    )
+    kb.row(
+        types.InlineKeyboardButton(MSG[lang].btn_help, callback_data="user:help"),
+        types.InlineKeyboardButton(MSG[lang].btn_lang, callback_data="user:lang"),
     )
     if is_admin_flag:
-        kb.add(types.InlineKeyboardButton("🛠️ لوحة الأدمن", callback_data="admin:panel"))
+        kb.add(types.InlineKeyboardButton(MSG[lang].btn_admin, callback_data="admin:panel"))
+    return kb
+
+
+def _build_kb_back(cb: str, lang: str = DEFAULT_LANG) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup()
+    kb.add(types.InlineKeyboardButton(MSG[lang].btn_back, callback_data=cb))
     return kb
 
 
-def kb_back(cb: str = "back:main") -> types.InlineKeyboardMarkup:
+def _build_kb_lang(lang: str) -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup()
-    kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data=cb))
+    kb.row(*(types.InlineKeyboardButton(LANG_NAMES[code], callback_data=f"lang:{code}") for code in LANGS))
+    kb.add(types.InlineKeyboardButton(MSG[lang].btn_back, callback_data="back:main"))
     return kb
 
 
-def kb_admin_panel() -> types.InlineKeyboardMarkup:
+def _build_kb_admin_panel() -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup(row_width=1)
     kb.add(
         types.InlineKeyboardButton("➕ إضافة منتج", callback_data="admin:add_product"),
         types.InlineKeyboardButton("🗂️ إدارة المنتجات", callback_data="admin:manage_products"),
+        types.InlineKeyboardButton("▶️ الطلب التالي للمراجعة", callback_data="admin:next"),
         types.InlineKeyboardButton("📬 الطلبات المعلّقة", callback_data="admin:list_pending"),
+        types.InlineKeyboardButton("🔄 تحديث", callback_data="admin:panel"),
         types.InlineKeyboardButton("⬅️ رجوع", callback_data="back:main"),
     )
     return kb
 
 
-def kb_product_actions(pid: int) -> types.InlineKeyboardMarkup:
+def _build_kb_product_actions(pid: Any) -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup(row_width=1)
     kb.add(
         types.InlineKeyboardButton("✏️ تعديل السعر", callback_data=f"admin:edit_price:{pid}"),
@@ -205,7 +1696,7 @@ def kb_product_actions(pid: int) -> types.InlineKeyboardMarkup:
     return kb
 
 
-def kb_order_review(oid: int) -> types.InlineKeyboardMarkup:
+def _build_kb_order_review(oid: Any) -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup(row_width=2)
     kb.add(
         types.InlineKeyboardButton("✅ قبول", callback_data=f"admin:accept:{oid}"),
@@ -213,20 +1704,101 @@ def kb_order_review(oid: int) -> types.InlineKeyboardMarkup:
     )
     kb.add(
         types.InlineKeyboardButton("📄 تفاصيل", callback_data=f"admin:details:{oid}"),
+        types.InlineKeyboardButton("▶️ التالي", callback_data="admin:next"),
     )
     kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="admin:list_pending"))
     return kb
 
 
-def kb_products_list() -> types.InlineKeyboardMarkup:
+def _build_kb_confirm_order(lang: str) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup()
+    # الزر يحمل ما يلزم لإنشاء الطلب: يبقى صالحاً عند إعادة تسليم الضغطة بعد إعادة التشغيل
+    kb.add(types.InlineKeyboardButton(MSG[lang].btn_confirm, callback_data="user:confirm_order:@@pid@@:@@qty@@:@@nonce@@"))
+    kb.add(types.InlineKeyboardButton(MSG[lang].btn_back, callback_data="user:new_order"))
+    return kb
+
+
+def _build_kb_order_created(lang: str) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup()
+    kb.add(types.InlineKeyboardButton(MSG[lang].btn_send_proof, callback_data="user:send_proof"))
+    kb.add(types.InlineKeyboardButton(MSG[lang].btn_track, callback_data="user:track_order"))
+    kb.add(types.InlineKeyboardButton(MSG[lang].btn_back, callback_data="back:main"))
+    return kb
+
+
+# لوحات المستخدم محسوبة مسبقاً لكل لغة: KB_ORDER_CREATED[lang]
+_KB_MAIN_USER = {lang: JsonKeyboard(_build_kb_main(False, lang).to_json()) for lang in LANGS}
+_KB_MAIN_ADMIN = {lang: JsonKeyboard(_build_kb_main(True, lang).to_json()) for lang in LANGS}
+_KB_ADMIN_PANEL = JsonKeyboard(_build_kb_admin_panel().to_json())
+_KB_CONFIRM_ORDER_TPL = {lang: KeyboardTemplate(_build_kb_confirm_order(lang)) for lang in LANGS}
+KB_ORDER_CREATED = {lang: JsonKeyboard(_build_kb_order_created(lang).to_json()) for lang in LANGS}
+KB_LANG = {lang: JsonKeyboard(_build_kb_lang(lang).to_json()) for lang in LANGS}
+_KB_BACK_TPL = {lang: KeyboardTemplate(_build_kb_back("@@cb@@", lang)) for lang in LANGS}
+_KB_PRODUCT_ACTIONS_TPL = KeyboardTemplate(_build_kb_product_actions("@@pid@@"))
+_KB_ORDER_REVIEW_TPL = KeyboardTemplate(_build_kb_order_review("@@oid@@"))
+
+
+def kb_main(is_admin_flag: bool, lang: str = DEFAULT_LANG) -> JsonKeyboard:
+    return (_KB_MAIN_ADMIN if is_admin_flag else _KB_MAIN_USER)[lang]
+
+
+@functools.lru_cache(maxsize=64)
+def kb_back(cb: str = "back:main", lang: str = DEFAULT_LANG) -> JsonKeyboard:
+    return _KB_BACK_TPL[lang](cb=cb)
+
+
+def kb_confirm_order(pid: int, qty: int, nonce: str, lang: str = DEFAULT_LANG) -> JsonKeyboard:
+    return _KB_CONFIRM_ORDER_TPL[lang](pid=pid, qty=qty, nonce=nonce)
+
+
+def kb_admin_panel() -> JsonKeyboard:
+    return _KB_ADMIN_PANEL
+
+
+def kb_product_actions(pid: int) -> JsonKeyboard:
+    return _KB_PRODUCT_ACTIONS_TPL(pid=pid)
+
+
+def kb_order_review(oid: int) -> JsonKeyboard:
+    return _KB_ORDER_REVIEW_TPL(oid=oid)
+
+
+def kb_products_rows(rows: List[sqlite3.Row], prefix: str, back: str, empty: str,
+                     lang: str = DEFAULT_LANG) -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup(row_width=1)
-    rows = db_fetchall("SELECT id, name, price FROM products ORDER BY id DESC")
     if not rows:
-        kb.add(types.InlineKeyboardButton("لا توجد منتجات بعد", callback_data="noop"))
+        kb.add(types.InlineKeyboardButton(empty, callback_data="noop"))
     else:
         for r in rows:
-            kb.add(types.InlineKeyboardButton(f"{r['name']} — {money(r['price'])}", callback_data=f"user:product:{r['id']}"))
-    kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="back:main"))
+            kb.add(types.InlineKeyboardButton(f"{r['name']} — {money(r['price'])}", callback_data=f"{prefix}{r['id']}"))
+    kb.add(types.InlineKeyboardButton(MSG[lang].btn_back, callback_data=back))
+    return kb
+
+
+def kb_products_list(lang: str = DEFAULT_LANG) -> types.InlineKeyboardMarkup:
+    return PRODUCTS.keyboard(lang)
+
+
+def kb_manage_products() -> types.InlineKeyboardMarkup:
+    rows = db_fetchall("SELECT id,name,price FROM products ORDER BY id DESC")
+    return kb_products_rows(rows, "admin:product:", "admin:panel", "لا توجد منتجات")
+
+
+def kb_pending_orders(ids: List[int], page: int = 0, has_more: bool = False) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup(row_width=1)
+    if not ids:
+        kb.add(types.InlineKeyboardButton("لا توجد طلبات معلّقة", callback_data="noop"))
+    else:
+        for oid in ids:
+            kb.add(types.InlineKeyboardButton(f"طلب #{oid}", callback_data=f"admin:review:{oid}"))
+    nav = []
+    if page > 0:
+        nav.append(types.InlineKeyboardButton("◀️ السابق", callback_data=f"admin:list_pending:{page - 1}"))
+    if has_more:
+        nav.append(types.InlineKeyboardButton("التالي ▶️", callback_data=f"admin:list_pending:{page + 1}"))
+    if nav:
+        kb.row(*nav)
+    kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="admin:panel"))
     return kb
 
 
@@ -249,80 +1821,306 @@ class State:
 class UserSession:
     state: str = State.NONE
     data: Dict[str, any] = None
+    touched: float = 0.0
 
     def __post_init__(self):
         if self.data is None:
             self.data = {}
 
 
-SESSIONS: Dict[int, UserSession] = {}
+# الجلسة موجودة فقط أثناء خطوة متعددة الرسائل؛ ترتيب القاموس = ترتيب آخر استخدام
+SESSIONS = tenant_local("sessions", lambda t: OrderedDict())
+_SESSIONS_LOCK = threading.Lock()
 
 
 def get_session(user_id: int) -> UserSession:
-    sess = SESSIONS.get(user_id)
-    if not sess:
-        sess = UserSession()
-        SESSIONS[user_id] = sess
+    now = time.monotonic()
+    sessions = current_tenant().sessions
+    with _SESSIONS_LOCK:
+        sess = sessions.get(user_id)
+        if sess is None:
+            sess = sessions[user_id] = UserSession()
+        else:
+            sessions.move_to_end(user_id)
+        sess.touched = now
+        while sessions:
+            oldest = next(iter(sessions.values()))
+            if len(sessions) <= SESSION_MAX and now - oldest.touched < SESSION_TTL:
+                break
+            sessions.popitem(last=False)
     return sess
 
 
+def session_state(user_id: int) -> str:
+    """حالة المستخدم دون إنشاء جلسة — لمرشّحات المعالجات التي تُستدعى مع كل رسالة."""
+    sess = current_tenant().sessions.get(user_id)
+    if sess is None or time.monotonic() - sess.touched >= SESSION_TTL:
+        return State.NONE
+    return sess.state
+
+
 def clear_session(user_id: int) -> None:
-    SESSIONS[user_id] = UserSession()
+    sessions = current_tenant().sessions
+    with _SESSIONS_LOCK:
+        sessions.pop(user_id, None)
 
 
 # ===================== وظائف بيانات (منتجات/طلبات) =====================
 
 # Users
 
-def ensure_user(user_id: int, username: str, first_name: str) -> None:
-    db_execute(
-        "INSERT OR IGNORE INTO users(user_id, username, first_name) VALUES(?,?,?)",
-        (user_id, username or "", first_name or ""),
+def ensure_user(user_id: int, username: str, first_name: str, lang_hint: Optional[str] = None) -> Future:
+    # لا حاجة لانتظار النتيجة: أي كتابة لاحقة من نفس المعالج تأتي بعدها في الطابور.
+    # user_lang يُدفئ ذاكرة اللغات؛ اللغة المحفوظة لمستخدم قديم لا تُستبدل
+    lang = user_lang(user_id, lang_hint)
+    if batch_known_user(user_id):
+        # مسجّل وغير محظور (من جلب الدفعة): الـ upsert لن يغيّر شيئاً
+        fut: Future = Future()
+        fut.set_result(None)
+        return fut
+    return db_submit(
+        """
+        INSERT INTO users(user_id, username, first_name, lang) VALUES(?,?,?,?)
+        ON CONFLICT(user_id) DO UPDATE SET blocked=0 WHERE users.blocked=1
+        """,
+        (user_id, username or "", first_name or "", lang),
+    )
+
+
+def users_after(last_user_id: int, limit: int) -> List[int]:
+    """دفعة مستلمين بترتيب user_id بعد last_user_id (keyset بدل OFFSET)."""
+    rows = db_fetchall(
+        "SELECT user_id FROM users WHERE user_id > ? AND blocked = 0 ORDER BY user_id LIMIT ?",
+        (last_user_id, limit),
     )
+    return [int(r["user_id"]) for r in rows]
 
 
 # Products
+# القائمة صغيرة وتُقرأ في كل شاشة شراء: نسخة في الذاكرة لكل مستأجر تُحمَّل باستعلام واحد.
+# كل تعديل من هذه العملية يُبطلها فوراً، و PRODUCTS_TTL يلتقط تعديلات عملية لوحة الويب.
+# السعر الذي يُحسب به الطلب يُقرأ من الجدول داخل معاملة الإنشاء لا من هذه النسخة.
+
+class ProductCatalog:
+    def __init__(self, ttl: float = PRODUCTS_TTL):
+        self.ttl = ttl
+        self.rows: List[sqlite3.Row] = []
+        self.by_id: Dict[int, sqlite3.Row] = {}
+        self.keyboards: Dict[str, types.InlineKeyboardMarkup] = {}
+        self.expires = 0.0
+        self.loaded = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self) -> None:
+        if time.monotonic() < self.expires:
+            return
+        if self.expires and ADMISSION.degraded:
+            # تحميل زائد: نسخة انتهت مدتها تكفي للشاشات (invalidate يصفّر expires فلا يُتجاوز)
+            return
+        with self._lock:
+            if time.monotonic() < self.expires:
+                return
+            rows = db_fetchall("SELECT id, name, price FROM products ORDER BY id DESC")
+            self.rows, self.by_id, self.keyboards = rows, {int(r["id"]): r for r in rows}, {}
+            self.loaded = time.monotonic()
+            self.expires = self.loaded + self.ttl
+
+    def all(self) -> List[sqlite3.Row]:
+        self._fresh()
+        return self.rows
+
+    def get(self, pid: int) -> Optional[sqlite3.Row]:
+        self._fresh()
+        row = self.by_id.get(pid)
+        if row is None and time.monotonic() - self.loaded > 1.0:
+            # منتج أُضيف من خارج العملية: إعادة تحميل فورية (مرة في الثانية على الأكثر)
+            self.invalidate()
+            self._fresh()
+            row = self.by_id.get(pid)
+        return row
+
+    def keyboard(self, lang: str) -> types.InlineKeyboardMarkup:
+        self._fresh()
+        kb = self.keyboards.get(lang)
+        if kb is None:
+            kb = self.keyboards[lang] = kb_products_rows(self.rows, "user:product:", "back:main",
+                                                         MSG[lang].no_products, lang)
+        return kb
+
+    def invalidate(self) -> None:
+        self.expires = 0.0
+
+
+PRODUCTS = tenant_local("products", lambda t: ProductCatalog())
+
 
 def product_get(pid: int) -> Optional[sqlite3.Row]:
-    return db_fetchone("SELECT id,name,price FROM products WHERE id=?", (pid,))
+    return PRODUCTS.get(pid)
 
 
 def product_add(name: str, price: float) -> int:
-    return db_execute("INSERT INTO products(name, price) VALUES(?,?)", (name, price))
+    pid = db_execute("INSERT INTO products(name, price) VALUES(?,?)", (name, price))
+    PRODUCTS.invalidate()
+    return pid
 
 
 def product_edit_price(pid: int, price: float) -> None:
     db_execute("UPDATE products SET price=? WHERE id=?", (price, pid))
+    PRODUCTS.invalidate()
 
 
 def product_delete(pid: int) -> None:
     db_execute("DELETE FROM products WHERE id=?", (pid,))
+    PRODUCTS.invalidate()
+
+
+def products_page(after: int = 0, limit: int = 50) -> List[sqlite3.Row]:
+    """صفحة منتجات بترتيب id بعد after (keyset بدل OFFSET)."""
+    return db_fetchall("SELECT id,name,price FROM products WHERE id > ? ORDER BY id LIMIT ?", (after, limit))
+
+
+def products_delete(pids: List[int]) -> int:
+    marks = ",".join("?" * len(pids))
+    deleted = db_submit(f"DELETE FROM products WHERE id IN ({marks}) RETURNING id", tuple(pids), returning=True).result()
+    PRODUCTS.invalidate()
+    return len(deleted)
 
 
 # Orders
 
-def order_create(user_id: int, product_id: int, qty: int) -> int:
-    prod = product_get(product_id)
-    if not prod:
-        raise ValueError("product not found")
-    total = float(prod["price"]) * qty
-    return db_execute(
-        "INSERT INTO orders(user_id, product_id, qty, total, status) VALUES(?,?,?,?, 'pending')",
-        (user_id, product_id, qty, total),
+# أعمدة لقطة الطلب في أحداث الصندوق (RETURNING في كل كتابة على الطلبات)
+ORDER_EVENT_COLS = "id, user_id, product_id, qty, total, status, payment_file_id, created_at, updated_at"
+
+
+def order_events_append(conn: sqlite3.Connection, kind: str, rows: List[sqlite3.Row]) -> None:
+    """حدث لكل صف طلب (RETURNING ORDER_EVENT_COLS) داخل معاملة التغيير نفسها: لا تغيير بلا حدث ولا العكس."""
+    conn.executemany(
+        "INSERT INTO order_events(order_id, kind, status, payload) VALUES(?,?,?,?)",
+        [(r["id"], kind, r["status"], json.dumps(dict(r), ensure_ascii=False)) for r in rows],
     )
 
 
+def order_write(job: WriteJob) -> Any:
+    """كل كتابة على الطلبات: تُهمل صفوف الدفعة المجلوبة، وبعد COMMIT توقظ منتظري الأحداث."""
+    orders_changed()
+    try:
+        res = db_transaction(job).result()
+    finally:
+        # مرة ثانية بعد COMMIT: جلب مسبق جرى بين الزيادة الأولى والالتزام قرأ الصف القديم
+        # وسجّله بالجيل الجديد
+        orders_changed()
+    ORDER_FEED.notify()
+    return res
+
+
+def order_create(user_id: int, product_id: int, qty: int) -> int:
+    return order_create_once(user_id, product_id, qty, None)[0]
+
+
+def order_create_once(user_id: int, product_id: int, qty: int, idem_key: Optional[str]) -> Tuple[int, bool]:
+    """ينشئ الطلب مرة واحدة لكل idem_key؛ يعيد (رقم الطلب، هل أُنشئ الآن).
+
+    تكرار نفس المفتاح (ضغطتان على "تأكيد" أو تحديث أُعيد تسليمه) يعيد الطلب الأول.
+    """
+    def job(conn: sqlite3.Connection) -> Tuple[int, bool]:
+        if idem_key is not None:
+            row = conn.execute("SELECT id FROM orders WHERE idem_key=?", (idem_key,)).fetchone()
+            if row is not None:
+                return int(row["id"]), False
+        # السعر الحالي من الجدول داخل نفس المعاملة (لا من ذاكرة المنتجات)
+        row = conn.execute(
+            f"""
+            INSERT INTO orders(user_id, product_id, qty, total, status, idem_key)
+            SELECT ?, id, ?, price * ?, 'pending', ? FROM products WHERE id = ?
+            RETURNING {ORDER_EVENT_COLS}
+            """,
+            (user_id, qty, qty, idem_key, product_id),
+        ).fetchone()
+        if row is None:
+            raise ValueError("product not found")
+        order_events_append(conn, "created", [row])
+        return int(row["id"]), True
+    return order_write(job)
+
+
+def order_confirm_args(cq: types.CallbackQuery, sess: "UserSession") -> Optional[Tuple[int, int, str]]:
+    """(المنتج، الكمية، مفتاح التكرار) لضغطة "تأكيد"؛ None = لا شيء يُؤكَّد.
+
+    الزر يحمل المنتج والكمية و nonce شاشة التأكيد، فالمفتاح مشتق من بيانات التحديث المحفوظة في
+    update_log لا من الجلسة: ضغطة أُعيد تسليمها بعد إعادة التشغيل (والجلسة ضاعت) تُنشئ الطلب أو
+    تعيد نفسه. مع جلسة قائمة لا يُقبل إلا زر شاشة التأكيد الحالية.
+    """
+    parts = (cq.data or "").split(":")
+    if len(parts) == 5 and parts[2].isdigit() and parts[3].isdigit():
+        pid, qty, nonce = int(parts[2]), int(parts[3]), parts[4]
+        if not 0 < qty <= ORDER_QTY_MAX:
+            return None
+        if sess.state == State.NONE or sess.state == State.NEW_ORDER_CONFIRM and sess.data.get("idem") == nonce:
+            return pid, qty, f"{cq.from_user.id}:{nonce}"
+        return None
+    # زر بالصيغة القديمة (أُرسل قبل التحديث): البيانات في الجلسة فقط
+    if sess.state != State.NEW_ORDER_CONFIRM:
+        return None
+    nonce = sess.data.setdefault("idem", os.urandom(8).hex())
+    return int(sess.data.get("product_id", 0)), int(sess.data.get("qty", 0)), f"{cq.from_user.id}:{nonce}"
+
+
+# قرارات المعالجات المشتركة بين التشغيلين (هنا و bot_async): التحقق من المدخلات وانتقالات الجلسة.
+# المعالج نفسه في كل تشغيل يقتصر على الإدخال/الإخراج (الرد، القراءة عبر المنفذ).
+
+ORDER_QTY_MAX = 10000
+
+
+def qty_from_text(text: Optional[str], lang: str) -> Tuple[Optional[int], Optional[str]]:
+    """الكمية من نص المستخدم: (الكمية، None) أو (None، رسالة الخطأ)."""
+    text = (text or "").strip()
+    if not text.isdigit():
+        return None, MSG[lang].qty_invalid
+    qty = int(text)
+    if not 0 < qty <= ORDER_QTY_MAX:
+        return None, MSG[lang].qty_unreasonable
+    return qty, None
+
+
+def session_to_confirm(sess: "UserSession", qty: int) -> str:
+    """ينقل الجلسة إلى شاشة التأكيد؛ يعيد nonce زرّها (انظر order_confirm_args)."""
+    sess.state = State.NEW_ORDER_CONFIRM
+    sess.data["qty"] = qty
+    sess.data["idem"] = nonce = os.urandom(8).hex()
+    return nonce
+
+
+def order_id_from_text(text: Optional[str]) -> Optional[int]:
+    text = (text or "").strip()
+    return int(text) if text.isdigit() else None
+
+
+def order_visible(order: Optional[sqlite3.Row], user_id: int) -> bool:
+    # الطلب لصاحبه وللأدمن فقط
+    return bool(order) and (order["user_id"] == user_id or is_admin(user_id))
+
+
+def proof_file_id(msg: types.Message) -> Optional[str]:
+    if msg.photo:
+        return msg.photo[-1].file_id
+    if msg.document:
+        return msg.document.file_id
+    return None
+
+
+ORDER_SELECT = """
+    SELECT o.id, o.user_id, o.product_id, o.qty, o.total, o.status,
+           o.payment_file_id, o.created_at, o.updated_at,
+           p.name as product_name, p.price as unit_price
+    FROM orders o JOIN products p ON o.product_id = p.id
+"""
+
+
 def order_get(oid: int) -> Optional[sqlite3.Row]:
-    return db_fetchone(
-        """
-        SELECT o.id, o.user_id, o.product_id, o.qty, o.total, o.status,
-               o.payment_file_id, o.created_at, o.updated_at,
-               p.name as product_name, p.price as unit_price
-        FROM orders o JOIN products p ON o.product_id = p.id
-        WHERE o.id = ?
-        """,
-        (oid,),
-    )
+    hit, row = batch_order(oid)
+    if hit:
+        return row
+    return db_fetchone(ORDER_SELECT + " WHERE o.id = ?", (oid,))
 
 
 def orders_pending_ids() -> List[int]:
@@ -330,81 +2128,1609 @@ def orders_pending_ids() -> List[int]:
     return [int(r["id"]) for r in rows]
 
 
+def orders_page(before: int = 0, limit: int = 50, status: Optional[str] = None) -> List[sqlite3.Row]:
+    """صفحة طلبات من الأحدث إلى الأقدم قبل before (0 = من البداية)؛ keyset على (status, id)."""
+    where, params = ["o.id < ?"], [before or 2**63 - 1]
+    if status:
+        where.append("o.status = ?")
+        params.append(status)
+    return db_fetchall(
+        f"""
+        SELECT o.id, o.user_id, o.qty, o.total, o.status, o.payment_file_id, o.created_at, o.updated_at,
+               p.name AS product_name
+        FROM orders o LEFT JOIN products p ON o.product_id = p.id
+        WHERE {" AND ".join(where)}
+        ORDER BY o.id DESC LIMIT ?
+        """,
+        (*params, limit),
+    )
+
+
+def orders_pending_page(page: int, size: int = PENDING_PAGE_SIZE) -> Tuple[List[int], bool]:
+    rows = db_fetchall(
+        "SELECT id FROM orders WHERE status='pending' ORDER BY id DESC LIMIT ? OFFSET ?",
+        (size + 1, max(page, 0) * size),
+    )
+    ids = [int(r["id"]) for r in rows]
+    return ids[:size], len(ids) > size
+
+
+def order_decide(oid: int, status: str, admin_id: Optional[int] = None) -> Tuple[str, Any]:
+    """قرار على طلب معلّق فقط؛ يعيد ("ok"، المستخدم) أو سبب الرفض: ("missing"، None)،
+    ("decided"، الحالة الحالية) إن حُسم قبلُ، أو ("held"، الأدمن الحاجز) إن كان محجوزاً لأدمن آخر.
+
+    الفحص والتعديل في معاملة الكاتب نفسها: أدمنان يضغطان معاً (قبول ورفض) — ينجح الأول فقط،
+    ولا يصل المستخدم إشعاران متناقضان. admin_id=None (بلا حجز) يتجاوز فحص الحجز.
+    """
+    def job(conn: sqlite3.Connection) -> Tuple[str, Any]:
+        cur = conn.execute(
+            """
+            SELECT o.status, l.admin_id FROM orders o
+            LEFT JOIN review_leases l ON l.order_id = o.id AND l.expires_at >= ?
+            WHERE o.id = ?
+            """,
+            (time.time(), oid),
+        ).fetchone()
+        if cur is None:
+            return "missing", None
+        if cur["status"] != "pending":
+            return "decided", cur["status"]
+        if admin_id is not None and cur["admin_id"] is not None and int(cur["admin_id"]) != admin_id:
+            return "held", int(cur["admin_id"])
+        row = conn.execute(
+            f"UPDATE orders SET status=?, updated_at=datetime('now') WHERE id=? AND status='pending' "
+            f"RETURNING {ORDER_EVENT_COLS}",
+            (status, oid),
+        ).fetchone()
+        # القرار يُنهي حجز المراجعة في نفس المعاملة
+        conn.execute("DELETE FROM review_leases WHERE order_id=?", (oid,))
+        order_events_append(conn, "status", [row])
+        return "ok", int(row["user_id"])
+    return order_write(job)
+
+
 def order_set_status(oid: int, status: str) -> Optional[int]:
-    row = db_fetchone("SELECT user_id FROM orders WHERE id=?", (oid,))
-    if not row:
+    """يحسم طلباً معلّقاً؛ يعيد المستخدم، أو None إن لم يتغير شيء (غير موجود أو محسوم)."""
+    outcome, value = order_decide(oid, status)
+    return value if outcome == "ok" else None
+
+
+def orders_set_status(oids: List[int], status: str) -> List[Tuple[int, int]]:
+    """قرار واحد لعدة طلبات معلّقة في معاملة واحدة؛ يعيد [(رقم الطلب، المستخدم)] لما تغيّر فعلاً.
+
+    المحسوم مسبقاً يبقى كما هو (لا قرار ثانٍ ولا إشعار ثانٍ)، والقبول يشترط وصول إثبات الدفع.
+    """
+    marks = ",".join("?" * len(oids))
+    proof = " AND payment_file_id IS NOT NULL" if status == "accepted" else ""
+
+    def job(conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+        rows = conn.execute(
+            f"UPDATE orders SET status=?, updated_at=datetime('now') "
+            f"WHERE id IN ({marks}) AND status='pending'{proof} "
+            f"RETURNING {ORDER_EVENT_COLS}",
+            (status, *oids),
+        ).fetchall()
+        changed = [int(r["id"]) for r in rows]
+        if changed:
+            conn.execute(
+                f"DELETE FROM review_leases WHERE order_id IN ({','.join('?' * len(changed))})", changed
+            )
+        order_events_append(conn, "status", rows)
+        return [(int(r["id"]), int(r["user_id"])) for r in rows]
+    return order_write(job)
+
+
+def order_set_payment_file(oid: int, file_id: str) -> None:
+    # إثبات يصل بعد انتهاء مهلة الطلب يعيده إلى طابور المراجعة
+    def job(conn: sqlite3.Connection) -> None:
+        rows = conn.execute(
+            f"""
+            UPDATE orders SET payment_file_id=?, updated_at=datetime('now'),
+                   status=CASE WHEN status='expired' THEN 'pending' ELSE status END
+            WHERE id=?
+            RETURNING {ORDER_EVENT_COLS}
+            """,
+            (file_id, oid),
+        ).fetchall()
+        order_events_append(conn, "payment", rows)
+    order_write(job)
+
+
+def orders_expire_batch(cutoff: str, limit: int = ORDER_EXPIRE_BATCH) -> List[Tuple[int, int]]:
+    """ينهي حتى limit طلباً معلّقاً بلا إثبات أُنشئ قبل cutoff؛ يعيد [(رقم الطلب، المستخدم)]."""
+    def job(conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+        rows = conn.execute(
+            f"""
+            UPDATE orders SET status='expired', updated_at=datetime('now')
+            WHERE id IN (SELECT id FROM orders
+                         WHERE status='pending' AND created_at < ? AND payment_file_id IS NULL
+                         ORDER BY created_at LIMIT ?)
+            RETURNING {ORDER_EVENT_COLS}
+            """,
+            (cutoff, limit),
+        ).fetchall()
+        conn.executemany("DELETE FROM review_leases WHERE order_id=?", [(r["id"],) for r in rows])
+        order_events_append(conn, "status", rows)
+        return [(int(r["id"]), int(r["user_id"])) for r in rows]
+    return order_write(job)
+
+
+def stats_counts() -> Dict[str, int]:
+    # استعلام واحد بدل خمسة
+    row = db_fetchone(
+        """
+        SELECT (SELECT COUNT(*) FROM products) AS products,
+               COUNT(*) AS orders,
+               COALESCE(SUM(status='pending'), 0)  AS pending,
+               COALESCE(SUM(status='accepted'), 0) AS accepted,
+               COALESCE(SUM(status='rejected'), 0) AS rejected,
+               COALESCE(SUM(status='expired'), 0)  AS expired
+        FROM orders
+        """
+    )
+    return {k: int(row[k]) for k in row.keys()}
+
+
+def sales_version(product_id: int = 0) -> int:
+    """نسخة تجميع المبيعات لمنتج (0 = الكل): تتغير مع كل طلب جديد أو قبول/تراجع عنه."""
+    row = db_fetchone("SELECT version FROM sales_version WHERE product_id=?", (product_id,))
+    return int(row["version"]) if row else 0
+
+
+def sales_series(first_hour: int, buckets: int, bucket_hours: int,
+                 product_id: int = 0) -> List[Tuple[int, int, int, float]]:
+    """[(أول ساعة في العمود، طلبات، مقبولة، إيراد)] لـ buckets عموداً متتالياً من first_hour؛ الفارغ أصفار.
+
+    يقرأ صفوف sales_hourly في المدى فقط (ساعة × منتج)، لا جدول الطلبات.
+    """
+    sql = ("SELECT (hour - ?) / ? AS b, SUM(orders) AS orders, SUM(accepted) AS accepted, SUM(revenue) AS revenue "
+           "FROM sales_hourly WHERE hour >= ? AND hour < ?")
+    params: List[Any] = [first_hour, bucket_hours, first_hour, first_hour + buckets * bucket_hours]
+    if product_id:
+        sql += " AND product_id = ?"
+        params.append(product_id)
+    rows = {int(r["b"]): r for r in db_fetchall(sql + " GROUP BY b", tuple(params))}
+    series = []
+    for b in range(buckets):
+        r = rows.get(b)
+        series.append((first_hour + b * bucket_hours, int(r["orders"]) if r else 0,
+                       int(r["accepted"]) if r else 0, float(r["revenue"]) if r else 0.0))
+    return series
+
+
+# طابور المراجعة ---------------------------------------------------------------
+# "الطلب التالي" يحجز أقدم طلب معلّق غير محجوز داخل معاملة الكاتب الوحيد، فلا يحصل
+# أدمنان على نفس الطلب. الحجوزات المنتهية تُحذف عند كل طلب حجز فيعود الطلب للطابور.
+
+def review_claim_next(admin_id: int, lease: float = REVIEW_LEASE_SECONDS) -> Optional[int]:
+    def job(conn: sqlite3.Connection) -> Optional[int]:
+        now = time.time()
+        conn.execute("DELETE FROM review_leases WHERE expires_at < ?", (now,))
+        # أدمن لديه حجز قائم على طلب ما زال معلّقاً يكمل عليه بدل حجز طلب آخر
+        row = conn.execute(
+            """
+            SELECT l.order_id AS id FROM review_leases l JOIN orders o ON o.id = l.order_id
+            WHERE l.admin_id = ? AND o.status = 'pending' ORDER BY l.order_id LIMIT 1
+            """,
+            (admin_id,),
+        ).fetchone()
+        if row is None:
+            row = conn.execute(
+                """
+                SELECT o.id FROM orders o
+                WHERE o.status = 'pending'
+                  AND NOT EXISTS (SELECT 1 FROM review_leases l WHERE l.order_id = o.id)
+                ORDER BY o.id LIMIT 1
+                """
+            ).fetchone()
+        if row is None:
+            return None
+        oid = int(row["id"])
+        conn.execute(
+            "INSERT OR REPLACE INTO review_leases(order_id, admin_id, expires_at) VALUES(?,?,?)",
+            (oid, admin_id, now + lease),
+        )
+        return oid
+    return db_transaction(job).result()
+
+
+def review_claim(oid: int, admin_id: int, lease: float = REVIEW_LEASE_SECONDS) -> int:
+    """يحجز طلباً محدداً إن كان حراً؛ يعيد آي دي الأدمن الحاجز فعلياً."""
+    def job(conn: sqlite3.Connection) -> int:
+        now = time.time()
+        row = conn.execute(
+            "SELECT admin_id FROM review_leases WHERE order_id=? AND expires_at >= ?", (oid, now)
+        ).fetchone()
+        if row is not None and int(row["admin_id"]) != admin_id:
+            return int(row["admin_id"])
+        conn.execute(
+            "INSERT OR REPLACE INTO review_leases(order_id, admin_id, expires_at) VALUES(?,?,?)",
+            (oid, admin_id, now + lease),
+        )
+        return admin_id
+    return db_transaction(job).result()
+
+
+def review_queue_stats() -> Dict[str, int]:
+    row = db_fetchone(
+        """
+        SELECT COUNT(*) AS depth,
+               CAST(COALESCE((julianday('now') - julianday(MIN(created_at))) * 86400, 0) AS INTEGER) AS oldest_age,
+               (SELECT COUNT(*) FROM review_leases WHERE expires_at >= ?) AS leased
+        FROM orders WHERE status = 'pending'
+        """,
+        (time.time(),),
+    )
+    return {k: int(row[k]) for k in row.keys()}
+
+
+# ===================== مرحلة الدفعة (جلب مسبق) =====================
+# getUpdates يعيد حتى 100 تحديث؛ قبل توزيعها على الخيوط تُفحص الدفعة كاملة مرة واحدة:
+# المستخدمون الذين لا نعرف لغتهم أو أرسلوا /start، والطلبات المذكورة في أزرار المراجعة أو
+# في رقم يكتبه مستخدم ينتظر البوت منه رقم طلب. يُجلب كل ذلك باستعلامي IN، وتُحدَّث قائمة
+# المنتجات مرة للدفعة. المعالجات لا تتغير: order_get و ensure_user و user_lang تنظر في
+# سياق الدفعة (ContextVar — يعمل في خيوط المعالجة وفي مهام asyncio) قبل القاعدة.
+# صفوف الطلبات تُهمل إن عدّلت هذه العملية أي طلب بعد جلبها (Tenant.order_gen).
+
+BATCH_CTX: "contextvars.ContextVar[Optional[BatchContext]]" = contextvars.ContextVar("batch", default=None)
+_ORDER_CB_RE = re.compile(r"admin:(?:review|details):(\d+)")
+_ORDER_ID_STATES = (State.TRACK_WAIT_ID, State.SENDPROOF_WAIT_ORDER_ID)
+
+
+class BatchContext:
+    __slots__ = ("gen", "users", "order_ids", "orders")
+
+    def __init__(self, gen: int):
+        self.gen = gen
+        self.users: Dict[int, int] = {}              # user_id → blocked (المسجّلون فقط)
+        self.order_ids: set = set()                  # ما جُلب (الموجود وغير الموجود)
+        self.orders: Dict[int, sqlite3.Row] = {}
+
+
+def orders_changed() -> None:
+    current_tenant().order_gen += 1
+
+
+def batch_refs(updates: List[types.Update]) -> Tuple[Dict[int, Optional[str]], set]:
+    """{user_id: language_code} لمن يحتاج صفه من users، ومجموعة أرقام الطلبات المذكورة."""
+    users: Dict[int, Optional[str]] = {}
+    oids: set = set()
+    for u in updates:
+        obj = u.message or u.callback_query
+        if obj is None or obj.from_user is None:
+            continue
+        uid = obj.from_user.id
+        if isinstance(obj, types.CallbackQuery):
+            m = _ORDER_CB_RE.fullmatch(obj.data or "")
+            if m:
+                oids.add(int(m.group(1)))
+            starting = False
+        else:
+            text = (obj.text or "").strip()
+            if text.isdigit() and session_state(uid) in _ORDER_ID_STATES:
+                oids.add(int(text))
+            starting = text.startswith("/start")
+        if starting or cached_lang(uid) is None:
+            users[uid] = obj.from_user.language_code
+    return users, oids
+
+
+def batch_prefetch(updates: List[types.Update]) -> Optional[BatchContext]:
+    """ينفّذ الجلب المسبق لدفعة ويعيد سياقها (None إن لم تحتج الدفعة شيئاً من القاعدة)."""
+    if not BATCH_PREFETCH or not updates:
+        return None
+    PRODUCTS.all()
+    users, oids = batch_refs(updates)
+    if not users and not oids:
         return None
-    user_id = int(row["user_id"])
-    db_execute("UPDATE orders SET status=?, updated_at=datetime('now') WHERE id=?", (status, oid))
-    return user_id
+    ctx = BatchContext(current_tenant().order_gen)
+    if users:
+        ids = list(users)
+        rows = db_fetchall(f"SELECT user_id, lang, blocked FROM users WHERE user_id IN ({','.join('?' * len(ids))})",
+                           tuple(ids))
+        found = {int(r["user_id"]): r for r in rows}
+        for uid, hint in users.items():
+            r = found.get(uid)
+            if r is not None:
+                ctx.users[uid] = int(r["blocked"])
+            # نفس نتيجة user_lang: اللغة المحفوظة، وإلا لغة تطبيق تيليجرام
+            if cached_lang(uid) is None:
+                remember_lang(uid, lang_code(r["lang"] if r is not None else hint))
+    if oids:
+        ids = list(oids)
+        rows = db_fetchall(ORDER_SELECT + f" WHERE o.id IN ({','.join('?' * len(ids))})", tuple(ids))
+        ctx.order_ids.update(ids)
+        ctx.orders = {int(r["id"]): r for r in rows}
+    return ctx
+
+
+def batch_order(oid: int) -> Tuple[bool, Optional[sqlite3.Row]]:
+    """(True، الصف أو None) إن كان الطلب في سياق الدفعة الحالية وما زال صالحاً."""
+    ctx = BATCH_CTX.get()
+    if ctx is None or oid not in ctx.order_ids or ctx.gen != current_tenant().order_gen:
+        return False, None
+    current_tenant().metrics["batch_hits"] += 1
+    return True, ctx.orders.get(oid)
+
+
+def batch_known_user(user_id: int) -> bool:
+    """المستخدم مسجّل وغير محظور حسب سياق الدفعة: ensure_user لا يحتاج أي كتابة."""
+    ctx = BATCH_CTX.get()
+    return ctx is not None and ctx.users.get(user_id) == 0
+
+
+# ===================== نصوص الشاشات =====================
+# مشتركة بين التشغيل المتزامن (هذا الملف) والتشغيل غير المتزامن (bot_async.py)
+
+# نصوص المستخدم في MESSAGES (حسب لغته)؛ نصوص الأدمن هنا بالعربية
+
+def text_qty_prompt(prod: sqlite3.Row, lang: str = DEFAULT_LANG) -> str:
+    return MSG[lang].qty_prompt(name=prod["name"], price=money(prod["price"]))
+
+
+def text_confirm_order(prod: sqlite3.Row, qty: int, total: float, lang: str = DEFAULT_LANG) -> str:
+    return MSG[lang].confirm_order(name=prod["name"], qty=qty, total=money(total))
+
+
+def text_order_created(oid: int, lang: str = DEFAULT_LANG) -> str:
+    return MSG[lang].order_created(oid=oid)
+
+
+def text_order_decision(oid: int, status: str, lang: str = DEFAULT_LANG) -> str:
+    # إشعار المستخدم بقرار الأدمن (من تيليجرام أو من لوحة الويب)
+    return getattr(MSG[lang], "order_" + status)(oid=oid)
+
+
+def text_decide_refused(oid: int, outcome: str, value: Any) -> str:
+    # سبب رفض قرار الأدمن (order_decide)
+    if outcome == "held":
+        return f"⚠️ الطلب #{oid} قيد المراجعة من أدمن آخر ({value})."
+    if outcome == "decided":
+        return f"⚠️ الطلب #{oid} محسوم مسبقاً (الحالة: {value})."
+    return "غير موجود"
+
+
+def text_admin_new_order(order: sqlite3.Row, user: types.User) -> str:
+    return (
+        f"🚨 طلب جديد #{order['id']}\n"
+        f"المستخدم: <a href='tg://user?id={user.id}'>{user.first_name}</a> ({user.id})\n"
+        f"اللعبة: {order['product_name']}\n"
+        f"الكمية: {order['qty']}\n"
+        f"الإجمالي: {money(order['total'])}\n"
+        f"الحالة: {order['status']}\n"
+        f"التاريخ: {order['created_at']}"
+    )
+
+
+def text_track(order: sqlite3.Row, lang: str = DEFAULT_LANG) -> str:
+    m = MSG[lang]
+    return m.track(
+        oid=order["id"], name=order["product_name"], qty=order["qty"], total=money(order["total"]),
+        status=getattr(m, "status_" + order["status"]),
+        proof=m.proof_yes if order["payment_file_id"] else m.proof_no,
+        created=order["created_at"],
+    )
+
+
+def text_admin_review(order: sqlite3.Row) -> str:
+    return (
+        f"🧾 طلب #{order['id']}\n"
+        f"المستخدم: {order['user_id']}\n"
+        f"اللعبة: {order['product_name']}\n"
+        f"الكمية: {order['qty']}\n"
+        f"الإجمالي: {money(order['total'])}\n"
+        f"الحالة: {order['status']}\n"
+        f"تاريخ: {order['created_at']}"
+    )
+
+
+def text_admin_panel(q: Dict[str, int]) -> str:
+    age = q["oldest_age"]
+    age_txt = f"{age // 3600} س {age % 3600 // 60} د" if age >= 3600 else f"{age // 60} د {age % 60} ث"
+    return (
+        "🛠️ لوحة التحكم بالأدمن:\n\n"
+        f"📬 بانتظار المراجعة: <b>{q['depth']}</b> (قيد المراجعة الآن: {q['leased']})\n"
+        f"⏱️ أقدم طلب معلّق: {age_txt if q['depth'] else '—'}"
+    )
+
+
+def text_admin_details(order: sqlite3.Row) -> str:
+    proof = "✅" if order["payment_file_id"] else "—"
+    return (
+        f"تفاصيل كاملة لطلب #{order['id']}:\n\n"
+        f"المستخدم: {order['user_id']}\n"
+        f"اللعبة: {order['product_name']} (#{order['product_id']})\n"
+        f"سعر الوحدة: {money(order['unit_price'])}\n"
+        f"الكمية: {order['qty']}\n"
+        f"الإجمالي: {money(order['total'])}\n"
+        f"الحالة: {order['status']}\n"
+        f"إثبات الدفع: {proof}\n"
+        f"الإنشاء: {order['created_at']}\n"
+        f"آخر تحديث: {order['updated_at']}"
+    )
+
+
+def text_stats(counts: Dict[str, int], rs: Dict[str, int]) -> str:
+    return (
+        "📊 إحصائيات:\n"
+        f"المنتجات: {counts['products']}\n"
+        f"الطلبات: {counts['orders']} (قيد: {counts['pending']} / مقبول: {counts['accepted']}"
+        f" / مرفوض: {counts['rejected']} / منتهي: {counts['expired']})\n"
+        f"الشاشات: تعديل {rs['edits']} / إرسال {rs['sends']} / متجاوزة {rs['skipped']}"
+        f" / استدعاءات API موفّرة {rs['saved']}\n"
+        f"الإغراق: مسموح {FLOOD.stats['passed']} / مُبطّأ {FLOOD.stats['throttled']} / مكرر {FLOOD.stats['duplicates']}\n"
+        f"إشعارات الأدمن: فورية {NOTIFIER.stats['immediate']} / مطوية {NOTIFIER.stats['folded']} / ملخصات {NOTIFIER.stats['digests']}\n"
+        f"التحديثات: جديدة {UPDATE_LOG.stats['fresh']} / مكررة {UPDATE_LOG.stats['dup']} / مُستعادة {UPDATE_LOG.stats['replayed']}"
+    )
+
+
+# ===================== إشعارات الأدمن =====================
+
+def notify_admins(text: str, reply_markup: Optional[types.JsonSerializable] = None) -> None:
+    for aid in current_tenant().admin_ids:
+        try:
+            bot.send_message(aid, text, reply_markup=reply_markup)
+        except Exception as e:
+            log(f"[WARN] notify admin {aid} failed: {e}")
+
+
+# ملخصات الطلبات أثناء الذروة --------------------------------------------------
+
+@dataclass
+class _Digest:
+    new_orders: int = 0
+    new_total: float = 0.0
+    proofs: int = 0
+    order_ids: List[int] = None
+    since: float = 0.0
+
+    def __post_init__(self):
+        if self.order_ids is None:
+            self.order_ids = []
+
+
+class AdminNotifier:
+    """يمرّر أول الأحداث فوراً، وفوق المعدل يطوي "طلب جديد" و"إثبات دفع" في ملخص دوري لكل أدمن."""
+
+    DIGEST_BUTTONS = 5
+
+    def __init__(
+        self,
+        limit: int = NOTIFY_RATE_LIMIT,
+        window: float = NOTIFY_RATE_WINDOW,
+        interval: float = NOTIFY_DIGEST_INTERVAL,
+    ):
+        self.limit = limit
+        self.window = window
+        self.interval = interval
+        self._sent: Dict[int, "deque[float]"] = {}
+        self._digests: Dict[int, _Digest] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self.stats = {"immediate": 0, "folded": 0, "digests": 0}
+
+    def route(self, kind: str, oid: int, total: float = 0.0) -> List[int]:
+        """يعيد قائمة الأدمن الذين يُرسل لهم الحدث الآن؛ البقية يُضاف الحدث إلى ملخصهم."""
+        now = time.monotonic()
+        admins = current_tenant().admin_ids
+        immediate: List[int] = []
+        with self._lock:
+            for aid in admins:
+                sent = self._sent.setdefault(aid, deque())
+                while sent and now - sent[0] > self.window:
+                    sent.popleft()
+                if len(sent) < self.limit and aid not in self._digests:
+                    sent.append(now)
+                    immediate.append(aid)
+                    continue
+                dg = self._digests.get(aid)
+                if dg is None:
+                    dg = self._digests[aid] = _Digest(since=time.time())
+                if kind == "new":
+                    dg.new_orders += 1
+                    dg.new_total += total
+                else:
+                    dg.proofs += 1
+                if oid not in dg.order_ids:
+                    dg.order_ids.append(oid)
+            self.stats["immediate"] += len(immediate)
+            self.stats["folded"] += len(admins) - len(immediate)
+            if self._digests and self._flusher is None:
+                self._flusher = tenant_thread(self._flush_loop, name="admin-digest")
+                self._flusher.start()
+        return immediate
+
+    def take_digests(self) -> Dict[int, _Digest]:
+        with self._lock:
+            digests, self._digests = self._digests, {}
+        return digests
+
+    def _flush_loop(self) -> None:
+        stopped = current_tenant().stopped
+        while not stopped.wait(self.interval):
+            for aid, dg in self.take_digests().items():
+                try:
+                    bot.send_message(aid, text_admin_digest(dg), reply_markup=kb_admin_digest(dg))
+                    self.stats["digests"] += 1
+                except Exception as e:
+                    log(f"[WARN] digest to admin {aid} failed: {e}")
+
+
+def text_admin_digest(dg: _Digest) -> str:
+    minutes = max(1, round((time.time() - dg.since) / 60))
+    return (
+        f"📦 ملخص آخر {minutes} دقيقة (إشعارات مجمّعة بسبب كثرة الطلبات):\n"
+        f"طلبات جديدة: {dg.new_orders} — الإجمالي: {money(dg.new_total)}\n"
+        f"إثباتات دفع: {dg.proofs}\n"
+        f"طلبات معنية: {len(dg.order_ids)}"
+    )
+
+
+def kb_admin_digest(dg: _Digest) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup(row_width=3)
+    recent = dg.order_ids[-AdminNotifier.DIGEST_BUTTONS:][::-1]
+    kb.add(*(types.InlineKeyboardButton(f"#{oid}", callback_data=f"admin:review:{oid}") for oid in recent))
+    kb.add(types.InlineKeyboardButton("📬 مراجعة كل المعلّقة", callback_data="admin:list_pending:0"))
+    return kb
+
+
+NOTIFIER = tenant_local("notifier", lambda t: AdminNotifier())
+
+
+def notify_order_event(kind: str, oid: int, text: str, total: float = 0.0) -> None:
+    """kind = "new" أو "proof". يمر عبر NOTIFIER بدل إرسال رسالة كاملة لكل أدمن دائماً."""
+    markup = kb_order_review(oid)
+    for aid in NOTIFIER.route(kind, oid, total):
+        try:
+            bot.send_message(aid, text, reply_markup=markup)
+        except Exception as e:
+            log(f"[WARN] notify admin {aid} failed: {e}")
+
+
+# ===================== البث الجماعي =====================
+# المستلمون يُقرؤون دفعةً دفعة بترتيب user_id، وبعد كل دفعة تُحفظ نقطة التفتيش والعدادات
+# ومن حظر البوت في معاملة واحدة؛ بعد إعادة التشغيل يُستأنف البث من آخر دفعة محفوظة
+# (أسوأ حالة: إعادة إرسال دفعة واحدة). الإرسال يمر بمحدِّد معدل مشترك بين خيوط الإرسال.
+
+def broadcast_get(bid: int) -> Optional[sqlite3.Row]:
+    return db_fetchone("SELECT * FROM broadcasts WHERE id=?", (bid,))
+
+
+def broadcast_running() -> Optional[sqlite3.Row]:
+    return db_fetchone("SELECT * FROM broadcasts WHERE status='running' ORDER BY id LIMIT 1")
+
+
+def broadcast_create(admin_id: int, text: str, chat_id: int, message_id: int) -> int:
+    def job(conn: sqlite3.Connection) -> int:
+        total = conn.execute("SELECT COUNT(*) FROM users WHERE blocked = 0").fetchone()[0]
+        cur = conn.execute(
+            "INSERT INTO broadcasts(admin_id, text, total, chat_id, message_id) VALUES(?,?,?,?,?)",
+            (admin_id, text, total, chat_id, message_id),
+        )
+        return int(cur.lastrowid)
+    return db_transaction(job).result()
+
+
+def broadcast_checkpoint(bid: int, last_user_id: int, counts: Dict[str, int], blocked: List[int]) -> None:
+    def job(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "UPDATE broadcasts SET last_user_id=?, sent=?, blocked=?, failed=? WHERE id=?",
+            (last_user_id, counts["sent"], counts["blocked"], counts["failed"], bid),
+        )
+        conn.executemany("UPDATE users SET blocked=1 WHERE user_id=?", [(uid,) for uid in blocked])
+    db_transaction(job).result()
+
+
+def broadcast_finish(bid: int, status: str) -> None:
+    db_execute("UPDATE broadcasts SET status=? WHERE id=?", (status, bid))
+
+
+class RateLimiter:
+    """يوزّع الاستدعاءات على فترات ثابتة (1/rate) بين كل الخيوط."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def backoff(self, seconds: float) -> None:
+        # 429 من تيليجرام: لا يُرسل أحد قبل انقضاء retry_after
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+def send_limited(limiter: RateLimiter, user_id: int, text: str, retries: int = 3) -> str:
+    """يرسل عبر محدِّد المعدل ويحترم retry_after؛ يعيد sent أو blocked أو failed."""
+    for _ in range(retries):
+        limiter.wait()
+        try:
+            bot.send_message(user_id, text)
+            return "sent"
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                params = (e.result_json or {}).get("parameters") or {}
+                limiter.backoff(float(params.get("retry_after", 1)))
+                continue
+            # 403: حظر البوت أو حساب محذوف؛ 400 chat not found: لم يعد الحوار موجوداً
+            if e.error_code == 403 or "chat not found" in str(e.description).lower():
+                return "blocked"
+            return "failed"
+        except Exception:
+            return "failed"
+    return "failed"
+
+
+class Broadcaster:
+    RETRIES = 3
+
+    def __init__(self, rate: float = BROADCAST_RATE, concurrency: int = BROADCAST_CONCURRENCY,
+                 batch: int = BROADCAST_BATCH, progress_interval: float = BROADCAST_PROGRESS_INTERVAL):
+        self.limiter = RateLimiter(rate)
+        self.concurrency = concurrency
+        self.batch = batch
+        self.progress_interval = progress_interval
+        self.active: Optional[int] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def claim(self) -> bool:
+        """يحجز خانة البث قبل إنشاء صفه (active = 0: قيد التجهيز)؛ False إن كان هناك بث آخر.
+
+        الفحص والحجز تحت القفل نفسه: أدمنان يرسلان /broadcast معاً — ينشئ أحدهما صفاً فقط.
+        """
+        with self._lock:
+            if self.active is not None:
+                return False
+            self.active = 0
+            self._cancel.clear()
+            return True
+
+    def release(self) -> None:
+        # فشل التجهيز (المعاينة أو إنشاء الصف): تُحرَّر الخانة المحجوزة
+        with self._lock:
+            if self.active == 0:
+                self.active = None
+
+    def start(self, bid: int, claimed: bool = False) -> bool:
+        with self._lock:
+            if claimed and self.active == 0:
+                # /broadcast_stop أثناء التجهيز يبقى سارياً
+                self.active = bid
+            elif self.active is not None:
+                return False
+            else:
+                self.active = bid
+                self._cancel.clear()
+        tenant_thread(self._run, bid, name=f"broadcast-{bid}").start()
+        return True
+
+    def cancel(self) -> bool:
+        if self.active is None:
+            return False
+        self._cancel.set()
+        return True
+
+    def resume(self) -> None:
+        row = broadcast_running()
+        if row is not None:
+            log(f"[BC] resuming broadcast #{row['id']} after user {row['last_user_id']}")
+            self.start(int(row["id"]))
+
+    def _send(self, user_id: int, text: str) -> str:
+        return send_limited(self.limiter, user_id, text, self.RETRIES)
+
+    def _run(self, bid: int) -> None:
+        row = broadcast_get(bid)
+        counts = {k: int(row[k]) for k in ("sent", "blocked", "failed")}
+        last = int(row["last_user_id"])
+        started, done_at_start = time.monotonic(), sum(counts.values())
+        last_report = 0.0
+        status = "done"
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="broadcast-send")
+        # خيوط المجمّع لا ترث المستأجر: كل إرسال يجري داخل use_tenant وإلا خرج بتوكن البوت الافتراضي
+        tenant = current_tenant()
+        stopped = tenant.stopped
+
+        def send(uid: int) -> str:
+            with use_tenant(tenant):
+                return self._send(uid, row["text"])
+        try:
+            while True:
+                if stopped.is_set():
+                    # البوت أُوقف: تبقى الحالة running فيُستأنف البث إن عاد
+                    log(f"[BC] broadcast #{bid} paused: bot stopped")
+                    return
+                if self._cancel.is_set():
+                    status = "cancelled"
+                    break
+                ids = users_after(last, self.batch)
+                if not ids:
+                    break
+                results = list(pool.map(send, ids))
+                for r in results:
+                    counts[r] += 1
+                last = ids[-1]
+                broadcast_checkpoint(bid, last, counts, [uid for uid, r in zip(ids, results) if r == "blocked"])
+                now = time.monotonic()
+                if now - last_report >= self.progress_interval:
+                    last_report = now
+                    rate = (sum(counts.values()) - done_at_start) / max(now - started, 1e-6)
+                    self._report(row, counts, rate, None)
+            broadcast_finish(bid, status)
+            self._report(row, counts, 0.0, status)
+        except Exception:
+            # تبقى الحالة running: يُستأنف البث عند التشغيل القادم
+            traceback.print_exc()
+        finally:
+            pool.shutdown(wait=False)
+            with self._lock:
+                self.active = None
+
+    def _report(self, row: sqlite3.Row, counts: Dict[str, int], rate: float, status: Optional[str]) -> None:
+        text = text_broadcast_progress(int(row["id"]), int(row["total"]), counts, rate, status)
+        try:
+            bot.edit_message_text(text, row["chat_id"], row["message_id"])
+        except Exception as e:
+            if "message is not modified" not in str(e):
+                log(f"[WARN] broadcast progress: {e}")
+
+
+def text_broadcast_busy(active: Optional[int]) -> str:
+    ref = f"#{active}" if active else "قيد التجهيز"
+    return f"يوجد بث جارٍ ({ref}). أوقفه أولاً بـ /broadcast_stop"
+
+
+def text_broadcast_progress(bid: int, total: int, counts: Dict[str, int], rate: float,
+                            status: Optional[str] = None) -> str:
+    processed = sum(counts.values())
+    pct = 100 * processed / total if total else 100
+    head = {
+        None: f"📣 البث #{bid} جارٍ…",
+        "done": f"✅ اكتمل البث #{bid}",
+        "cancelled": f"⛔️ أُوقف البث #{bid}",
+    }[status]
+    lines = [
+        head,
+        f"التقدّم: {processed}/{total} ({pct:.0f}%)",
+        f"وصلت: {counts['sent']} / محظور: {counts['blocked']} / فشل: {counts['failed']}",
+    ]
+    if status is None and rate > 0:
+        eta = max(0, total - processed) / rate
+        lines.append(f"المعدل: {rate:.1f} رسالة/ث — المتبقي تقريباً: {math.ceil(eta / 60)} دقيقة")
+    return "\n".join(lines)
+
+
+TXT_BROADCAST_USAGE = (
+    "الاستخدام: /broadcast نص الرسالة\n"
+    "أو أرسل /broadcast رداً على رسالة لبث نصها.\n"
+    "لإيقاف البث الجاري: /broadcast_stop"
+)
+
+BROADCASTER = tenant_local("broadcaster", lambda t: Broadcaster())
+
+
+def broadcast_text_from(msg: types.Message) -> str:
+    parts = (msg.text or "").split(maxsplit=1)
+    if len(parts) > 1:
+        return parts[1].strip()
+    reply = msg.reply_to_message
+    if reply is not None:
+        return (reply.text or reply.caption or "").strip()
+    return ""
+
+
+# ===================== انتهاء الطلبات المعلّقة =====================
+# الطلبات التي لم يُرسل لها إثبات دفع خلال ORDER_EXPIRE_AFTER تصبح expired، فيبقى حجم
+# الطابور المعلّق متناسباً مع النشاط الفعلي لا مع التاريخ. كل دفعة UPDATE محدودة بمعاملة
+# قصيرة في الكاتب (لا تحجب بقية الكتابات)، وإشعارات المستخدمين تمر بمحدِّد معدل البث
+# نفسه — ميزانية إرسال واحدة للبوت — برسالة واحدة لكل مستخدم في كل دفعة.
+
+def text_orders_expired(oids: List[int], lang: str = DEFAULT_LANG) -> str:
+    m = MSG[lang]
+    return m.orders_expired(ids=m.list_sep.join(f"#{oid}" for oid in oids))
+
+
+def orders_expire(max_age: float = ORDER_EXPIRE_AFTER, batch: int = ORDER_EXPIRE_BATCH) -> Dict[str, int]:
+    """ينهي كل الطلبات المعلّقة الأقدم من max_age ثانية ويُبلغ أصحابها؛ يعيد العدادات."""
+    # created_at بتوقيت UTC بصيغة datetime('now')، فالمقارنة النصية مقارنة زمنية
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - max_age))
+    counts = {"expired": 0, "notified": 0}
+    while True:
+        rows = orders_expire_batch(cutoff, batch)
+        counts["expired"] += len(rows)
+        by_user: Dict[int, List[int]] = {}
+        for oid, uid in rows:
+            by_user.setdefault(uid, []).append(oid)
+        for uid, oids in by_user.items():
+            if send_limited(BROADCASTER.limiter, uid, text_orders_expired(oids, user_lang(uid))) == "sent":
+                counts["notified"] += 1
+        if len(rows) < batch:
+            return counts
+
+
+def order_expiry_scheduler(interval: float = ORDER_EXPIRE_INTERVAL, max_age: float = ORDER_EXPIRE_AFTER) -> None:
+    """خيط خلفي: فحص الطلبات المنتهية لكل بوت كل interval ثانية."""
+    if max_age <= 0:
+        return
+
+    def loop() -> None:
+        while True:
+            for tenant in TENANTS.all():
+                with use_tenant(tenant):
+                    try:
+                        res = orders_expire(max_age)
+                        if res["expired"]:
+                            log(f"[EXPIRE] {tenant.name}: {res['expired']} orders expired, "
+                                f"{res['notified']} users notified")
+                    except Exception as e:
+                        log(f"[EXPIRE] {tenant.name} failed: {e}")
+            time.sleep(interval)
+    threading.Thread(target=loop, name="order-expiry", daemon=True).start()
+
+
+# ===================== صندوق أحداث الطلبات (Outbox) =====================
+# كل كتابة على الطلبات تضيف حدثها إلى order_events في معاملتها (order_write)، فالأنظمة
+# اللاحقة (سكربت التنفيذ الذي يشحن الحسابات) تتابع الصندوق بمؤشر seq بدل مسح orders على
+# مؤقّت. المستهلك يطلب ما بعد مؤشره وينتظر (long-poll) إن لم يجد شيئاً؛ الكاتب يوقظه بعد
+# COMMIT مباشرة، وأثناء الانتظار لا يُقرأ الصندوق إلا إن غيّر اتصال آخر القاعدة (data_version، لكتابات app/).
+# التسليم "مرة على الأقل": تمرير after يؤكّد ما قبله، ومن يعود بلا after يبدأ من آخر تأكيد
+# فيستلم ما لم يؤكّده مرة أخرى. ما أكّده كل المستهلكين النشطين يُحذف (outbox_compactor).
+# المسارات /events على خادم الفحص الصحي، فالصندوق عبر HTTP لا يوجد إلا مع BOT_HEALTH_PORT
+# (الأحداث تُكتب دائماً؛ من دونه يتابعها سكربت في نفس العملية عبر outbox_poll).
+
+class OrderFeed:
+    """جرس لكل مستأجر: gen يزيد بعد كل COMMIT على الطلبات، وwait ينام حتى يتغيّر.
+
+    cursors نسخة من (acked, delivered) لكل مستهلك: تُقرأ من القاعدة مرة واحدة ثم تُحدَّث مع كل كتابة؛
+    touched وقت آخر كتابة لصف المستهلك (monotonic).
+    """
+
+    def __init__(self) -> None:
+        self.gen = 0
+        self.cursors: Dict[str, Tuple[int, int]] = {}
+        self.touched: Dict[str, float] = {}
+        self._cond = threading.Condition()
+
+    def notify(self) -> None:
+        with self._cond:
+            self.gen += 1
+            self._cond.notify_all()
+
+    def wait(self, seen: int, timeout: float) -> int:
+        with self._cond:
+            self._cond.wait_for(lambda: self.gen != seen, timeout)
+            return self.gen
+
+
+ORDER_FEED = tenant_local("order_feed", lambda t: OrderFeed())
+
+OUTBOX_CONSUMER_UPSERT = """
+INSERT INTO outbox_consumers(name, acked, delivered, redelivered) VALUES(?,?,?,?)
+ON CONFLICT(name) DO UPDATE SET acked = MAX(acked, excluded.acked), delivered = MAX(delivered, excluded.delivered),
+                                redelivered = redelivered + excluded.redelivered, seen_at = datetime('now')
+"""
+
+
+def order_events_after(seq: int, limit: int) -> List[Dict[str, Any]]:
+    rows = db_fetchall(
+        "SELECT seq, order_id, kind, status, payload, created_at FROM order_events WHERE seq > ? ORDER BY seq LIMIT ?",
+        (seq, limit),
+    )
+    return [{"seq": r["seq"], "order_id": r["order_id"], "kind": r["kind"], "status": r["status"],
+             "at": r["created_at"], "order": json.loads(r["payload"])} for r in rows]
+
+
+def outbox_cursor(consumer: str) -> Tuple[int, int]:
+    """(acked, delivered) للمستهلك؛ (0, 0) لمستهلك جديد يبدأ من أقدم حدث محفوظ."""
+    state = ORDER_FEED.cursors.get(consumer)
+    if state is None:
+        row = db_fetchone("SELECT acked, delivered FROM outbox_consumers WHERE name=?", (consumer,))
+        state = (int(row["acked"]), int(row["delivered"])) if row else (0, 0)
+        ORDER_FEED.cursors[consumer] = state
+    return state
+
+
+def outbox_poll(consumer: str, after: Optional[int] = None, limit: int = 100,
+                wait: float = 0.0) -> Tuple[List[Dict[str, Any]], int]:
+    """أحداث الطلبات بعد المؤشر after؛ يعيد (الأحداث، المؤشر التالي).
+
+    after يؤكّد كل ما seq <= after؛ None = من آخر تأكيد للمستهلك. إن لم يوجد جديد ينتظر حتى wait ثانية.
+    """
+    acked, delivered = outbox_cursor(consumer)
+    cursor = acked if after is None else max(after, 0)
+    limit = max(1, min(limit, OUTBOX_PAGE_MAX))
+    deadline = time.monotonic() + min(max(wait, 0.0), OUTBOX_WAIT_MAX)
+    # gen و data_version قبل القراءة: كتابة بين القراءة والانتظار لا تضيع
+    gen, version = ORDER_FEED.gen, db_data_version()
+    events = order_events_after(cursor, limit)
+    while not events:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        woke = ORDER_FEED.wait(gen, min(remaining, OUTBOX_RECHECK))
+        changed = db_data_version()
+        if woke == gen and changed == version:
+            # لا كتابة في هذه العملية ولا في غيرها: لا حاجة لقراءة الصندوق
+            continue
+        gen, version = woke, changed
+        events = order_events_after(cursor, limit)
+    last = events[-1]["seq"] if events else cursor
+    again = sum(1 for e in events if e["seq"] <= delivered)
+    # التأكيد قبل الرد: الطلب التالي (أو مستهلك أُعيد تشغيله) يرى المؤشر و delivered الجديدين
+    outbox_touch(consumer, cursor, last, again)
+    return events, last
+
+
+def outbox_touch(consumer: str, acked: int, delivered: int, again: int) -> None:
+    # صف المستهلك يُكتب فقط إن تقدّم مؤشراه أو أُعيد تسليم شيء — أو مرّ OUTBOX_TOUCH_INTERVAL
+    # (seen_at)؛ long-poll فارغ متكرر لا يكلّف الكاتب معاملة في كل دورة
+    old_acked, old_delivered = outbox_cursor(consumer)
+    stale = time.monotonic() - ORDER_FEED.touched.get(consumer, float("-inf")) >= OUTBOX_TOUCH_INTERVAL
+    if acked > old_acked or delivered > old_delivered or again or stale:
+        db_submit(OUTBOX_CONSUMER_UPSERT, (consumer, acked, delivered, again)).result()
+        ORDER_FEED.touched[consumer] = time.monotonic()
+    ORDER_FEED.cursors[consumer] = (max(old_acked, acked), max(old_delivered, delivered))
+
+
+def outbox_ack(consumer: str, seq: int) -> None:
+    """يؤكّد كل أحداث المستهلك حتى seq (لمن يعالج على دفعات ولا يطلب التالية فوراً)."""
+    outbox_touch(consumer, seq, 0, 0)
+
+
+def outbox_consumers() -> List[Dict[str, Any]]:
+    head = db_fetchone("SELECT COALESCE(MAX(seq), 0) AS head FROM order_events")["head"]
+    rows = db_fetchall("SELECT name, acked, delivered, redelivered, seen_at FROM outbox_consumers ORDER BY name")
+    return [dict(r, lag=max(0, head - r["acked"])) for r in rows]
+
+
+def outbox_compact(batch: int = OUTBOX_COMPACT_BATCH) -> int:
+    """يحذف ما أكّده كل مستهلك نشط، وما تجاوز OUTBOX_RETENTION مهما كان؛ يعيد عدد المحذوف.
+
+    مستهلك لم يظهر منذ OUTBOX_RETENTION لا يمنع الضغط. seq و created_at يتزايدان معاً، فالمحذوف
+    دائماً بادئة من أقدم الأحداث: دفعات من الرأس حتى تأتي دفعة ناقصة.
+    """
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - OUTBOX_RETENTION))
+    row = db_fetchone("SELECT MIN(acked) AS horizon FROM outbox_consumers WHERE seen_at >= ?", (cutoff,))
+    horizon = int(row["horizon"] or 0)
+
+    def job(conn: sqlite3.Connection) -> int:
+        return conn.execute(
+            """
+            DELETE FROM order_events
+            WHERE seq IN (SELECT seq FROM order_events ORDER BY seq LIMIT ?) AND (seq <= ? OR created_at < ?)
+            """,
+            (batch, horizon, cutoff),
+        ).rowcount
+    deleted = 0
+    while True:
+        n = db_transaction(job).result()
+        deleted += n
+        if n < batch:
+            return deleted
+
+
+def outbox_compactor(interval: float = OUTBOX_COMPACT_INTERVAL) -> None:
+    """خيط خلفي: ضغط صندوق الأحداث لكل بوت كل interval ثانية."""
+    def loop() -> None:
+        while True:
+            time.sleep(interval)
+            for tenant in TENANTS.all():
+                with use_tenant(tenant):
+                    try:
+                        n = outbox_compact()
+                        if n:
+                            log(f"[OUTBOX] {tenant.name}: {n} events compacted")
+                    except Exception as e:
+                        log(f"[OUTBOX] {tenant.name} compaction failed: {e}")
+    threading.Thread(target=loop, name="outbox-compact", daemon=True).start()
+
+
+# ===================== عرض الشاشات =====================
+# كل شاشة تُعرض إما بتعديل رسالة البوت الحالية أو بإرسال رسالة جديدة. نحتفظ ببصمة
+# آخر نص/لوحة عُرضت في كل (chat, message) فنتجاوز التعديلات التي لا تغيّر شيئاً،
+# ونختار بين التعديل والإرسال من حالة الرسالة المعروفة بدل انتظار الاستثناء.
+
+RENDER_CACHE_SIZE = 20000
+
+
+class ScreenRenderer:
+    def __init__(self, max_entries: int = RENDER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._last: "OrderedDict[Tuple[int, int], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        # saved = عدد استدعاءات API التي وُفّرت مقارنة بنمط edit ثم send عند الفشل
+        self.stats = {"edits": 0, "sends": 0, "skipped": 0, "fallbacks": 0, "saved": 0}
+
+    @staticmethod
+    def digest(text: str, reply_markup: Optional[types.JsonSerializable]) -> bytes:
+        markup = reply_markup.to_json() if reply_markup is not None else ""
+        return hashlib.blake2b(f"{text}\x00{markup}".encode("utf-8"), digest_size=16).digest()
+
+    def remember(self, chat_id: int, message_id: int, digest: bytes) -> None:
+        key = (chat_id, message_id)
+        with self._lock:
+            self._last[key] = digest
+            self._last.move_to_end(key)
+            while len(self._last) > self.max_entries:
+                self._last.popitem(last=False)
+
+    def forget(self, chat_id: int, message_id: int) -> None:
+        with self._lock:
+            self._last.pop((chat_id, message_id), None)
+
+    @staticmethod
+    def editable(message: types.Message) -> bool:
+        # edit_message_text يعمل فقط على الرسائل النصية (حد الـ 48 ساعة للحذف لا للتعديل؛
+        # أي رفض آخر من تيليجرام يعالجه edit_failed بالإرسال)
+        return getattr(message, "content_type", None) == "text"
+
+    def plan(
+        self,
+        message: types.Message,
+        text: str,
+        reply_markup: Optional[types.JsonSerializable] = None,
+    ) -> Tuple[str, bytes]:
+        """يقرّر "skip" أو "edit" أو "send" دون أي استدعاء للـ API."""
+        digest = self.digest(text, reply_markup)
+        with self._lock:
+            unchanged = self._last.get((message.chat.id, message.message_id)) == digest
+        if unchanged:
+            self.stats["skipped"] += 1
+            self.stats["saved"] += 1
+            return "skip", digest
+        if self.editable(message):
+            return "edit", digest
+        # نعرف مسبقاً أن التعديل سيفشل: نوفّر المحاولة الخاسرة
+        self.stats["saved"] += 1
+        return "send", digest
+
+    def edited(self, chat_id: int, message_id: int, digest: bytes) -> None:
+        self.remember(chat_id, message_id, digest)
+        self.stats["edits"] += 1
+
+    def edit_failed(self, chat_id: int, message_id: int, digest: bytes, err: Exception) -> bool:
+        """True إن اعتُبر التعديل ناجحاً ("message is not modified")؛ False = يجب الإرسال."""
+        description = getattr(err, "description", None) or str(err)
+        if "message is not modified" in description:
+            # المحتوى مطابق أصلاً (مثلاً بعد إعادة تشغيل): لا إرسال مكرر
+            self.remember(chat_id, message_id, digest)
+            self.stats["saved"] += 1
+            return True
+        log(f"[WARN] edit {chat_id}/{message_id} failed: {description}")
+        self.forget(chat_id, message_id)
+        self.stats["fallbacks"] += 1
+        return False
+
+    def sent(self, chat_id: int, message_id: int, digest: bytes) -> None:
+        self.remember(chat_id, message_id, digest)
+        self.stats["sends"] += 1
+
+    def show(
+        self,
+        message: types.Message,
+        text: str,
+        reply_markup: Optional[types.JsonSerializable] = None,
+    ) -> None:
+        chat_id, message_id = message.chat.id, message.message_id
+        action, digest = self.plan(message, text, reply_markup)
+        if action == "skip":
+            return
+        if action == "edit":
+            try:
+                bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+            except ApiTelegramException as e:
+                if self.edit_failed(chat_id, message_id, digest, e):
+                    return
+            else:
+                self.edited(chat_id, message_id, digest)
+                return
+        sent = bot.send_message(chat_id, text, reply_markup=reply_markup)
+        self.sent(chat_id, sent.message_id, digest)
+
+
+SCREENS = tenant_local("screens", lambda t: ScreenRenderer())
+
+
+def render_screen(message: types.Message, text: str, reply_markup: Optional[types.JsonSerializable] = None) -> None:
+    SCREENS.show(message, text, reply_markup)
+
+
+# ===================== التحليل الأدائي (/profile) =====================
+# محلّل بالعيّنات: خيط مؤقت يقرأ sys._current_frames() كل PROFILE_INTERVAL طوال النافذة
+# فقط، ثم يتوقف. لا sys.setprofile ولا أي خطّاف دائم، فلا كلفة إطلاقاً حين لا يعمل.
+# كل عيّنة تُنسب إلى أقرب معالج على المكدس، وإلى استعلام SQL إن كانت داخل دالة قاعدة بيانات.
+
+def handler_codes(tb: Any) -> set:
+    """كائنات الكود لكل المعالجات المسجّلة في bot (أو abot)."""
+    if isinstance(tb, TenantAttr):
+        tb = tb._target()
+    codes = set()
+    for name, value in vars(tb).items():
+        if name.endswith("_handlers") and isinstance(value, list):
+            for h in value:
+                fn = h.get("function") if isinstance(h, dict) else None
+                if fn is not None and hasattr(fn, "__code__"):
+                    codes.add(fn.__code__)
+    return codes
+
+
+def _frame_label(code: Any) -> str:
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _sql_label(sql: str) -> str:
+    return " ".join(sql.split())[:100]
+
+
+@dataclass
+class ProfileResult:
+    seconds: float
+    samples: int
+    interval: float
+    stacks: Counter
+    handlers: Counter
+    sql: Counter
+    lines: Counter
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self.running = False
+
+    def run(self, seconds: float, handlers: set) -> Optional[ProfileResult]:
+        """يأخذ العيّنات في الخيط الحالي لمدة seconds؛ None إن كان هناك تحليل جارٍ."""
+        with self._lock:
+            if self.running:
+                return None
+            self.running = True
+        try:
+            return self._sample(seconds, handlers)
+        finally:
+            self.running = False
+
+    def _sample(self, seconds: float, handlers: set) -> ProfileResult:
+        me = threading.get_ident()
+        names = {}
+        sql_codes = {db_fetchone.__code__, db_fetchall.__code__}
+        stacks: Counter = Counter()
+        by_handler: Counter = Counter()
+        by_sql: Counter = Counter()
+        by_line: Counter = Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + seconds
+        while time.monotonic() < deadline:
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                chain = []
+                handler = sql = None
+                leaf = frame
+                f = frame
+                while f is not None:
+                    code = f.f_code
+                    chain.append(_frame_label(code))
+                    if handler is None and code in handlers:
+                        handler = code.co_name
+                    if sql is None:
+                        if code in sql_codes or code.co_name == "job":
+                            q = f.f_locals.get("sql")
+                            sql = _sql_label(q) if isinstance(q, str) else _frame_label(code)
+                    f = f.f_back
+                chain.append(names.get(tid, str(tid)))
+                stacks[";".join(reversed(chain))] += 1
+                if handler is not None:
+                    by_handler[handler] += 1
+                    by_line[f"{_frame_label(leaf.f_code)}:{leaf.f_lineno}"] += 1
+                if sql is not None:
+                    by_sql[sql] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return ProfileResult(time.monotonic() - started, samples, self.interval, stacks, by_handler, by_sql, by_line)
+
+
+def text_profile_summary(res: ProfileResult, top: int = PROFILE_TOP) -> str:
+    # زمن العيّنة الفعلي (الفاصل + كلفة أخذها) — يحوّل عدد العيّنات إلى زمن تقريبي
+    per_sample = res.seconds / max(res.samples, 1)
+
+    def table(title: str, counter: Counter) -> List[str]:
+        rows = [f"▸ {title}"]
+        if not counter:
+            rows.append("—")
+        for label, n in counter.most_common(top):
+            rows.append(f"{n * per_sample * 1000:>7.0f} ms  {html.escape(label[:80])}")
+        return rows
+
+    lines = [f"🔬 تحليل {res.seconds:.1f} ث — {res.samples} عيّنة كل {res.interval * 1000:.0f} ms", ""]
+    lines += table("المعالجات", res.handlers) + [""]
+    lines += table("استعلامات SQL", res.sql) + [""]
+    lines += table("أسطر داخل المعالجات", res.lines)
+    return "<pre>" + "\n".join(lines) + "</pre>"
+
+
+def profile_collapsed(res: ProfileResult) -> bytes:
+    # صيغة flamegraph.pl / speedscope: "frame;frame;frame count" في كل سطر
+    return "".join(f"{stack} {n}\n" for stack, n in res.stacks.most_common()).encode("utf-8")
+
+
+PROFILER = SamplingProfiler()
+
+
+def profile_seconds_from(msg: types.Message, default: float = 10.0) -> float:
+    parts = (msg.text or "").split()
+    try:
+        seconds = float(parts[1]) if len(parts) > 1 else default
+    except ValueError:
+        seconds = default
+    return min(max(seconds, 1.0), PROFILE_MAX_SECONDS)
+
+
+def profile_and_report(chat_id: int, seconds: float, handlers: set) -> None:
+    """يعمل في خيط مستقل: يأخذ العيّنات ثم يرسل الملخص وملف المكدسات المطوية."""
+    res = PROFILER.run(seconds, handlers)
+    if res is None:
+        bot.send_message(chat_id, "يوجد تحليل جارٍ بالفعل.")
+        return
+    try:
+        bot.send_message(chat_id, text_profile_summary(res))
+        bot.send_document(
+            chat_id,
+            io.BytesIO(profile_collapsed(res)),
+            visible_file_name=f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded",
+            caption="flamegraph.pl أو speedscope.app",
+        )
+    except Exception as e:
+        log(f"[WARN] profile report failed: {e}")
+
+
+# ===================== النسخ الاحتياطي =====================
+# نسخة حيّة بواجهة SQLite backup من اتصال مستقل: يفتح الاتصال معاملة قراءة أولاً فتثبت
+# لقطة WAL واحدة طوال النسخ — الكاتب لا يُحجب (القرّاء لا يحجبون الكتّاب في WAL)، والنسخ
+# لا يُعاد من البداية عند كل COMMIT. النسخ يتم BACKUP_PAGES صفحة في كل خطوة مع استراحة.
+# الناتج: <bot>-<وقت>.db.gz + ملف .sha256 بصيغة sha256sum. الاستعادة:
+#   sha256sum -c <file>.sha256 && gunzip -c <file> > data.db
+
+_BACKUP_LOCK = threading.Lock()
+
+
+def backup_running() -> bool:
+    return _BACKUP_LOCK.locked()
+
+
+def backup_now(dest_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> Dict[str, Any]:
+    """ينسخ قاعدة بيانات المستأجر الحالي؛ يعيد المسار والحجمين والمدة و sha256."""
+    tenant = current_tenant()
+    with _BACKUP_LOCK:
+        os.makedirs(dest_dir, exist_ok=True)
+        started = time.monotonic()
+        name = f"{tenant.name}-{time.strftime('%Y%m%d-%H%M%S')}.db"
+        raw_path = os.path.join(dest_dir, name + ".tmp")
+        gz_path = os.path.join(dest_dir, name + ".gz")
+
+        try:
+            src = sqlite3.connect(tenant.db_path, isolation_level=None)
+            dst = sqlite3.connect(raw_path)
+            try:
+                src.execute("BEGIN")
+                src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # يثبّت اللقطة
+                # sleep= في sqlite3 يُستخدم فقط عند BUSY/LOCKED؛ الاستراحة بين الخطوات عبر progress
+                src.backup(dst, pages=BACKUP_PAGES, progress=lambda *_: time.sleep(BACKUP_SLEEP))
+                src.execute("COMMIT")
+                check = dst.execute("PRAGMA quick_check").fetchone()[0]
+                if check != "ok":
+                    raise sqlite3.DatabaseError(f"backup quick_check: {check}")
+            finally:
+                dst.close()
+                src.close()
+            copied = time.monotonic()
+
+            digest = hashlib.sha256()
+            with open(raw_path, "rb") as fin, open(gz_path + ".tmp", "wb") as raw_out:
+                with gzip.GzipFile(filename=name, mode="wb", fileobj=raw_out, compresslevel=6) as gz:
+                    for chunk in iter(lambda: fin.read(1 << 20), b""):
+                        gz.write(chunk)
+            with open(gz_path + ".tmp", "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            db_size = os.path.getsize(raw_path)
+            os.replace(gz_path + ".tmp", gz_path)
+        finally:
+            # نسخة فاشلة (قرص ممتلئ، quick_check) لا تترك ملفات مؤقتة بحجم القاعدة تتراكم في المجلد
+            for tmp in (raw_path, gz_path + ".tmp"):
+                try:
+                    os.remove(tmp)
+                except FileNotFoundError:
+                    pass
+        with open(gz_path + ".sha256", "w", encoding="utf-8") as f:
+            f.write(f"{digest.hexdigest()}  {os.path.basename(gz_path)}\n")
+
+        removed = backup_rotate(dest_dir, tenant.name, keep)
+        return {
+            "path": gz_path,
+            "db_size": db_size,
+            "gz_size": os.path.getsize(gz_path),
+            "sha256": digest.hexdigest(),
+            "copy_seconds": copied - started,
+            "seconds": time.monotonic() - started,
+            "removed": removed,
+        }
+
+
+def backup_rotate(dest_dir: str, prefix: str, keep: int) -> int:
+    # الأسماء تحوي الوقت بصيغة قابلة للترتيب، فالترتيب الأبجدي = الترتيب الزمني. الاسم كاملاً
+    # يجب أن يطابق <prefix>-<وقت>.db.gz: تدوير "eg" لا يمس نسخ "eg-north" في نفس المجلد
+    own = re.compile(re.escape(prefix) + r"-\d{8}-\d{6}\.db\.gz")
+    files = sorted(
+        path for path in glob.glob(os.path.join(glob.escape(dest_dir), f"{glob.escape(prefix)}-[0-9]*.db.gz"))
+        if own.fullmatch(os.path.basename(path))
+    )
+    old = files[:-keep] if keep > 0 else []
+    for path in old:
+        for p in (path, path + ".sha256"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+    return len(old)
+
+
+def text_backup_done(res: Dict[str, Any]) -> str:
+    return (
+        "💾 تم النسخ الاحتياطي\n"
+        f"الملف: <code>{html.escape(os.path.basename(res['path']))}</code>\n"
+        f"الحجم: {res['db_size'] / 2**20:.2f} MB ← {res['gz_size'] / 2**20:.2f} MB مضغوط\n"
+        f"المدة: {res['seconds']:.2f} ث (النسخ {res['copy_seconds']:.2f} ث)\n"
+        f"sha256: <code>{res['sha256'][:16]}…</code>"
+        + (f"\nحُذفت نسخ قديمة: {res['removed']}" if res["removed"] else "")
+    )
 
 
-def order_set_payment_file(oid: int, file_id: str) -> None:
-    db_execute(
-        "UPDATE orders SET payment_file_id=?, updated_at=datetime('now') WHERE id=?",
-        (file_id, oid),
-    )
+def backup_and_report(chat_id: int) -> None:
+    try:
+        res = backup_now()
+    except Exception as e:
+        log(f"[BACKUP] failed: {e}")
+        bot.send_message(chat_id, f"❌ فشل النسخ الاحتياطي: {html.escape(str(e))}")
+        return
+    log(f"[BACKUP] {res['path']} {res['gz_size']} bytes in {res['seconds']:.2f}s")
+    bot.send_message(chat_id, text_backup_done(res))
 
 
-# ===================== إشعارات الأدمن =====================
+def backup_scheduler(interval: float = BACKUP_INTERVAL) -> None:
+    """خيط خلفي: نسخة لكل بوت كل interval ثانية (أول نسخة بعد interval من الإقلاع)."""
+    if interval <= 0:
+        return
 
-def notify_admins(text: str, reply_markup: Optional[types.InlineKeyboardMarkup] = None) -> None:
-    for aid in ADMIN_IDS:
+    def loop() -> None:
+        while True:
+            time.sleep(interval)
+            for tenant in TENANTS.all():
+                with use_tenant(tenant):
+                    try:
+                        res = backup_now()
+                        log(f"[BACKUP] {res['path']} {res['gz_size']} bytes in {res['seconds']:.2f}s")
+                    except Exception as e:
+                        log(f"[BACKUP] {tenant.name} failed: {e}")
+    threading.Thread(target=loop, name="backup-scheduler", daemon=True).start()
+
+
+# ===================== رسوم المبيعات (/chart) =====================
+# /chart [24h|7d|30d|12w] [رقم المنتج]: إيراد الطلبات المقبولة وعدد الطلبات في كل عمود زمني (UTC).
+# البيانات من sales_hourly (يحدّثه قادح في نفس معاملة الطلب) فلا يُمسح جدول الطلبات.
+# الرسم بـ Pillow في CHART_POOL خارج خيط المعالج، ويُرفع مرة واحدة: file_id الناتج يُحفظ بمفتاح
+# (المدى، المنتج، نسخة التجميع، العمود الحالي)، والطلب المكرر يعيد إرسال file_id فقط — بلا رسم
+# ولا رفع. النسخة تتغير مع أي طلب جديد/قبول لهذا المنتج، والعمود الحالي يتغير بمرور الوقت.
+
+CHART_RANGES: Dict[str, Tuple[int, int, str]] = {  # المدى → (عدد الأعمدة، ساعات العمود، الوصف)
+    "24h": (24, 1, "آخر 24 ساعة"),
+    "7d": (7, 24, "آخر 7 أيام"),
+    "30d": (30, 24, "آخر 30 يوماً"),
+    "12w": (12, 168, "آخر 12 أسبوعاً"),
+}
+CHART_DEFAULT_RANGE = "7d"
+CHART_CACHE_SIZE = 128
+CHART_SIZE = (960, 540)
+
+# خيط واحد للرسم: طلبات متزامنة لا تتنافس على المعالج مع خيوط التحديثات
+CHART_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart")
+
+ChartKey = Tuple[str, int, int, int]
+ChartSeries = List[Tuple[int, int, int, float]]
+
+
+def chart_args(msg: types.Message) -> Tuple[str, int]:
+    """"/chart 30d 4" → ("30d", 4)؛ الترتيب حر وما لا يُفهم يُتجاهل."""
+    rng, pid = CHART_DEFAULT_RANGE, 0
+    for part in (msg.text or "").split()[1:]:
+        if part.lower() in CHART_RANGES:
+            rng = part.lower()
+        elif part.lstrip("#").isdigit():
+            pid = int(part.lstrip("#"))
+    return rng, pid
+
+
+def chart_key(rng: str, pid: int) -> ChartKey:
+    hours = CHART_RANGES[rng][1]
+    return rng, pid, sales_version(pid), int(time.time()) // 3600 // hours
+
+
+def chart_data(key: ChartKey) -> Tuple[ChartSeries, str, str]:
+    """(الأعمدة، عنوان الصورة، تعليق الرسالة) للمفتاح."""
+    rng, pid, _version, end = key
+    buckets, hours, label = CHART_RANGES[rng]
+    series = sales_series((end - buckets + 1) * hours, buckets, hours, pid)
+    if pid:
+        prod = product_get(pid)
+        name = prod["name"] if prod else f"#{pid}"
+    else:
+        name = "كل المنتجات"
+    orders, accepted, revenue = (sum(s[i] for s in series) for i in (1, 2, 3))
+    unit = {1: "hour", 24: "day"}.get(hours, "week")
+    # النص العربي لا يُشكَّل في Pillow: العنوان داخل الصورة باللاتينية، والاسم في التعليق
+    title = f"{f'Product #{pid}' if pid else 'All products'} - revenue and orders per {unit} (UTC)"
+    caption = (f"📈 {name} — {label}\n"
+               f"الطلبات: {orders} · المقبولة: {accepted} · الإيراد: {money(revenue)}")
+    return series, title, caption
+
+
+def render_sales_chart(series: ChartSeries, bucket_hours: int, title: str) -> bytes:
+    """PNG: الإيراد في الأعلى، والطلبات (الكل فاتح / المقبولة داكن) في الأسفل. يعمل في CHART_POOL."""
+    # يُستورد عند أول رسم لا عند الإقلاع (زمن الإقلاع محسوب في BOOT)
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = CHART_SIZE
+    left, right, top, bottom, gap = 70, 20, 36, 40, 30
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+    draw.text((left, 12), title, fill="black", font=font)
+    n = len(series)
+    slot = (width - left - right) / max(n, 1)
+    panel_h = (height - top - bottom - gap) // 2
+
+    def panel(y0: int, name: str, values: List[float], color: str,
+              inner: Optional[List[float]] = None, inner_color: str = "") -> None:
+        y1 = y0 + panel_h
+        vmax = max(values) or 1.0
+        draw.text((left, y0 - 14), name, fill="#444", font=font)
+        for frac in (0.0, 0.5, 1.0):
+            y = y1 - frac * (panel_h - 16)
+            draw.line([(left, y), (width - right, y)], fill="#ddd")
+            v = vmax * frac
+            draw.text((6, y - 6), f"{v:.0f}" if v >= 10 or v == 0 else f"{v:.1f}", fill="#666", font=font)
+        for i, v in enumerate(values):
+            x0 = left + i * slot + slot * 0.15
+            x1 = left + (i + 1) * slot - slot * 0.15
+            if v > 0:
+                draw.rectangle([x0, y1 - v / vmax * (panel_h - 16), x1, y1], fill=color)
+            if inner and inner[i] > 0:
+                draw.rectangle([x0, y1 - inner[i] / vmax * (panel_h - 16), x1, y1], fill=inner_color)
+
+    panel(top + 14, "Revenue ($, accepted orders)", [s[3] for s in series], "#2b6cb0")
+    panel(top + panel_h + gap, "Orders (all / accepted)", [float(s[1]) for s in series], "#9ac1e6",
+          [float(s[2]) for s in series], "#2f855a")
+    fmt = "%H:00" if bucket_hours == 1 else "%m-%d"
+    step = max(1, math.ceil(n / 12))
+    for i in range(0, n, step):
+        draw.text((left + i * slot + 2, height - bottom + 8),
+                  time.strftime(fmt, time.gmtime(series[i][0] * 3600)), fill="#444", font=font)
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+class ChartCache:
+    """file_id لكل رسم رُفع مرة، بمفتاح ChartKey (LRU). رسم واحد فقط لكل مفتاح في نفس الوقت:
+    من يطلب مفتاحاً يُرسم الآن ينتظر Future الرسم الجاري بدل أن يرسم ويرفع نسخة ثانية."""
+
+    def __init__(self, size: int = CHART_CACHE_SIZE):
+        self.size = size
+        self.items: "OrderedDict[ChartKey, Tuple[str, str]]" = OrderedDict()  # (file_id، التعليق)
+        self.pending: Dict[ChartKey, Future] = {}
+        self.stats = {"hits": 0, "renders": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key: ChartKey) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            hit = self.items.get(key)
+            if hit is not None:
+                self.items.move_to_end(key)
+                self.stats["hits"] += 1
+            return hit
+
+    def claim(self, key: ChartKey) -> Tuple[Future, bool]:
+        """Future الرسم لهذا المفتاح، و True إن كان على المستدعي أن يرسم (لا رسم جارٍ له)."""
+        with self._lock:
+            fut = self.pending.get(key)
+            if fut is not None:
+                return fut, False
+            fut = self.pending[key] = Future()
+            return fut, True
+
+    def resolve(self, key: ChartKey, fut: Future, value: Optional[Tuple[str, str]],
+                error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.pending.pop(key, None)
+            if value is not None:
+                # رسوم نفس المدى والمنتج بنسخة أو عمود أقدم لن تُطلب مجدداً
+                for old in [k for k in self.items if k[:2] == key[:2]]:
+                    del self.items[old]
+                self.items[key] = value
+                if len(self.items) > self.size:
+                    self.items.popitem(last=False)
+                self.stats["renders"] += 1
+        if value is not None:
+            fut.set_result(value)
+        else:
+            fut.set_exception(error or RuntimeError("chart failed"))
+
+
+CHARTS = tenant_local("charts", lambda t: ChartCache())
+
+
+def chart_and_report(chat_id: int, key: ChartKey) -> None:
+    """يعمل في خيط مستقل: يرسم ويرفع مرة واحدة لكل مفتاح، ثم يحفظ file_id."""
+    fut, owner = CHARTS.claim(key)
+    try:
+        if not owner:
+            file_id, caption = fut.result(timeout=120)
+            bot.send_photo(chat_id, file_id, caption=caption)
+            return
         try:
-            bot.send_message(aid, text, reply_markup=reply_markup)
+            series, title, caption = chart_data(key)
+            png = CHART_POOL.submit(render_sales_chart, series, CHART_RANGES[key[0]][1], title).result()
+            sent = bot.send_photo(chat_id, io.BytesIO(png), caption=caption)
+            value = (sent.photo[-1].file_id, caption)
         except Exception as e:
-            log(f"[WARN] notify admin {aid} failed: {e}")
+            CHARTS.resolve(key, fut, None, e)
+            raise
+        CHARTS.resolve(key, fut, value)
+    except Exception as e:
+        log(f"[CHART] failed: {e}")
+        bot.send_message(chat_id, f"❌ تعذّر رسم المخطط: {html.escape(str(e))}")
 
 
 # ===================== الأوامر العامة =====================
 
 @bot.message_handler(commands=["start"])
 def cmd_start(msg: types.Message):
-    ensure_user(msg.from_user.id, msg.from_user.username, msg.from_user.first_name)
-    clear_session(msg.from_user.id)
-    bot.send_message(
-        msg.chat.id,
-        (
-            "👋 أهلاً بك!\n\n"
-            "أنا بوت شحن الألعاب. اختر من القائمة بالأسفل:\n"
-            "- تصفّح الألعاب والأسعار\n"
-            "- إنشاء طلب شحن\n"
-            "- إرسال إثبات الدفع\n"
-            "- تتبّع حالة طلبك\n"
-        ),
-        reply_markup=kb_main(is_admin(msg.from_user.id)),
-    )
+    user = msg.from_user
+    ensure_user(user.id, user.username, user.first_name, user.language_code)
+    clear_session(user.id)
+    lang = lang_of(user)
+    bot.send_message(msg.chat.id, MSG[lang].start, reply_markup=kb_main(is_admin(user.id), lang))
 
 
 @bot.message_handler(commands=["help"])
 def cmd_help(msg: types.Message):
-    bot.send_message(
-        msg.chat.id,
-        (
-            "ℹ️ للمساعدة:\n"
-            "1) اطلع على الأسعار من \"قائمة الألعاب والأسعار\".\n"
-            "2) أنشئ طلب شحن وحدد الكمية.\n"
-            "3) حوّل المبلغ ثم أرسل صورة/ملف لإثبات الدفع مع رقم الطلب.\n"
-            "4) ستصلك نتيجة الطلب: قبول ✅ أو رفض ❌.\n"
-        ),
-        reply_markup=kb_main(is_admin(msg.from_user.id)),
-    )
+    lang = lang_of(msg.from_user)
+    bot.send_message(msg.chat.id, MSG[lang].help, reply_markup=kb_main(is_admin(msg.from_user.id), lang))
+
+
+@bot.message_handler(commands=["lang"])
+def cmd_lang(msg: types.Message):
+    lang = lang_of(msg.from_user)
+    bot.send_message(msg.chat.id, MSG[lang].lang_prompt, reply_markup=KB_LANG[lang])
 
 
 # ===================== مسارات المستخدم (Callback) =====================
 
 @bot.callback_query_handler(func=lambda c: c.data == "user:list_products")
 def cq_user_list_products(cq: types.CallbackQuery):
-    kb = kb_products_list()
-    try:
-        bot.edit_message_text(
-            "🛍️ الألعاب المتاحة وأسعارها:",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb,
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "🛍️ الألعاب المتاحة وأسعارها:", reply_markup=kb)
+    lang = lang_of(cq.from_user)
+    render_screen(cq.message, MSG[lang].products_title, kb_products_list(lang))
     bot.answer_callback_query(cq.id)
 
 
@@ -412,138 +3738,78 @@ def cq_user_list_products(cq: types.CallbackQuery):
 def cq_user_new_order(cq: types.CallbackQuery):
     sess = get_session(cq.from_user.id)
     sess.state = State.NEW_ORDER_WAIT_PRODUCT
-    kb = kb_products_list()
-    try:
-        bot.edit_message_text(
-            "اختر اللعبة المطلوبة:",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb,
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "اختر اللعبة المطلوبة:", reply_markup=kb)
+    lang = lang_of(cq.from_user)
+    render_screen(cq.message, MSG[lang].choose_product, kb_products_list(lang))
     bot.answer_callback_query(cq.id)
 
 
 @bot.callback_query_handler(func=lambda c: c.data.startswith("user:product:"))
 def cq_select_product(cq: types.CallbackQuery):
     sess = get_session(cq.from_user.id)
+    lang = lang_of(cq.from_user)
     if sess.state not in (State.NEW_ORDER_WAIT_PRODUCT, State.NEW_ORDER_WAIT_QTY):
-        bot.answer_callback_query(cq.id, "ابدأ من إنشاء طلب")
+        bot.answer_callback_query(cq.id, MSG[lang].start_new_order)
         return
     try:
         pid = int(cq.data.split(":")[-1])
     except Exception:
-        bot.answer_callback_query(cq.id, "خطأ في المنتج")
+        bot.answer_callback_query(cq.id, MSG[lang].product_error)
         return
     prod = product_get(pid)
     if not prod:
-        bot.answer_callback_query(cq.id, "المنتج غير موجود", show_alert=True)
+        bot.answer_callback_query(cq.id, MSG[lang].product_missing, show_alert=True)
         return
     sess.state = State.NEW_ORDER_WAIT_QTY
     sess.data["product_id"] = pid
-    kb = kb_back("user:new_order")
-    bot.edit_message_text(
-        (
-            f"🔢 أدخل الكمية المطلوبة لـ <b>{prod['name']}</b>\n"
-            f"السعر للوحدة: <b>{money(prod['price'])}</b>\n\n"
-            "أرسل رقماً فقط."
-        ),
-        chat_id=cq.message.chat.id,
-        message_id=cq.message.message_id,
-        reply_markup=kb,
-    )
+    render_screen(cq.message, text_qty_prompt(prod, lang), kb_back("user:new_order", lang))
     bot.answer_callback_query(cq.id)
 
 
-@bot.message_handler(func=lambda m: get_session(m.from_user.id).state == State.NEW_ORDER_WAIT_QTY)
+@bot.message_handler(func=lambda m: session_state(m.from_user.id) == State.NEW_ORDER_WAIT_QTY)
 def msg_qty_entered(msg: types.Message):
     sess = get_session(msg.from_user.id)
-    text = (msg.text or "").strip()
-    if not text.isdigit():
-        bot.send_message(msg.chat.id, "❌ الرجاء إرسال رقم صحيح للكمية.")
-        return
-    qty = int(text)
-    if qty <= 0 or qty > 10000:
-        bot.send_message(msg.chat.id, "❌ الكمية غير منطقية.")
+    lang = lang_of(msg.from_user)
+    qty, error = qty_from_text(msg.text, lang)
+    if qty is None:
+        bot.send_message(msg.chat.id, error)
         return
     pid = int(sess.data.get("product_id", 0))
     prod = product_get(pid)
     if not prod:
         clear_session(msg.from_user.id)
-        bot.send_message(msg.chat.id, "حدث خطأ: المنتج لم يعد موجوداً.")
+        bot.send_message(msg.chat.id, MSG[lang].product_gone)
         return
     total = float(prod["price"]) * qty
-    sess.state = State.NEW_ORDER_CONFIRM
-    sess.data["qty"] = qty
-    kb = types.InlineKeyboardMarkup()
-    kb.add(types.InlineKeyboardButton("✅ تأكيد الطلب", callback_data="user:confirm_order"))
-    kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="user:new_order"))
-    bot.send_message(
-        msg.chat.id,
-        (
-            f"📦 تأكيد الطلب:\n\n"
-            f"اللعبة: <b>{prod['name']}</b>\n"
-            f"الكمية: <b>{qty}</b>\n"
-            f"الإجمالي: <b>{money(total)}</b>\n\n"
-            "اضغط تأكيد لإرسال الطلب المعلّق."
-        ),
-        reply_markup=kb,
-    )
+    nonce = session_to_confirm(sess, qty)
+    bot.send_message(msg.chat.id, text_confirm_order(prod, qty, total, lang), reply_markup=kb_confirm_order(pid, qty, nonce, lang))
 
 
-@bot.callback_query_handler(func=lambda c: c.data == "user:confirm_order")
+@bot.callback_query_handler(func=lambda c: route_of(c) == "user:confirm_order")
 def cq_confirm_order(cq: types.CallbackQuery):
     sess = get_session(cq.from_user.id)
-    if sess.state != State.NEW_ORDER_CONFIRM:
-        bot.answer_callback_query(cq.id, "لا يوجد طلب للتأكيد")
+    lang = lang_of(cq.from_user)
+    args = order_confirm_args(cq, sess)
+    if args is None:
+        bot.answer_callback_query(cq.id, MSG[lang].nothing_to_confirm)
         return
-    pid = int(sess.data.get("product_id", 0))
-    qty = int(sess.data.get("qty", 0))
+    pid, qty, idem_key = args
     try:
-        oid = order_create(cq.from_user.id, pid, qty)
+        oid, created = order_create_once(cq.from_user.id, pid, qty, idem_key)
     except Exception as e:
         log(f"[ERR] create order: {e}")
-        bot.answer_callback_query(cq.id, "فشل إنشاء الطلب", show_alert=True)
+        bot.answer_callback_query(cq.id, MSG[lang].order_failed, show_alert=True)
         return
     order = order_get(oid)
     clear_session(cq.from_user.id)
 
-    # إشعار الأدمن
-    try:
-        notify_admins(
-            (
-                f"🚨 طلب جديد #{oid}\n"
-                f"المستخدم: <a href='tg://user?id={cq.from_user.id}'>{cq.from_user.first_name}</a> ({cq.from_user.id})\n"
-                f"اللعبة: {order['product_name']}\n"
-                f"الكمية: {order['qty']}\n"
-                f"الإجمالي: {money(order['total'])}\n"
-                f"الحالة: {order['status']}\n"
-                f"التاريخ: {order['created_at']}"
-            ),
-            kb_order_review(oid),
-        )
-    except Exception as e:
-        log(f"[WARN] notify admins failed: {e}")
-
-    kb = types.InlineKeyboardMarkup()
-    kb.add(types.InlineKeyboardButton("📸 إرسال إثبات الدفع", callback_data="user:send_proof"))
-    kb.add(types.InlineKeyboardButton("🔎 تتبّع حالة الطلب", callback_data="user:track_order"))
-    kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="back:main"))
+    # إشعار الأدمن (مرة واحدة فقط لكل طلب)
+    if created:
+        try:
+            notify_order_event("new", oid, text_admin_new_order(order, cq.from_user), float(order["total"]))
+        except Exception as e:
+            log(f"[WARN] notify admins failed: {e}")
 
-    try:
-        bot.edit_message_text(
-            f"✅ تم إنشاء طلبك بنجاح!\nرقم الطلب: <b>#{oid}</b>\nالرجاء تحويل المبلغ ثم إرسال إثبات الدفع مرفقاً برقم الطلب.",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb,
-        )
-    except Exception:
-        bot.send_message(
-            cq.message.chat.id,
-            f"✅ تم إنشاء طلبك بنجاح!\nرقم الطلب: <b>#{oid}</b>\nالرجاء تحويل المبلغ ثم إرسال إثبات الدفع مرفقاً برقم الطلب.",
-            reply_markup=kb,
-        )
+    render_screen(cq.message, text_order_created(oid, lang), KB_ORDER_CREATED[lang])
     bot.answer_callback_query(cq.id)
 
 
@@ -551,76 +3817,54 @@ def cq_confirm_order(cq: types.CallbackQuery):
 def cq_send_proof_entry(cq: types.CallbackQuery):
     sess = get_session(cq.from_user.id)
     sess.state = State.SENDPROOF_WAIT_ORDER_ID
-    try:
-        bot.edit_message_text(
-            "رجاء أرسل رقم الطلب (مثال: 123)",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_back("back:main"),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "رجاء أرسل رقم الطلب (مثال: 123)", reply_markup=kb_back("back:main"))
+    lang = lang_of(cq.from_user)
+    render_screen(cq.message, MSG[lang].ask_proof_order_id, kb_back("back:main", lang))
     bot.answer_callback_query(cq.id)
 
 
-@bot.message_handler(func=lambda m: get_session(m.from_user.id).state == State.SENDPROOF_WAIT_ORDER_ID)
+@bot.message_handler(func=lambda m: session_state(m.from_user.id) == State.SENDPROOF_WAIT_ORDER_ID)
 def msg_capture_order_id(msg: types.Message):
     sess = get_session(msg.from_user.id)
-    text = (msg.text or "").strip()
-    if not text.isdigit():
-        bot.send_message(msg.chat.id, "❌ الرجاء إرسال رقم الطلب بشكل صحيح.")
+    lang = lang_of(msg.from_user)
+    oid = order_id_from_text(msg.text)
+    if oid is None:
+        bot.send_message(msg.chat.id, MSG[lang].order_id_invalid)
         return
-    oid = int(text)
     order = order_get(oid)
-    if not order or (order["user_id"] != msg.from_user.id and not is_admin(msg.from_user.id)):
-        bot.send_message(msg.chat.id, "❌ لم يتم العثور على الطلب بهذا الرقم أو ليس تابعاً لك.")
+    if not order_visible(order, msg.from_user.id):
+        bot.send_message(msg.chat.id, MSG[lang].order_not_found)
         return
     sess.state = State.SENDPROOF_WAIT_MEDIA
     sess.data["order_id"] = oid
-    bot.send_message(
-        msg.chat.id,
-        "أرسل الآن صورة أو ملف لإثبات الدفع لهذا الطلب.",
-        reply_markup=kb_back("back:main"),
-    )
+    bot.send_message(msg.chat.id, MSG[lang].ask_proof_media, reply_markup=kb_back("back:main", lang))
 
 
 @bot.message_handler(content_types=["photo", "document"])
 def msg_receive_proof(msg: types.Message):
-    sess = get_session(msg.from_user.id)
-    if sess.state != State.SENDPROOF_WAIT_MEDIA:
+    if session_state(msg.from_user.id) != State.SENDPROOF_WAIT_MEDIA:
         return  # ignore media sent outside proof flow
+    sess = get_session(msg.from_user.id)
+    lang = lang_of(msg.from_user)
     oid = int(sess.data.get("order_id", 0))
     if not oid:
-        bot.send_message(msg.chat.id, "❌ خطأ داخلي. أعد العملية.")
+        bot.send_message(msg.chat.id, MSG[lang].internal_error)
         clear_session(msg.from_user.id)
         return
 
-    file_id: Optional[str] = None
-    if msg.photo:
-        file_id = msg.photo[-1].file_id
-    elif msg.document:
-        file_id = msg.document.file_id
-
+    file_id = proof_file_id(msg)
     if not file_id:
-        bot.send_message(msg.chat.id, "❌ الرجاء إرسال صورة أو ملف.")
+        bot.send_message(msg.chat.id, MSG[lang].proof_need_media)
         return
 
     order_set_payment_file(oid, file_id)
 
     # إشعار الأدمن بالإثبات
     try:
-        notify_admins(
-            text=f"📎 تم استلام إثبات دفع لطلب #{oid}",
-            reply_markup=kb_order_review(oid),
-        )
+        notify_order_event("proof", oid, f"📎 تم استلام إثبات دفع لطلب #{oid}")
     except Exception as e:
         log(f"[WARN] notify admins proof: {e}")
 
-    bot.send_message(
-        msg.chat.id,
-        f"✅ تم حفظ إثبات الدفع لطلب #{oid}. سيتم مراجعته قريباً.",
-        reply_markup=kb_main(is_admin(msg.from_user.id)),
-    )
+    bot.send_message(msg.chat.id, MSG[lang].proof_saved(oid=oid), reply_markup=kb_main(is_admin(msg.from_user.id), lang))
     clear_session(msg.from_user.id)
 
 
@@ -628,58 +3872,45 @@ def msg_receive_proof(msg: types.Message):
 def cq_track_order_entry(cq: types.CallbackQuery):
     sess = get_session(cq.from_user.id)
     sess.state = State.TRACK_WAIT_ID
-    try:
-        bot.edit_message_text(
-            "أدخل رقم الطلب للاستعلام عن حالته:",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_back("back:main"),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "أدخل رقم الطلب للاستعلام عن حالته:", reply_markup=kb_back("back:main"))
+    lang = lang_of(cq.from_user)
+    render_screen(cq.message, MSG[lang].ask_track_order_id, kb_back("back:main", lang))
     bot.answer_callback_query(cq.id)
 
 
-@bot.message_handler(func=lambda m: get_session(m.from_user.id).state == State.TRACK_WAIT_ID)
+@bot.message_handler(func=lambda m: session_state(m.from_user.id) == State.TRACK_WAIT_ID)
 def msg_track_lookup(msg: types.Message):
-    sess = get_session(msg.from_user.id)
-    text = (msg.text or "").strip()
-    if not text.isdigit():
-        bot.send_message(msg.chat.id, "❌ الرجاء إرسال رقم الطلب بشكل صحيح.")
+    lang = lang_of(msg.from_user)
+    oid = order_id_from_text(msg.text)
+    if oid is None:
+        bot.send_message(msg.chat.id, MSG[lang].order_id_invalid)
         return
-    oid = int(text)
     order = order_get(oid)
-    if not order or (order["user_id"] != msg.from_user.id and not is_admin(msg.from_user.id)):
-        bot.send_message(msg.chat.id, "❌ لا يوجد طلب بهذا الرقم أو ليس لك.")
+    if not order_visible(order, msg.from_user.id):
+        bot.send_message(msg.chat.id, MSG[lang].track_not_found)
     else:
-        proof_txt = "موجود" if order["payment_file_id"] else "غير مُرسل"
-        bot.send_message(
-            msg.chat.id,
-            (
-                f"🧾 تفاصيل الطلب #{oid}:\n"
-                f"اللعبة: {order['product_name']}\n"
-                f"الكمية: {order['qty']}\n"
-                f"الإجمالي: {money(order['total'])}\n"
-                f"الحالة الحالية: <b>{order['status']}</b>\n"
-                f"إثبات الدفع: {proof_txt}\n"
-                f"تاريخ الإنشاء: {order['created_at']}"
-            ),
-            reply_markup=kb_main(is_admin(msg.from_user.id)),
-        )
+        bot.send_message(msg.chat.id, text_track(order, lang), reply_markup=kb_main(is_admin(msg.from_user.id), lang))
     clear_session(msg.from_user.id)
 
 
 @bot.callback_query_handler(func=lambda c: c.data == "user:help")
 def cq_user_help(cq: types.CallbackQuery):
-    try:
-        bot.edit_message_text(
-            "إذا واجهت أي مشكلة، راسل الدعم من خلال إرسال /help أو ابدأ من /start.",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_back("back:main"),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "إذا واجهت أي مشكلة، راسل الدعم من خلال إرسال /help أو ابدأ من /start.", reply_markup=kb_back("back:main"))
+    lang = lang_of(cq.from_user)
+    render_screen(cq.message, MSG[lang].user_help, kb_back("back:main", lang))
+    bot.answer_callback_query(cq.id)
+
+
+@bot.callback_query_handler(func=lambda c: c.data == "user:lang")
+def cq_user_lang(cq: types.CallbackQuery):
+    lang = lang_of(cq.from_user)
+    render_screen(cq.message, MSG[lang].lang_prompt, KB_LANG[lang])
+    bot.answer_callback_query(cq.id)
+
+
+@bot.callback_query_handler(func=lambda c: c.data.startswith("lang:"))
+def cq_set_lang(cq: types.CallbackQuery):
+    lang = lang_code(cq.data.split(":", 1)[1])
+    set_user_lang(cq.from_user.id, lang)
+    render_screen(cq.message, MSG[lang].lang_set, kb_main(is_admin(cq.from_user.id), lang))
     bot.answer_callback_query(cq.id)
 
 
@@ -690,15 +3921,21 @@ def cq_admin_panel(cq: types.CallbackQuery):
     if not is_admin(cq.from_user.id):
         bot.answer_callback_query(cq.id, "ليست لديك صلاحية", show_alert=True)
         return
-    try:
-        bot.edit_message_text(
-            "🛠️ لوحة التحكم بالأدمن:",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_admin_panel(),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "🛠️ لوحة التحكم بالأدمن:", reply_markup=kb_admin_panel())
+    render_screen(cq.message, text_admin_panel(review_queue_stats()), kb_admin_panel())
+    bot.answer_callback_query(cq.id)
+
+
+@bot.callback_query_handler(func=lambda c: c.data == "admin:next")
+def cq_admin_next(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        bot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    oid = review_claim_next(cq.from_user.id)
+    order = order_get(oid) if oid else None
+    if not order:
+        bot.answer_callback_query(cq.id, "🎉 لا توجد طلبات بانتظار المراجعة", show_alert=True)
+        return
+    show_order_review(cq, order)
     bot.answer_callback_query(cq.id)
 
 
@@ -709,19 +3946,11 @@ def cq_admin_add_product(cq: types.CallbackQuery):
         return
     sess = get_session(cq.from_user.id)
     sess.state = State.ADD_PRODUCT_WAIT_NAME
-    try:
-        bot.edit_message_text(
-            "اكتب اسم اللعبة/المنتج:",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_back("admin:panel"),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "اكتب اسم اللعبة/المنتج:", reply_markup=kb_back("admin:panel"))
+    render_screen(cq.message, "اكتب اسم اللعبة/المنتج:", kb_back("admin:panel"))
     bot.answer_callback_query(cq.id)
 
 
-@bot.message_handler(func=lambda m: get_session(m.from_user.id).state == State.ADD_PRODUCT_WAIT_NAME)
+@bot.message_handler(func=lambda m: session_state(m.from_user.id) == State.ADD_PRODUCT_WAIT_NAME)
 def msg_admin_add_product_name(msg: types.Message):
     sess = get_session(msg.from_user.id)
     name = (msg.text or "").strip()
@@ -733,7 +3962,7 @@ def msg_admin_add_product_name(msg: types.Message):
     bot.send_message(msg.chat.id, "أدخل السعر (مثال: 3.5)", reply_markup=kb_back("admin:panel"))
 
 
-@bot.message_handler(func=lambda m: get_session(m.from_user.id).state == State.ADD_PRODUCT_WAIT_PRICE)
+@bot.message_handler(func=lambda m: session_state(m.from_user.id) == State.ADD_PRODUCT_WAIT_PRICE)
 def msg_admin_add_product_price(msg: types.Message):
     sess = get_session(msg.from_user.id)
     text = (msg.text or "").strip().replace(",", ".")
@@ -755,23 +3984,7 @@ def cq_admin_manage_products(cq: types.CallbackQuery):
     if not is_admin(cq.from_user.id):
         bot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
         return
-    rows = db_fetchall("SELECT id,name,price FROM products ORDER BY id DESC")
-    kb = types.InlineKeyboardMarkup(row_width=1)
-    if not rows:
-        kb.add(types.InlineKeyboardButton("لا توجد منتجات", callback_data="noop"))
-    else:
-        for r in rows:
-            kb.add(types.InlineKeyboardButton(f"{r['name']} — {money(r['price'])}", callback_data=f"admin:product:{r['id']}"))
-    kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="admin:panel"))
-    try:
-        bot.edit_message_text(
-            "إدارة المنتجات:",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb,
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "إدارة المنتجات:", reply_markup=kb)
+    render_screen(cq.message, "إدارة المنتجات:", kb_manage_products())
     bot.answer_callback_query(cq.id)
 
 
@@ -790,15 +4003,7 @@ def cq_admin_product_actions(cq: types.CallbackQuery):
         bot.answer_callback_query(cq.id, "غير موجود", show_alert=True)
         return
     text = f"المنتج: {prod['name']} — {money(prod['price'])}"
-    try:
-        bot.edit_message_text(
-            text,
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_product_actions(pid),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, text, reply_markup=kb_product_actions(pid))
+    render_screen(cq.message, text, kb_product_actions(pid))
     bot.answer_callback_query(cq.id)
 
 
@@ -815,19 +4020,11 @@ def cq_admin_edit_price(cq: types.CallbackQuery):
     sess = get_session(cq.from_user.id)
     sess.state = State.EDIT_PRICE_WAIT_VALUE
     sess.data["pid"] = pid
-    try:
-        bot.edit_message_text(
-            "أدخل السعر الجديد (مثال: 2.75)",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_back("admin:manage_products"),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "أدخل السعر الجديد (مثال: 2.75)", reply_markup=kb_back("admin:manage_products"))
+    render_screen(cq.message, "أدخل السعر الجديد (مثال: 2.75)", kb_back("admin:manage_products"))
     bot.answer_callback_query(cq.id)
 
 
-@bot.message_handler(func=lambda m: get_session(m.from_user.id).state == State.EDIT_PRICE_WAIT_VALUE)
+@bot.message_handler(func=lambda m: session_state(m.from_user.id) == State.EDIT_PRICE_WAIT_VALUE)
 def msg_admin_edit_price_commit(msg: types.Message):
     sess = get_session(msg.from_user.id)
     text = (msg.text or "").strip().replace(",", ".")
@@ -857,40 +4054,19 @@ def cq_admin_delete_product(cq: types.CallbackQuery):
         bot.answer_callback_query(cq.id, "غير صالح", show_alert=True)
         return
     product_delete(pid)
-    try:
-        bot.edit_message_text(
-            "🗑️ تم حذف المنتج.",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_admin_panel(),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "🗑️ تم حذف المنتج.", reply_markup=kb_admin_panel())
+    render_screen(cq.message, "🗑️ تم حذف المنتج.", kb_admin_panel())
     bot.answer_callback_query(cq.id)
 
 
-@bot.callback_query_handler(func=lambda c: c.data == "admin:list_pending")
+@bot.callback_query_handler(func=lambda c: c.data.startswith("admin:list_pending"))
 def cq_admin_list_pending(cq: types.CallbackQuery):
     if not is_admin(cq.from_user.id):
         bot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
         return
-    ids = orders_pending_ids()
-    kb = types.InlineKeyboardMarkup(row_width=1)
-    if not ids:
-        kb.add(types.InlineKeyboardButton("لا توجد طلبات معلّقة", callback_data="noop"))
-    else:
-        for oid in ids:
-            kb.add(types.InlineKeyboardButton(f"طلب #{oid}", callback_data=f"admin:review:{oid}"))
-    kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="admin:panel"))
-    try:
-        bot.edit_message_text(
-            "الطلبات المعلّقة:",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb,
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "الطلبات المعلّقة:", reply_markup=kb)
+    parts = cq.data.split(":")
+    page = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+    ids, has_more = orders_pending_page(page)
+    render_screen(cq.message, "الطلبات المعلّقة:", kb_pending_orders(ids, page, has_more))
     bot.answer_callback_query(cq.id)
 
 
@@ -908,24 +4084,17 @@ def cq_admin_review(cq: types.CallbackQuery):
     if not order:
         bot.answer_callback_query(cq.id, "الطلب غير موجود", show_alert=True)
         return
-    text = (
-        f"🧾 طلب #{order['id']}\n"
-        f"المستخدم: {order['user_id']}\n"
-        f"اللعبة: {order['product_name']}\n"
-        f"الكمية: {order['qty']}\n"
-        f"الإجمالي: {money(order['total'])}\n"
-        f"الحالة: {order['status']}\n"
-        f"تاريخ: {order['created_at']}"
-    )
-    try:
-        bot.edit_message_text(
-            text,
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_order_review(oid),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, text, reply_markup=kb_order_review(oid))
+    holder = review_claim(oid, cq.from_user.id) if order["status"] == "pending" else cq.from_user.id
+    show_order_review(cq, order, holder)
+    bot.answer_callback_query(cq.id)
+
+
+def show_order_review(cq: types.CallbackQuery, order: sqlite3.Row, holder: Optional[int] = None) -> None:
+    oid = int(order["id"])
+    text = text_admin_review(order)
+    if holder is not None and holder != cq.from_user.id:
+        text += f"\n\n⚠️ هذا الطلب قيد المراجعة حالياً من أدمن آخر ({holder})."
+    render_screen(cq.message, text, kb_order_review(oid))
 
     if order["payment_file_id"]:
         # حاول إرسال الصورة أولاً، وإن فشل أرسل كوثيقة
@@ -936,11 +4105,9 @@ def cq_admin_review(cq: types.CallbackQuery):
                 bot.send_document(cq.from_user.id, order["payment_file_id"], caption=f"إثبات دفع — طلب #{oid}")
             except Exception:
                 pass
-    bot.answer_callback_query(cq.id)
 
 
-@bot.callback_query_handler(func=lambda c: c.data.startswith("admin:accept:"))
-def cq_admin_accept(cq: types.CallbackQuery):
+def _admin_decide(cq: types.CallbackQuery, status: str, admin_text: str, answer: str) -> None:
     if not is_admin(cq.from_user.id):
         bot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
         return
@@ -949,54 +4116,26 @@ def cq_admin_accept(cq: types.CallbackQuery):
     except Exception:
         bot.answer_callback_query(cq.id, "غير صالح", show_alert=True)
         return
-    user_id = order_set_status(oid, "accepted")
-    if not user_id:
-        bot.answer_callback_query(cq.id, "غير موجود", show_alert=True)
+    outcome, user_id = order_decide(oid, status, cq.from_user.id)
+    if outcome != "ok":
+        bot.answer_callback_query(cq.id, text_decide_refused(oid, outcome, user_id), show_alert=True)
         return
     try:
-        bot.send_message(user_id, f"🎉 تم <b>قبول</b> طلبك #{oid}. شكرًا لك!")
+        bot.send_message(user_id, text_order_decision(oid, status, user_lang(user_id)))
     except Exception as e:
-        log(f"[WARN] notify user accept: {e}")
-    try:
-        bot.edit_message_text(
-            f"تم قبول الطلب #{oid}.",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_order_review(oid),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, f"تم قبول الطلب #{oid}.", reply_markup=kb_order_review(oid))
-    bot.answer_callback_query(cq.id, "✅ تم القبول")
+        log(f"[WARN] notify user {status}: {e}")
+    render_screen(cq.message, admin_text.format(oid=oid), kb_order_review(oid))
+    bot.answer_callback_query(cq.id, answer)
+
+
+@bot.callback_query_handler(func=lambda c: c.data.startswith("admin:accept:"))
+def cq_admin_accept(cq: types.CallbackQuery):
+    _admin_decide(cq, "accepted", "تم قبول الطلب #{oid}.", "✅ تم القبول")
 
 
 @bot.callback_query_handler(func=lambda c: c.data.startswith("admin:reject:"))
 def cq_admin_reject(cq: types.CallbackQuery):
-    if not is_admin(cq.from_user.id):
-        bot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
-        return
-    try:
-        oid = int(cq.data.split(":")[-1])
-    except Exception:
-        bot.answer_callback_query(cq.id, "غير صالح", show_alert=True)
-        return
-    user_id = order_set_status(oid, "rejected")
-    if not user_id:
-        bot.answer_callback_query(cq.id, "غير موجود", show_alert=True)
-        return
-    try:
-        bot.send_message(user_id, f"❌ تم <b>رفض</b> طلبك #{oid}. تواصل مع الدعم إن لزم.")
-    except Exception as e:
-        log(f"[WARN] notify user reject: {e}")
-    try:
-        bot.edit_message_text(
-            f"تم رفض الطلب #{oid}.",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_order_review(oid),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, f"تم رفض الطلب #{oid}.", reply_markup=kb_order_review(oid))
-    bot.answer_callback_query(cq.id, "❌ تم الرفض")
+    _admin_decide(cq, "rejected", "تم رفض الطلب #{oid}.", "❌ تم الرفض")
 
 
 @bot.callback_query_handler(func=lambda c: c.data.startswith("admin:details:"))
@@ -1013,28 +4152,7 @@ def cq_admin_details(cq: types.CallbackQuery):
     if not order:
         bot.answer_callback_query(cq.id, "غير موجود", show_alert=True)
         return
-    proof = "✅" if order["payment_file_id"] else "—"
-    text = (
-        f"تفاصيل كاملة لطلب #{order['id']}:\n\n"
-        f"المستخدم: {order['user_id']}\n"
-        f"اللعبة: {order['product_name']} (#{order['product_id']})\n"
-        f"سعر الوحدة: {money(order['unit_price'])}\n"
-        f"الكمية: {order['qty']}\n"
-        f"الإجمالي: {money(order['total'])}\n"
-        f"الحالة: {order['status']}\n"
-        f"إثبات الدفع: {proof}\n"
-        f"الإنشاء: {order['created_at']}\n"
-        f"آخر تحديث: {order['updated_at']}"
-    )
-    try:
-        bot.edit_message_text(
-            text,
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_order_review(oid),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, text, reply_markup=kb_order_review(oid))
+    render_screen(cq.message, text_admin_details(order), kb_order_review(oid))
     bot.answer_callback_query(cq.id)
 
 
@@ -1043,15 +4161,8 @@ def cq_admin_details(cq: types.CallbackQuery):
 @bot.callback_query_handler(func=lambda c: c.data == "back:main")
 def cq_back_main(cq: types.CallbackQuery):
     clear_session(cq.from_user.id)
-    try:
-        bot.edit_message_text(
-            "القائمة الرئيسية:",
-            chat_id=cq.message.chat.id,
-            message_id=cq.message.message_id,
-            reply_markup=kb_main(is_admin(cq.from_user.id)),
-        )
-    except Exception:
-        bot.send_message(cq.message.chat.id, "القائمة الرئيسية:", reply_markup=kb_main(is_admin(cq.from_user.id)))
+    lang = lang_of(cq.from_user)
+    render_screen(cq.message, MSG[lang].main_menu, kb_main(is_admin(cq.from_user.id), lang))
     bot.answer_callback_query(cq.id)
 
 
@@ -1066,19 +4177,88 @@ def cq_noop(cq: types.CallbackQuery):
 def cmd_stats(msg: types.Message):
     if not is_admin(msg.from_user.id):
         return
-    prod_count = db_fetchone("SELECT COUNT(*) c FROM products")["c"]
-    ord_count = db_fetchone("SELECT COUNT(*) c FROM orders")["c"]
-    pend_count = db_fetchone("SELECT COUNT(*) c FROM orders WHERE status='pending'")["c"]
-    acc_count = db_fetchone("SELECT COUNT(*) c FROM orders WHERE status='accepted'")["c"]
-    rej_count = db_fetchone("SELECT COUNT(*) c FROM orders WHERE status='rejected'")["c"]
-    bot.send_message(
-        msg.chat.id,
-        (
-            "📊 إحصائيات:\n"
-            f"المنتجات: {prod_count}\n"
-            f"الطلبات: {ord_count} (قيد: {pend_count} / مقبول: {acc_count} / مرفوض: {rej_count})"
-        ),
-    )
+    bot.send_message(msg.chat.id, text_stats(stats_counts(), SCREENS.stats))
+
+
+@bot.message_handler(commands=["chart"])
+def cmd_chart(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    key = chart_key(*chart_args(msg))
+    hit = CHARTS.get(key)
+    if hit is not None:
+        bot.send_photo(msg.chat.id, hit[0], caption=hit[1])
+        return
+    tenant_thread(chart_and_report, msg.chat.id, key, name="chart").start()
+
+
+@bot.message_handler(commands=["broadcast"])
+def cmd_broadcast(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    text = broadcast_text_from(msg)
+    if not text:
+        bot.send_message(msg.chat.id, TXT_BROADCAST_USAGE)
+        return
+    if not BROADCASTER.claim():
+        bot.send_message(msg.chat.id, text_broadcast_busy(BROADCASTER.active))
+        return
+    bid: Optional[int] = None
+    try:
+        try:
+            # المعاينة تتحقق أيضاً من صحة HTML قبل الإرسال للجميع
+            bot.send_message(msg.chat.id, text)
+        except ApiTelegramException as e:
+            bot.send_message(msg.chat.id, f"❌ تعذّر إرسال المعاينة: {e.description}", parse_mode=None)
+            return
+        progress = bot.send_message(msg.chat.id, "📣 جارٍ تجهيز البث…")
+        bid = broadcast_create(msg.from_user.id, text, msg.chat.id, progress.message_id)
+    finally:
+        if bid is None:
+            BROADCASTER.release()
+    BROADCASTER.start(bid, claimed=True)
+
+
+@bot.message_handler(commands=["broadcast_stop"])
+def cmd_broadcast_stop(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    if BROADCASTER.cancel():
+        bot.send_message(msg.chat.id, "سيتوقف البث بعد الدفعة الحالية.")
+    else:
+        bot.send_message(msg.chat.id, "لا يوجد بث جارٍ.")
+
+
+@bot.message_handler(commands=["profile"])
+def cmd_profile(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    if PROFILER.running:
+        bot.send_message(msg.chat.id, "يوجد تحليل جارٍ بالفعل.")
+        return
+    seconds = profile_seconds_from(msg)
+    bot.send_message(msg.chat.id, f"🔬 بدأ التحليل لمدة {seconds:.0f} ثانية…")
+    handlers = handler_codes(current_tenant().bot)
+    tenant_thread(profile_and_report, msg.chat.id, seconds, handlers, name="profiler").start()
+
+
+@bot.message_handler(commands=["backup"])
+def cmd_backup(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    if backup_running():
+        bot.send_message(msg.chat.id, "يوجد نسخ احتياطي جارٍ، حاول بعد قليل.")
+        return
+    bot.send_message(msg.chat.id, "💾 بدأ النسخ الاحتياطي…")
+    tenant_thread(backup_and_report, msg.chat.id, name="backup").start()
+
+
+@bot.message_handler(commands=["tenants"])
+def cmd_tenants(msg: types.Message):
+    # للمشغّل فقط: أدمن البوت الافتراضي يرى استهلاك كل البوتات
+    if current_tenant() is not DEFAULT_TENANT or not is_admin(msg.from_user.id):
+        return
+    bot.send_message(msg.chat.id, text_tenants(TENANTS.all()))
 
 
 @bot.message_handler(commands=["adddemo"])
@@ -1091,16 +4271,440 @@ def cmd_add_demo(msg: types.Message):
         ("CP Call of Duty", 1.49),
         ("Robux", 0.50),
     ]
-    for name, price in demo:
-        product_add(name, price)
+    # نرسلها دفعة واحدة إلى الكاتب وننتظر الجميع: معاملة واحدة بدل أربع
+    futures = [db_submit("INSERT INTO products(name, price) VALUES(?,?)", (name, price)) for name, price in demo]
+    for fut in futures:
+        fut.result()
+    PRODUCTS.invalidate()
     bot.send_message(msg.chat.id, "✅ تمت إضافة منتجات تجريبية.")
 
 
+# ===================== الإقلاع وفحوص الجاهزية =====================
+# كل مرحلة من الإقلاع تُقاس وتُطبع في سطر [BOOT] واحد. الـ polling يبدأ فوراً، والتدفئة تجري
+# في الخلفية: قراءة ملف القاعدة تسلسلياً (ذاكرة نظام التشغيل)، تحميل قائمة المنتجات ولوحاتها،
+# لغات آخر المشترين، ثم في كل خيط عامل اتصال قراءة يمر على الفهارس الساخنة وجلسة HTTP إلى
+# تيليجرام (TCP+TLS) جاهزة — فلا يدفع أول مستخدمين بعد النشر كلفة كل ذلك.
+# /healthz (liveness): الكاتب حي والـ polling لم يتوقف. /readyz (readiness): انتهت التدفئة.
+
+WARM_QUERIES = (
+    "SELECT count(*) FROM orders INDEXED BY idx_orders_status_id WHERE status = 'pending'",
+    "SELECT id, user_id, status FROM orders ORDER BY id DESC LIMIT 500",
+    "SELECT count(*) FROM products",
+)
+
+
+class BootClock:
+    def __init__(self, t0: Optional[float] = None):
+        self.t0 = self.last = time.perf_counter() if t0 is None else t0
+        self.phases: List[Tuple[str, float]] = []
+        self.ready = threading.Event()
+        self.first_update: Optional[float] = None
+        self.last_poll: Optional[float] = None
+        self.warm: Dict[str, Any] = {}
+
+    def mark(self, name: str) -> None:
+        """ينهي مرحلة متسلسلة: مدتها = الزمن منذ العلامة السابقة."""
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def add(self, name: str, seconds: float) -> None:
+        # مرحلة تجري بالتوازي (التدفئة): مدتها الفعلية لا الفارق عن آخر علامة
+        self.phases.append((name, seconds))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def summary(self) -> str:
+        parts = " · ".join(f"{name} {sec * 1000:.0f}ms" for name, sec in self.phases)
+        return f"{parts} (total {self.elapsed() * 1000:.0f}ms)"
+
+    def update_done(self) -> None:
+        if self.first_update is None:
+            self.first_update = self.elapsed()
+            log(f"[BOOT] first update handled {self.first_update * 1000:.0f}ms after start")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "uptime": round(self.elapsed(), 3),
+            "phases_ms": {name: round(sec * 1000, 1) for name, sec in self.phases},
+            "first_update_ms": None if self.first_update is None else round(self.first_update * 1000, 1),
+            "warm": self.warm,
+        }
+
+
+BOOT = BootClock(BOOT_T0)
+
+
+def warm_file(path: str, limit: int = WARM_READ_MAX) -> int:
+    """قراءة تسلسلية لملف القاعدة وملف WAL: صفحاتهما في ذاكرة نظام التشغيل قبل أول استعلام."""
+    total = 0
+    for name in (path, path + "-wal"):
+        try:
+            with open(name, "rb", buffering=0) as f:
+                while total < limit:
+                    chunk = f.read(1 << 20)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+        except OSError:
+            pass
+    return total
+
+
+def warm_reader() -> None:
+    """يفتح اتصال القراءة لهذا الخيط ويمر على الصفحات التي يقرؤها المسار الساخن."""
+    for sql in WARM_QUERIES:
+        db_fetchall(sql)
+
+
+def warm_langs(limit: int = WARM_LANG_USERS) -> int:
+    rows = db_fetchall(
+        "SELECT user_id, lang FROM users WHERE user_id IN "
+        "(SELECT user_id FROM orders ORDER BY id DESC LIMIT ?)",
+        (limit,),
+    )
+    for r in rows:
+        remember_lang(int(r["user_id"]), lang_code(r["lang"]))
+    return len(rows)
+
+
+def warm_data() -> Dict[str, Any]:
+    """التدفئة المشتركة بين التشغيلين: الملف، قائمة المنتجات ولوحاتها، لغات المستخدمين."""
+    stats: Dict[str, Any] = {"file_mb": round(warm_file(current_tenant().db_path) / (1 << 20), 1)}
+    PRODUCTS.invalidate()
+    for lang in LANGS:
+        kb_products_list(lang)
+    stats["products"] = len(PRODUCTS.all())
+    stats["langs"] = warm_langs()
+    return stats
+
+
+def warm_pool(pool: ThreadPoolExecutor, threads: int, fn: Callable[[], Any]) -> int:
+    """ينفّذ fn مرة في كل خيط من pool (حاجز يمنع أن يأخذ خيط واحد مهمتين)."""
+    tenant = current_tenant()
+    barrier = threading.Barrier(threads)
+
+    def task() -> None:
+        with use_tenant(tenant):
+            try:
+                barrier.wait(5.0)
+            except threading.BrokenBarrierError:
+                pass
+            fn()
+    ok = 0
+    for fut in [pool.submit(task) for _ in range(threads)]:
+        try:
+            fut.result()
+            ok += 1
+        except Exception as e:
+            log(f"[BOOT] warm-up task failed: {e}")
+    return ok
+
+
+def warm_up(clock: Optional[BootClock] = None) -> Dict[str, Any]:
+    started = time.perf_counter()
+    stats = warm_data()
+
+    def worker() -> None:
+        warm_reader()
+        bot.get_me()
+    stats["workers"] = warm_pool(WORKER_POOL, BOT_WORKERS, worker)
+    if clock is not None:
+        clock.add("warm_up", time.perf_counter() - started)
+        clock.warm = stats
+    return stats
+
+
+def warm_up_in_background(clock: Optional[BootClock] = None) -> threading.Thread:
+    """تدفئة المستأجر الحالي في خيط؛ مع clock تُعلَن الجاهزية عند انتهائها."""
+    tenant = current_tenant()
+
+    def run() -> None:
+        try:
+            stats = warm_up(clock)
+        except Exception as e:
+            log(f"[BOOT] {tenant.name}: warm-up failed: {e}")
+            stats = {}
+        if clock is None:
+            log(f"[BOOT] {tenant.name} warm: {stats}")
+        else:
+            clock.ready.set()
+            log(f"[BOOT] {tenant.name} ready: {clock.summary()} {stats}")
+    t = tenant_thread(run, name=f"warm-{tenant.name}")
+    t.start()
+    return t
+
+
+# فحوص العملية: مسار → دالة تعيد (رمز HTTP، جسم JSON)
+HealthRoute = Callable[[Dict[str, str]], Tuple[int, Any]]
+
+
+def health_live(_query: Dict[str, str]) -> Tuple[int, Any]:
+    writer_ok = DEFAULT_TENANT.writer.alive() if "writer" in DEFAULT_TENANT.__dict__ else False
+    poll_age = None if BOOT.last_poll is None else time.monotonic() - BOOT.last_poll
+    ok = writer_ok and (poll_age is None or poll_age < HEALTH_POLL_STALE)
+    body = {"status": "ok" if ok else "fail", "writer": writer_ok,
+            "last_poll_s": None if poll_age is None else round(poll_age, 1)}
+    return (200 if ok else 503), body
+
+
+def health_ready(_query: Dict[str, str]) -> Tuple[int, Any]:
+    ready = BOOT.ready.is_set() and health_live(_query)[0] == 200
+    return (200 if ready else 503), dict(BOOT.as_dict(), status="ready" if ready else "starting")
+
+
+def health_metrics(_query: Dict[str, str]) -> Tuple[int, Any]:
+    """عدادات كل مستأجر (التحديثات، القراءات، مهام الكاتب والتزاماته، إصابات سياق الدفعة، المُسقط)،
+    وحالة التحكم بالقبول لكل صنف تحت "admission"."""
+    body: Dict[str, Any] = {}
+    for t in TENANTS.all():
+        w = t.__dict__.get("writer")
+        body[t.name] = dict(t.metrics, writes=w.stats["jobs"] if w else 0, commits=w.stats["commits"] if w else 0)
+    body["admission"] = ADMISSION.as_dict()
+    return 200, body
+
+
+def _outbox_args(query: Dict[str, str]) -> Tuple[Optional[Tenant], str]:
+    name = query.get("tenant", DEFAULT_TENANT.name)
+    return next((t for t in TENANTS.all() if t.name == name), None), query.get("consumer", "")
+
+
+def health_events(query: Dict[str, str]) -> Tuple[int, Any]:
+    """/events?consumer=…[&after=seq][&limit=100][&wait=25][&tenant=…] — long-poll على صندوق الأحداث.
+
+    المستهلك يعالج events ثم يطلب after=next، فيؤكّد ما عالجه ويستلم التالي في طلب واحد."""
+    tenant, consumer = _outbox_args(query)
+    if tenant is None or not consumer:
+        return 400, {"error": "consumer and a known tenant are required"}
+    try:
+        after = int(query["after"]) if "after" in query else None
+        limit, wait = int(query.get("limit", 100)), float(query.get("wait", 0))
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    with use_tenant(tenant):
+        events, nxt = outbox_poll(consumer, after, limit, wait)
+    return 200, {"events": events, "next": nxt}
+
+
+def health_events_ack(query: Dict[str, str]) -> Tuple[int, Any]:
+    tenant, consumer = _outbox_args(query)
+    if tenant is None or not consumer or not query.get("seq", "").isdigit():
+        return 400, {"error": "consumer, seq and a known tenant are required"}
+    with use_tenant(tenant):
+        outbox_ack(consumer, int(query["seq"]))
+    return 200, {"acked": int(query["seq"])}
+
+
+def health_events_consumers(query: Dict[str, str]) -> Tuple[int, Any]:
+    tenant, _consumer = _outbox_args(query)
+    if tenant is None:
+        return 400, {"error": "unknown tenant"}
+    with use_tenant(tenant):
+        return 200, {"consumers": outbox_consumers()}
+
+
+HEALTH_ROUTES: Dict[str, HealthRoute] = {
+    "/healthz": health_live,
+    "/readyz": health_ready,
+    "/metrics": health_metrics,
+    "/events": health_events,
+    "/events/ack": health_events_ack,
+    "/events/consumers": health_events_consumers,
+}
+# بيانات الطلبات وتأكيدها: للعملية على نفس الجهاز فقط حتى لو كان الخادم على 0.0.0.0
+HEALTH_LOCAL_ONLY = {"/events", "/events/ack", "/events/consumers"}
+
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        parts = urllib.parse.urlsplit(self.path)
+        route = HEALTH_ROUTES.get(parts.path)
+        if route is None:
+            code, body = 404, {"error": "not found"}
+        elif parts.path in HEALTH_LOCAL_ONLY and not ipaddress.ip_address(self.client_address[0]).is_loopback:
+            code, body = 403, {"error": "local consumers only"}
+        else:
+            try:
+                code, body = route(dict(urllib.parse.parse_qsl(parts.query)))
+            except Exception as e:
+                code, body = 500, {"error": str(e)}
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def health_server(port: str = HEALTH_PORT, host: str = HEALTH_HOST) -> Optional[ThreadingHTTPServer]:
+    """يبدأ خادم الفحوص في خيط خلفي (قبل أي مرحلة أخرى كي يرى مدير العمليات "starting")."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, int(port)), _HealthHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="health", daemon=True).start()
+    log(f"[BOOT] health checks on http://{host}:{server.server_address[1]}/readyz")
+    return server
+
+
+# ===================== إدارة المستأجرين =====================
+
+def tenant_boot(tenant: Tenant, clock: Optional[BootClock] = None) -> None:
+    """يجهّز قاعدة بيانات المستأجر ويستعيد نقطة التفتيش والبث الجاري."""
+    own = clock is None
+    clock = clock or BootClock()
+    with use_tenant(tenant):
+        clock.mark("db_init" if db_init() else "db_init(skip)")
+        DB_WRITER.start()
+        # استعادة نقطة التفتيش: نكمل من آخر offset ونعيد ما انقطع تنفيذه
+        pending = UPDATE_LOG.load()
+        bot.last_update_id = max(bot.last_update_id, UPDATE_LOG.offset)
+        clock.mark("update_log")
+        if pending:
+            log(f"[UPD] {tenant.name}: replaying {len(pending)} unfinished updates")
+            bot.submit_batch(pending)
+        BROADCASTER.resume()
+        clock.mark("resume")
+    if own:
+        log(f"[BOOT] {tenant.name}: {clock.summary()}")
+
+
+class TenantManager:
+    """يشغّل البوتات الإضافية من TENANTS_FILE ويتابع تغييرات الملف."""
+
+    def __init__(self, path: str = TENANTS_FILE, interval: float = TENANTS_POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.tenants: Dict[str, Tenant] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def all(self) -> List[Tenant]:
+        return [DEFAULT_TENANT] + list(self.tenants.values())
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        with open(self.path, encoding="utf-8") as f:
+            entries = json.load(f)
+        config: Dict[str, Dict[str, Any]] = {}
+        for e in entries:
+            name = str(e["name"])
+            if name == DEFAULT_TENANT.name or name in config:
+                raise ValueError(f"duplicate tenant name: {name}")
+            config[name] = {
+                "token": str(e["token"]),
+                "admin_ids": [int(x) for x in e.get("admin_ids", [])],
+                "db_path": str(e.get("db_path") or f"{name}.db"),
+            }
+        return config
+
+    def sync(self) -> None:
+        try:
+            mtime: Optional[float] = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                config = self._read() if mtime is not None else {}
+            except Exception as e:
+                # ملف تالف أثناء التحرير: نُبقي البوتات الحالية ونعيد المحاولة عند التغيير القادم
+                log(f"[TENANTS] cannot read {self.path}: {e}")
+                self._mtime = mtime
+                return
+            self._mtime = mtime
+            for name, t in list(self.tenants.items()):
+                c = config.get(name)
+                if c is None or (c["token"], c["db_path"]) != (t.token, t.db_path):
+                    self._stop(name)
+                else:
+                    t.admin_ids = c["admin_ids"]
+            for name, c in config.items():
+                if name not in self.tenants:
+                    self._start(Tenant(name, c["token"], c["admin_ids"], c["db_path"]))
+
+    def _start(self, tenant: Tenant) -> None:
+        try:
+            tenant_boot(tenant)
+        except Exception as e:
+            log(f"[TENANTS] {tenant.name} failed to start: {e}")
+            return
+        with use_tenant(tenant):
+            poll = functools.partial(bot.infinity_polling, timeout=60, long_polling_timeout=60)
+            tenant_thread(poll, name=f"poll-{tenant.name}").start()
+            warm_up_in_background()
+        self.tenants[tenant.name] = tenant
+        log(f"[TENANTS] {tenant.name} started ({tenant.db_path})")
+
+    def _stop(self, name: str) -> None:
+        tenant = self.tenants.pop(name)
+        tenant.stopped.set()
+        with use_tenant(tenant):
+            bot.stop_polling()
+            DB_WRITER.close()
+        log(f"[TENANTS] {name} stopped")
+
+    def stop_all(self) -> None:
+        with self._lock:
+            for name in list(self.tenants):
+                self._stop(name)
+
+    def watch(self) -> None:
+        def loop() -> None:
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.sync()
+                except Exception:
+                    traceback.print_exc()
+        threading.Thread(target=loop, name="tenants-watch", daemon=True).start()
+
+
+TENANTS = TenantManager()
+
+
+def text_tenants(tenants: List[Tenant]) -> str:
+    total_busy = sum(t.metrics["busy"] for t in tenants) or 1.0
+    lines = [f"🏢 البوتات في هذه العملية: {len(tenants)}"]
+    for t in tenants:
+        m = t.metrics
+        writes = t.writer.stats["jobs"] if "writer" in t.__dict__ else 0
+        sessions = len(t.sessions) if "sessions" in t.__dict__ else 0
+        lines.append(
+            f"\n<b>{html.escape(t.name)}</b> — {len(t.admin_ids)} أدمن\n"
+            f"تحديثات: {m['updates']} / أخطاء: {m['errors']} / قيد المعالجة: {m['inflight']}\n"
+            f"زمن المعالجة: {m['busy']:.1f} ث ({100 * m['busy'] / total_busy:.0f}%) / "
+            f"كتابات DB: {writes} / جلسات: {sessions}"
+        )
+    return "\n".join(lines)
+
+
 # ===================== نقطة تشغيل البوت =====================
 
 def main():
-    db_init()
-    log("🚀 البوت يعمل الآن…")
+    if BOT_RUNTIME == "async" or "--async" in sys.argv[1:]:
+        import bot_async
+        bot_async.main()
+        return
+    BOOT.mark("import")
+    health_server()
+    tenant_boot(DEFAULT_TENANT, BOOT)
+    TENANTS.sync()
+    TENANTS.watch()
+    BOOT.mark("tenants")
+    backup_scheduler()
+    order_expiry_scheduler()
+    outbox_compactor()
+    # التدفئة تبدأ الآن وتجري مع أول getUpdates؛ /readyz يصبح 200 عند انتهائها
+    warm_up_in_background(BOOT)
+    log(f"🚀 البوت يعمل الآن… ({BOOT.elapsed() * 1000:.0f}ms)")
     try:
         # polling(none_stop=True) مهم لتشغيل دائم
         bot.infinity_polling(timeout=60, long_polling_timeout=60)
@@ -1108,7 +4712,13 @@ def main():
         print("Bot stopped by user")
     except Exception:
         traceback.print_exc()
+    finally:
+        # تفريغ ما تبقّى في طوابير الكتابة قبل الخروج
+        TENANTS.stop_all()
+        DB_WRITER.stop()
 
 
 if __name__ == "__main__":
+    # bot_async يستورد هذا الملف باسم "bot": نسجّل الوحدة الحالية كي لا تُحمَّل مرتين
+    sys.modules.setdefault("bot", sys.modules[__name__])
     main()
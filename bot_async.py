@@ -0,0 +1,998 @@
+# -*- coding: utf-8 -*-
+"""
+Telegram Game Top‑Up Bot — asyncio runtime (AsyncTeleBot)
+=========================================================
+
+Same handlers, FSM and admin flows as bot.py, running on telebot.async_telebot:
+
+• Telegram HTTP calls are awaited on one event loop instead of blocking a thread each.
+• SQLite stays synchronous, but every call goes through a small dedicated executor
+  (DB_EXECUTOR), so the loop never waits on disk. Writes still go through the
+  group-commit writer of bot.py.
+• Texts, keyboards, sessions and the data layer are shared with bot.py.
+
+Start with:  BOT_RUNTIME=async python bot.py   (or: python bot.py --async)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import html
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import BaseMiddleware, CancelUpdate
+from telebot.asyncio_helper import ApiTelegramException
+
+import bot as core
+from bot import State, get_session, session_state, clear_session, is_admin, log, money
+
+# عدد خيوط منفذ قاعدة البيانات — القراءات قصيرة، والكتابات تنتظر الكاتب الوحيد فقط
+DB_THREADS = int(os.environ.get("BOT_DB_THREADS", "4"))
+
+# عدد المعالجات التي تعمل معاً؛ الزائد ينتظر خانة حسب أولوية مساره (core.update_priority)
+HANDLER_CONCURRENCY = int(os.environ.get("BOT_HANDLER_CONCURRENCY", "64"))
+
+if core.TELEGRAM_API_URL:
+    asyncio_helper.API_URL = core.TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+
+
+class AdmissionGate:
+    """مقابل طابور core.ADMISSION في هذا التشغيل: لا خيوط هنا، فالطابور هو المعالجات المنتظرة
+    على خانة. release يوقظ أقدم منتظر من أهم صنف، والسياسة (تدهور/إسقاط) نفسها في core.
+
+    كما في core: الطوابير تذاكر (زمن، مستخدم)، ومنتظرو كل مستخدم في سلسلته بترتيب وصولهم؛
+    لا يبدأ تحديث قبل انتهاء سابقه لنفس المستخدم، ورأس السلسلة يرث أهم صنف خلفه."""
+
+    def __init__(self, limit: int):
+        self.free = limit
+        core.ADMISSION.slots = limit
+        self.waiters: List[Deque[Tuple[float, Any]]] = [deque() for _ in core.PRIO_NAMES]
+        self.chains: Dict[Any, Deque[Tuple[int, asyncio.Future]]] = {}
+        self.running: set = set()
+
+    def oldest_age(self) -> float:
+        now = time.monotonic()
+        return max((now - q[0][0] for q in self.waiters if q), default=0.0)
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self.waiters)
+
+    async def acquire(self, prio: int, key: Any) -> Tuple[int, float]:
+        """ينتظر خانة ودور المستخدم key؛ يعيد (الصنف الفعلي، زمن الانتظار)."""
+        queued = time.monotonic()
+        fut = asyncio.get_running_loop().create_future()
+        self.chains.setdefault(key, deque()).append((prio, fut))
+        self.waiters[prio if core.ADMISSION.enabled else core.PRIO_USER].append((queued, key))
+        self._dispatch()
+        try:
+            prio = await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # أُلغيت بعد أن سُلّمت الخانة: تُعاد لمنتظر آخر
+                self.release(key)
+            else:
+                self._forget(key, fut)
+            raise
+        wait = time.monotonic() - queued
+        core.ADMISSION.lag = max(wait, self.oldest_age())
+        return prio, wait
+
+    def release(self, key: Any) -> None:
+        self.running.discard(key)
+        if not self.chains.get(key):
+            self.chains.pop(key, None)
+        self.free += 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.free > 0:
+            for prio, q in enumerate(self.waiters):
+                at = next((i for i, (_queued, key) in enumerate(q) if key not in self.running), None)
+                if at is not None:
+                    break
+            else:
+                return
+            _queued, key = q[at]
+            del q[at]
+            own, fut = self.chains[key].popleft()
+            self.running.add(key)
+            self.free -= 1
+            fut.set_result(min(prio, own))
+
+    def _forget(self, key: Any, fut: asyncio.Future) -> None:
+        chain = self.chains[key]
+        chain.remove(next(c for c in chain if c[1] is fut))
+        # التذاكر لا تخص منتظراً بعينه: تُحذف واحدة من تذاكر المستخدم
+        for q in self.waiters:
+            at = next((i for i, (_queued, k) in enumerate(q) if k == key), None)
+            if at is not None:
+                del q[at]
+                break
+        if not chain and key not in self.running:
+            del self.chains[key]
+
+
+class CheckpointedAsyncTeleBot(AsyncTeleBot):
+    """نفس نقطة التفتيش في core.CheckpointedTeleBot.
+
+    حلقة الـ polling هنا تقدّم الـ offset وتطلب الدفعة التالية قبل أن تبدأ معالجة الحالية،
+    لذلك يُكتب السجل داخل get_updates نفسها، قبل أن ترى الحلقة الدفعة.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.inflight = 0
+        self.gate = AdmissionGate(HANDLER_CONCURRENCY)
+        # يُنشأ داخل الحلقة (Python 3.9 يربط Event بالحلقة عند الإنشاء)
+        self._drained: Optional[asyncio.Event] = None
+
+    async def get_updates(self, offset: Optional[int] = None, limit: Optional[int] = None,
+                          timeout: Optional[int] = 20, allowed_updates: Optional[List] = None,
+                          request_timeout: Optional[int] = None) -> List[types.Update]:
+        # ضغط عكسي: لا نطلب دفعة جديدة ما دام عدد التحديثات قيد المعالجة عند الحد
+        while self.inflight >= core.BOT_MAX_INFLIGHT:
+            if self._drained is None:
+                self._drained = asyncio.Event()
+            self._drained.clear()
+            await self._drained.wait()
+        json_updates = await asyncio_helper.get_updates(self.token, offset, limit, timeout, allowed_updates, request_timeout)
+        core.BOOT.last_poll = time.monotonic()
+        updates = [core.parse_update(ju) for ju in json_updates]
+        await self._admit(updates)
+        return updates
+
+    async def _admit(self, updates: List[types.Update]) -> None:
+        fresh = core.UPDATE_LOG.admit(updates)
+        if fresh:
+            try:
+                await asyncio.wrap_future(core.UPDATE_LOG.journal(fresh))
+            except Exception:
+                # كما في core: offset لم يتقدّم، فالدفعة تعود من تيليجرام ويجب ألا تُعدّ مكرّرة
+                core.UPDATE_LOG.forget(fresh)
+                raise
+        ids = {u.update_id for u in fresh}
+        for u in updates:
+            u.admitted = u.update_id in ids
+        self.inflight += len(fresh)
+
+    async def process_new_updates(self, updates: List[types.Update]) -> None:
+        # تحديثات لم تمر عبر get_updates (webhook مثلاً) تُسجَّل هنا
+        unseen = [u for u in updates if not hasattr(u, "admitted")]
+        if unseen:
+            await self._admit(unseen)
+        admitted = [u for u in updates if u.admitted]
+        core.inherit_priority(admitted)
+        # مرحلة الدفعة (core.batch_prefetch): قفزة واحدة إلى منفذ القاعدة للدفعة كلها
+        ctx = None
+        if admitted:
+            try:
+                ctx = await db(core.batch_prefetch, admitted)
+            except Exception as e:
+                log(f"[BATCH] prefetch failed: {e}")
+        await asyncio.gather(*(self.process_one(u, ctx) for u in admitted))
+
+    async def process_one(self, update: types.Update, ctx: Optional[core.BatchContext] = None) -> None:
+        # gather يغلّف كل معالجة بمهمة لها نسخة سياق خاصة: القيمة لا تتسرب إلى غيرها
+        core.BATCH_CTX.set(ctx)
+        m = core.current_tenant().metrics
+        prio = core.update_priority(update)
+        acquired = False
+        try:
+            if core.ADMISSION.shed_on_arrival(prio, self.gate.oldest_age(), self.gate.queued()):
+                verdict = core.ADMIT_DROP
+            else:
+                key = core.update_user(update)
+                prio, wait = await self.gate.acquire(prio, key)
+                acquired, started = True, time.monotonic()
+                verdict = core.ADMISSION.verdict(prio, wait, update)
+            if verdict == core.ADMIT_RUN:
+                await super().process_new_updates([update])
+            else:
+                m["shed"] += 1
+                reply = core.busy_reply(update) if verdict == core.ADMIT_BUSY else None
+                if reply is not None:
+                    obj, text = reply
+                    if isinstance(obj, types.CallbackQuery):
+                        await self.answer_callback_query(obj.id, text)
+                    else:
+                        await self.send_message(obj.chat.id, text)
+        except Exception as e:
+            m["errors"] += 1
+            log(f"[ERR] update {update.update_id}: {e!r}")
+        finally:
+            if acquired:
+                self.gate.release(key)
+                if verdict != core.ADMIT_DROP:
+                    core.ADMISSION.record(time.monotonic() - started)
+            m["updates"] += 1
+            self.inflight -= 1
+            if self._drained is not None:
+                self._drained.set()
+            core.UPDATE_LOG.done(update.update_id)
+            core.BOOT.update_done()
+
+
+abot = CheckpointedAsyncTeleBot(core.TOKEN, parse_mode="HTML")
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db-async")
+
+
+async def db(fn: Callable[..., Any], *args: Any) -> Any:
+    """ينفّذ دالة بيانات متزامنة من bot.py على منفذ قاعدة البيانات."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, functools.partial(fn, *args))
+
+
+# الحلقة تحتفظ بمراجع ضعيفة للمهام فقط: مهام الخلفية تبقى هنا حتى تنتهي
+BACKGROUND: Set["asyncio.Task[Any]"] = set()
+
+
+def spawn(coro: Any) -> "asyncio.Task[Any]":
+    task = asyncio.create_task(coro)
+    BACKGROUND.add(task)
+    task.add_done_callback(BACKGROUND.discard)
+    return task
+
+
+async def order_get(oid: int) -> Any:
+    # طلب في سياق الدفعة يُعاد دون المرور بمنفذ القاعدة
+    hit, row = core.batch_order(oid)
+    return row if hit else await db(core.order_get, oid)
+
+
+async def lang_of(user: types.User) -> str:
+    # من ذاكرة اللغات غالباً؛ عند الفقد استعلام واحد على منفذ القاعدة لا على حلقة الأحداث
+    return core.cached_lang(user.id) or await db(core.user_lang, user.id, user.language_code)
+
+
+# ===================== الحماية من الإغراق =====================
+
+class FloodMiddleware(BaseMiddleware):
+    # نفس core.flood_check — الحالة (الدلاء والتكرارات) مشتركة مع التشغيل المتزامن
+    def __init__(self):
+        super().__init__()
+        self.update_types = ["message", "callback_query"]
+
+    async def pre_process(self, obj: Any, data: dict) -> Any:
+        verdict = core.flood_check(obj)
+        if verdict is None:
+            return None
+        if verdict == "throttled" and isinstance(obj, types.CallbackQuery):
+            try:
+                lang = core.cached_lang(obj.from_user.id) or core.DEFAULT_LANG
+                await abot.answer_callback_query(obj.id, core.MSG[lang].throttled)
+            except Exception:
+                pass
+        return CancelUpdate()
+
+    async def post_process(self, obj: Any, data: dict, exception: Optional[Exception]) -> None:
+        pass
+
+
+abot.setup_middleware(FloodMiddleware())
+
+
+# ===================== إشعارات وعرض الشاشات =====================
+
+async def notify_admins(text: str, reply_markup: Optional[types.JsonSerializable] = None) -> None:
+    async def one(aid: int) -> None:
+        try:
+            await abot.send_message(aid, text, reply_markup=reply_markup)
+        except Exception as e:
+            log(f"[WARN] notify admin {aid} failed: {e}")
+
+    await asyncio.gather(*(one(aid) for aid in core.current_tenant().admin_ids))
+
+
+async def notify_order_event(kind: str, oid: int, text: str, total: float = 0.0) -> None:
+    # نفس core.notify_order_event؛ الملخصات الدورية يرسلها خيط core.NOTIFIER
+    markup = core.kb_order_review(oid)
+
+    async def one(aid: int) -> None:
+        try:
+            await abot.send_message(aid, text, reply_markup=markup)
+        except Exception as e:
+            log(f"[WARN] notify admin {aid} failed: {e}")
+
+    await asyncio.gather(*(one(aid) for aid in core.NOTIFIER.route(kind, oid, total)))
+
+
+async def render_screen(message: types.Message, text: str, reply_markup: Optional[types.JsonSerializable] = None) -> None:
+    # نفس منطق core.ScreenRenderer.show لكن مع استدعاءات API غير متزامنة
+    screens = core.SCREENS
+    chat_id, message_id = message.chat.id, message.message_id
+    action, digest = screens.plan(message, text, reply_markup)
+    if action == "skip":
+        return
+    if action == "edit":
+        try:
+            await abot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+        except ApiTelegramException as e:
+            if screens.edit_failed(chat_id, message_id, digest, e):
+                return
+        else:
+            screens.edited(chat_id, message_id, digest)
+            return
+    sent = await abot.send_message(chat_id, text, reply_markup=reply_markup)
+    screens.sent(chat_id, sent.message_id, digest)
+
+
+# ===================== الأوامر العامة =====================
+
+@abot.message_handler(commands=["start"])
+async def cmd_start(msg: types.Message):
+    user = msg.from_user
+    lang = await lang_of(user)
+    # لا ننتظر: الكتابة في طابور الكاتب وأي كتابة لاحقة تأتي بعدها (اللغة في الذاكرة الآن)
+    core.ensure_user(user.id, user.username, user.first_name, user.language_code)
+    clear_session(user.id)
+    await abot.send_message(msg.chat.id, core.MSG[lang].start, reply_markup=core.kb_main(is_admin(user.id), lang))
+
+
+@abot.message_handler(commands=["help"])
+async def cmd_help(msg: types.Message):
+    lang = await lang_of(msg.from_user)
+    await abot.send_message(msg.chat.id, core.MSG[lang].help, reply_markup=core.kb_main(is_admin(msg.from_user.id), lang))
+
+
+@abot.message_handler(commands=["lang"])
+async def cmd_lang(msg: types.Message):
+    lang = await lang_of(msg.from_user)
+    await abot.send_message(msg.chat.id, core.MSG[lang].lang_prompt, reply_markup=core.KB_LANG[lang])
+
+
+# ===================== مسارات المستخدم (Callback) =====================
+
+@abot.callback_query_handler(func=lambda c: c.data == "user:list_products")
+async def cq_user_list_products(cq: types.CallbackQuery):
+    lang = await lang_of(cq.from_user)
+    kb = await db(core.kb_products_list, lang)
+    await render_screen(cq.message, core.MSG[lang].products_title, kb)
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data == "user:new_order")
+async def cq_user_new_order(cq: types.CallbackQuery):
+    sess = get_session(cq.from_user.id)
+    sess.state = State.NEW_ORDER_WAIT_PRODUCT
+    lang = await lang_of(cq.from_user)
+    kb = await db(core.kb_products_list, lang)
+    await render_screen(cq.message, core.MSG[lang].choose_product, kb)
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("user:product:"))
+async def cq_select_product(cq: types.CallbackQuery):
+    sess = get_session(cq.from_user.id)
+    lang = await lang_of(cq.from_user)
+    if sess.state not in (State.NEW_ORDER_WAIT_PRODUCT, State.NEW_ORDER_WAIT_QTY):
+        await abot.answer_callback_query(cq.id, core.MSG[lang].start_new_order)
+        return
+    try:
+        pid = int(cq.data.split(":")[-1])
+    except Exception:
+        await abot.answer_callback_query(cq.id, core.MSG[lang].product_error)
+        return
+    prod = await db(core.product_get, pid)
+    if not prod:
+        await abot.answer_callback_query(cq.id, core.MSG[lang].product_missing, show_alert=True)
+        return
+    sess.state = State.NEW_ORDER_WAIT_QTY
+    sess.data["product_id"] = pid
+    await render_screen(cq.message, core.text_qty_prompt(prod, lang), core.kb_back("user:new_order", lang))
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.message_handler(func=lambda m: session_state(m.from_user.id) == State.NEW_ORDER_WAIT_QTY)
+async def msg_qty_entered(msg: types.Message):
+    sess = get_session(msg.from_user.id)
+    lang = await lang_of(msg.from_user)
+    qty, error = core.qty_from_text(msg.text, lang)
+    if qty is None:
+        await abot.send_message(msg.chat.id, error)
+        return
+    pid = int(sess.data.get("product_id", 0))
+    prod = await db(core.product_get, pid)
+    if not prod:
+        clear_session(msg.from_user.id)
+        await abot.send_message(msg.chat.id, core.MSG[lang].product_gone)
+        return
+    total = float(prod["price"]) * qty
+    nonce = core.session_to_confirm(sess, qty)
+    await abot.send_message(msg.chat.id, core.text_confirm_order(prod, qty, total, lang),
+                            reply_markup=core.kb_confirm_order(pid, qty, nonce, lang))
+
+
+@abot.callback_query_handler(func=lambda c: core.route_of(c) == "user:confirm_order")
+async def cq_confirm_order(cq: types.CallbackQuery):
+    sess = get_session(cq.from_user.id)
+    lang = await lang_of(cq.from_user)
+    args = core.order_confirm_args(cq, sess)
+    if args is None:
+        await abot.answer_callback_query(cq.id, core.MSG[lang].nothing_to_confirm)
+        return
+    pid, qty, idem_key = args
+    try:
+        oid, created = await db(core.order_create_once, cq.from_user.id, pid, qty, idem_key)
+    except Exception as e:
+        log(f"[ERR] create order: {e}")
+        await abot.answer_callback_query(cq.id, core.MSG[lang].order_failed, show_alert=True)
+        return
+    order = await order_get(oid)
+    clear_session(cq.from_user.id)
+
+    # إشعار الأدمن (مرة واحدة فقط لكل طلب)
+    if created:
+        try:
+            await notify_order_event("new", oid, core.text_admin_new_order(order, cq.from_user), float(order["total"]))
+        except Exception as e:
+            log(f"[WARN] notify admins failed: {e}")
+
+    await render_screen(cq.message, core.text_order_created(oid, lang), core.KB_ORDER_CREATED[lang])
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data == "user:send_proof")
+async def cq_send_proof_entry(cq: types.CallbackQuery):
+    sess = get_session(cq.from_user.id)
+    sess.state = State.SENDPROOF_WAIT_ORDER_ID
+    lang = await lang_of(cq.from_user)
+    await render_screen(cq.message, core.MSG[lang].ask_proof_order_id, core.kb_back("back:main", lang))
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.message_handler(func=lambda m: session_state(m.from_user.id) == State.SENDPROOF_WAIT_ORDER_ID)
+async def msg_capture_order_id(msg: types.Message):
+    sess = get_session(msg.from_user.id)
+    lang = await lang_of(msg.from_user)
+    oid = core.order_id_from_text(msg.text)
+    if oid is None:
+        await abot.send_message(msg.chat.id, core.MSG[lang].order_id_invalid)
+        return
+    order = await order_get(oid)
+    if not core.order_visible(order, msg.from_user.id):
+        await abot.send_message(msg.chat.id, core.MSG[lang].order_not_found)
+        return
+    sess.state = State.SENDPROOF_WAIT_MEDIA
+    sess.data["order_id"] = oid
+    await abot.send_message(msg.chat.id, core.MSG[lang].ask_proof_media, reply_markup=core.kb_back("back:main", lang))
+
+
+@abot.message_handler(content_types=["photo", "document"])
+async def msg_receive_proof(msg: types.Message):
+    if session_state(msg.from_user.id) != State.SENDPROOF_WAIT_MEDIA:
+        return  # ignore media sent outside proof flow
+    sess = get_session(msg.from_user.id)
+    lang = await lang_of(msg.from_user)
+    oid = int(sess.data.get("order_id", 0))
+    if not oid:
+        await abot.send_message(msg.chat.id, core.MSG[lang].internal_error)
+        clear_session(msg.from_user.id)
+        return
+
+    file_id = core.proof_file_id(msg)
+    if not file_id:
+        await abot.send_message(msg.chat.id, core.MSG[lang].proof_need_media)
+        return
+
+    await db(core.order_set_payment_file, oid, file_id)
+
+    # إشعار الأدمن بالإثبات
+    try:
+        await notify_order_event("proof", oid, f"📎 تم استلام إثبات دفع لطلب #{oid}")
+    except Exception as e:
+        log(f"[WARN] notify admins proof: {e}")
+
+    await abot.send_message(msg.chat.id, core.MSG[lang].proof_saved(oid=oid),
+                            reply_markup=core.kb_main(is_admin(msg.from_user.id), lang))
+    clear_session(msg.from_user.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data == "user:track_order")
+async def cq_track_order_entry(cq: types.CallbackQuery):
+    sess = get_session(cq.from_user.id)
+    sess.state = State.TRACK_WAIT_ID
+    lang = await lang_of(cq.from_user)
+    await render_screen(cq.message, core.MSG[lang].ask_track_order_id, core.kb_back("back:main", lang))
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.message_handler(func=lambda m: session_state(m.from_user.id) == State.TRACK_WAIT_ID)
+async def msg_track_lookup(msg: types.Message):
+    lang = await lang_of(msg.from_user)
+    oid = core.order_id_from_text(msg.text)
+    if oid is None:
+        await abot.send_message(msg.chat.id, core.MSG[lang].order_id_invalid)
+        return
+    order = await order_get(oid)
+    if not core.order_visible(order, msg.from_user.id):
+        await abot.send_message(msg.chat.id, core.MSG[lang].track_not_found)
+    else:
+        await abot.send_message(msg.chat.id, core.text_track(order, lang),
+                                reply_markup=core.kb_main(is_admin(msg.from_user.id), lang))
+    clear_session(msg.from_user.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data == "user:help")
+async def cq_user_help(cq: types.CallbackQuery):
+    lang = await lang_of(cq.from_user)
+    await render_screen(cq.message, core.MSG[lang].user_help, core.kb_back("back:main", lang))
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data == "user:lang")
+async def cq_user_lang(cq: types.CallbackQuery):
+    lang = await lang_of(cq.from_user)
+    await render_screen(cq.message, core.MSG[lang].lang_prompt, core.KB_LANG[lang])
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("lang:"))
+async def cq_set_lang(cq: types.CallbackQuery):
+    lang = core.lang_code(cq.data.split(":", 1)[1])
+    core.set_user_lang(cq.from_user.id, lang)
+    await render_screen(cq.message, core.MSG[lang].lang_set, core.kb_main(is_admin(cq.from_user.id), lang))
+    await abot.answer_callback_query(cq.id)
+
+
+# ===================== لوحة الأدمن =====================
+
+@abot.callback_query_handler(func=lambda c: c.data == "admin:panel")
+async def cq_admin_panel(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ليست لديك صلاحية", show_alert=True)
+        return
+    q = await db(core.review_queue_stats)
+    await render_screen(cq.message, core.text_admin_panel(q), core.kb_admin_panel())
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data == "admin:next")
+async def cq_admin_next(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    oid = await db(core.review_claim_next, cq.from_user.id)
+    order = await order_get(oid) if oid else None
+    if not order:
+        await abot.answer_callback_query(cq.id, "🎉 لا توجد طلبات بانتظار المراجعة", show_alert=True)
+        return
+    await show_order_review(cq, order)
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data == "admin:add_product")
+async def cq_admin_add_product(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    sess = get_session(cq.from_user.id)
+    sess.state = State.ADD_PRODUCT_WAIT_NAME
+    await render_screen(cq.message, "اكتب اسم اللعبة/المنتج:", core.kb_back("admin:panel"))
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.message_handler(func=lambda m: session_state(m.from_user.id) == State.ADD_PRODUCT_WAIT_NAME)
+async def msg_admin_add_product_name(msg: types.Message):
+    sess = get_session(msg.from_user.id)
+    name = (msg.text or "").strip()
+    if not name:
+        await abot.send_message(msg.chat.id, "❌ الاسم لا يمكن أن يكون فارغاً.")
+        return
+    sess.data["new_product_name"] = name
+    sess.state = State.ADD_PRODUCT_WAIT_PRICE
+    await abot.send_message(msg.chat.id, "أدخل السعر (مثال: 3.5)", reply_markup=core.kb_back("admin:panel"))
+
+
+@abot.message_handler(func=lambda m: session_state(m.from_user.id) == State.ADD_PRODUCT_WAIT_PRICE)
+async def msg_admin_add_product_price(msg: types.Message):
+    sess = get_session(msg.from_user.id)
+    text = (msg.text or "").strip().replace(",", ".")
+    try:
+        price = float(text)
+        if price < 0:
+            raise ValueError
+    except Exception:
+        await abot.send_message(msg.chat.id, "❌ من فضلك أرسل رقمًا صالحًا للسعر.")
+        return
+    name = sess.data.get("new_product_name", "")
+    await db(core.product_add, name, price)
+    clear_session(msg.from_user.id)
+    await abot.send_message(msg.chat.id, f"✅ تمت إضافة المنتج: {name} — {money(price)}", reply_markup=core.kb_admin_panel())
+
+
+@abot.callback_query_handler(func=lambda c: c.data == "admin:manage_products")
+async def cq_admin_manage_products(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    kb = await db(core.kb_manage_products)
+    await render_screen(cq.message, "إدارة المنتجات:", kb)
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("admin:product:"))
+async def cq_admin_product_actions(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    try:
+        pid = int(cq.data.split(":")[-1])
+    except Exception:
+        await abot.answer_callback_query(cq.id, "غير صالح", show_alert=True)
+        return
+    prod = await db(core.product_get, pid)
+    if not prod:
+        await abot.answer_callback_query(cq.id, "غير موجود", show_alert=True)
+        return
+    text = f"المنتج: {prod['name']} — {money(prod['price'])}"
+    await render_screen(cq.message, text, core.kb_product_actions(pid))
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("admin:edit_price:"))
+async def cq_admin_edit_price(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    try:
+        pid = int(cq.data.split(":")[-1])
+    except Exception:
+        await abot.answer_callback_query(cq.id, "غير صالح", show_alert=True)
+        return
+    sess = get_session(cq.from_user.id)
+    sess.state = State.EDIT_PRICE_WAIT_VALUE
+    sess.data["pid"] = pid
+    await render_screen(cq.message, "أدخل السعر الجديد (مثال: 2.75)", core.kb_back("admin:manage_products"))
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.message_handler(func=lambda m: session_state(m.from_user.id) == State.EDIT_PRICE_WAIT_VALUE)
+async def msg_admin_edit_price_commit(msg: types.Message):
+    sess = get_session(msg.from_user.id)
+    text = (msg.text or "").strip().replace(",", ".")
+    try:
+        new_price = float(text)
+        if new_price < 0:
+            raise ValueError
+    except Exception:
+        await abot.send_message(msg.chat.id, "❌ أدخل رقمًا صالحًا.")
+        return
+    pid = int(sess.data.get("pid", 0))
+    await db(core.product_edit_price, pid, new_price)
+    prod = await db(core.product_get, pid)
+    name = prod["name"] if prod else "—"
+    clear_session(msg.from_user.id)
+    await abot.send_message(msg.chat.id, f"✅ تم تحديث سعر {name} إلى {money(new_price)}", reply_markup=core.kb_admin_panel())
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("admin:delete_product:"))
+async def cq_admin_delete_product(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    try:
+        pid = int(cq.data.split(":")[-1])
+    except Exception:
+        await abot.answer_callback_query(cq.id, "غير صالح", show_alert=True)
+        return
+    await db(core.product_delete, pid)
+    await render_screen(cq.message, "🗑️ تم حذف المنتج.", core.kb_admin_panel())
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("admin:list_pending"))
+async def cq_admin_list_pending(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    parts = cq.data.split(":")
+    page = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+    ids, has_more = await db(core.orders_pending_page, page)
+    await render_screen(cq.message, "الطلبات المعلّقة:", core.kb_pending_orders(ids, page, has_more))
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("admin:review:"))
+async def cq_admin_review(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    try:
+        oid = int(cq.data.split(":")[-1])
+    except Exception:
+        await abot.answer_callback_query(cq.id, "غير صالح", show_alert=True)
+        return
+    order = await order_get(oid)
+    if not order:
+        await abot.answer_callback_query(cq.id, "الطلب غير موجود", show_alert=True)
+        return
+    holder = await db(core.review_claim, oid, cq.from_user.id) if order["status"] == "pending" else cq.from_user.id
+    await show_order_review(cq, order, holder)
+    await abot.answer_callback_query(cq.id)
+
+
+async def show_order_review(cq: types.CallbackQuery, order: Any, holder: Optional[int] = None) -> None:
+    oid = int(order["id"])
+    text = core.text_admin_review(order)
+    if holder is not None and holder != cq.from_user.id:
+        text += f"\n\n⚠️ هذا الطلب قيد المراجعة حالياً من أدمن آخر ({holder})."
+    await render_screen(cq.message, text, core.kb_order_review(oid))
+
+    if order["payment_file_id"]:
+        # حاول إرسال الصورة أولاً، وإن فشل أرسل كوثيقة
+        try:
+            await abot.send_photo(cq.from_user.id, order["payment_file_id"], caption=f"إثبات دفع — طلب #{oid}")
+        except Exception:
+            try:
+                await abot.send_document(cq.from_user.id, order["payment_file_id"], caption=f"إثبات دفع — طلب #{oid}")
+            except Exception:
+                pass
+
+
+async def _admin_decide(cq: types.CallbackQuery, status: str, admin_text: str, answer: str) -> None:
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    try:
+        oid = int(cq.data.split(":")[-1])
+    except Exception:
+        await abot.answer_callback_query(cq.id, "غير صالح", show_alert=True)
+        return
+    outcome, user_id = await db(core.order_decide, oid, status, cq.from_user.id)
+    if outcome != "ok":
+        await abot.answer_callback_query(cq.id, core.text_decide_refused(oid, outcome, user_id), show_alert=True)
+        return
+    try:
+        lang = core.cached_lang(user_id) or await db(core.user_lang, user_id)
+        await abot.send_message(user_id, core.text_order_decision(oid, status, lang))
+    except Exception as e:
+        log(f"[WARN] notify user {status}: {e}")
+    await render_screen(cq.message, admin_text.format(oid=oid), core.kb_order_review(oid))
+    await abot.answer_callback_query(cq.id, answer)
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("admin:accept:"))
+async def cq_admin_accept(cq: types.CallbackQuery):
+    await _admin_decide(cq, "accepted", "تم قبول الطلب #{oid}.", "✅ تم القبول")
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("admin:reject:"))
+async def cq_admin_reject(cq: types.CallbackQuery):
+    await _admin_decide(cq, "rejected", "تم رفض الطلب #{oid}.", "❌ تم الرفض")
+
+
+@abot.callback_query_handler(func=lambda c: c.data.startswith("admin:details:"))
+async def cq_admin_details(cq: types.CallbackQuery):
+    if not is_admin(cq.from_user.id):
+        await abot.answer_callback_query(cq.id, "ممنوع", show_alert=True)
+        return
+    try:
+        oid = int(cq.data.split(":")[-1])
+    except Exception:
+        await abot.answer_callback_query(cq.id, "غير صالح", show_alert=True)
+        return
+    order = await order_get(oid)
+    if not order:
+        await abot.answer_callback_query(cq.id, "غير موجود", show_alert=True)
+        return
+    await render_screen(cq.message, core.text_admin_details(order), core.kb_order_review(oid))
+    await abot.answer_callback_query(cq.id)
+
+
+# ===================== أزرار الرجوع و NOOP =====================
+
+@abot.callback_query_handler(func=lambda c: c.data == "back:main")
+async def cq_back_main(cq: types.CallbackQuery):
+    clear_session(cq.from_user.id)
+    lang = await lang_of(cq.from_user)
+    await render_screen(cq.message, core.MSG[lang].main_menu, core.kb_main(is_admin(cq.from_user.id), lang))
+    await abot.answer_callback_query(cq.id)
+
+
+@abot.callback_query_handler(func=lambda c: c.data == "noop")
+async def cq_noop(cq: types.CallbackQuery):
+    await abot.answer_callback_query(cq.id)
+
+
+# ===================== أوامر مساعدة للأدمن (إضافية) =====================
+
+@abot.message_handler(commands=["stats"])
+async def cmd_stats(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    counts = await db(core.stats_counts)
+    await abot.send_message(msg.chat.id, core.text_stats(counts, core.SCREENS.stats))
+
+
+@abot.message_handler(commands=["chart"])
+async def cmd_chart(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    key = await db(core.chart_key, *core.chart_args(msg))
+    hit = core.CHARTS.get(key)
+    try:
+        if hit is None:
+            fut, owner = core.CHARTS.claim(key)
+            if not owner:
+                # نفس المفتاح يُرسم الآن (من هذا التشغيل أو غيره): ننتظر file_id بدل رسم ثانٍ
+                hit = await asyncio.wrap_future(fut)
+            else:
+                try:
+                    series, title, caption = await db(core.chart_data, key)
+                    # الرسم في core.CHART_POOL: لا حلقة الأحداث ولا منفذ القاعدة
+                    png = await asyncio.wrap_future(core.CHART_POOL.submit(
+                        core.render_sales_chart, series, core.CHART_RANGES[key[0]][1], title))
+                    sent = await abot.send_photo(msg.chat.id, png, caption=caption)
+                    value = (sent.photo[-1].file_id, caption)
+                except Exception as e:
+                    core.CHARTS.resolve(key, fut, None, e)
+                    raise
+                core.CHARTS.resolve(key, fut, value)
+                return
+        await abot.send_photo(msg.chat.id, hit[0], caption=hit[1])
+    except Exception as e:
+        log(f"[CHART] failed: {e}")
+        await abot.send_message(msg.chat.id, f"❌ تعذّر رسم المخطط: {html.escape(str(e))}")
+
+
+@abot.message_handler(commands=["broadcast"])
+async def cmd_broadcast(msg: types.Message):
+    # الإرسال نفسه يجري في خيوط core.BROADCASTER (مشتركة مع التشغيل المتزامن)
+    if not is_admin(msg.from_user.id):
+        return
+    text = core.broadcast_text_from(msg)
+    if not text:
+        await abot.send_message(msg.chat.id, core.TXT_BROADCAST_USAGE)
+        return
+    if not core.BROADCASTER.claim():
+        await abot.send_message(msg.chat.id, core.text_broadcast_busy(core.BROADCASTER.active))
+        return
+    bid: Optional[int] = None
+    try:
+        try:
+            await abot.send_message(msg.chat.id, text)
+        except ApiTelegramException as e:
+            await abot.send_message(msg.chat.id, f"❌ تعذّر إرسال المعاينة: {e.description}", parse_mode=None)
+            return
+        progress = await abot.send_message(msg.chat.id, "📣 جارٍ تجهيز البث…")
+        bid = await db(core.broadcast_create, msg.from_user.id, text, msg.chat.id, progress.message_id)
+    finally:
+        if bid is None:
+            core.BROADCASTER.release()
+    core.BROADCASTER.start(bid, claimed=True)
+
+
+@abot.message_handler(commands=["broadcast_stop"])
+async def cmd_broadcast_stop(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    if core.BROADCASTER.cancel():
+        await abot.send_message(msg.chat.id, "سيتوقف البث بعد الدفعة الحالية.")
+    else:
+        await abot.send_message(msg.chat.id, "لا يوجد بث جارٍ.")
+
+
+@abot.message_handler(commands=["profile"])
+async def cmd_profile(msg: types.Message):
+    # المعالجات هنا coroutines: تظهر في العيّنات حين تنفّذ فعلاً، لا حين تنتظر await
+    if not is_admin(msg.from_user.id):
+        return
+    if core.PROFILER.running:
+        await abot.send_message(msg.chat.id, "يوجد تحليل جارٍ بالفعل.")
+        return
+    seconds = core.profile_seconds_from(msg)
+    await abot.send_message(msg.chat.id, f"🔬 بدأ التحليل لمدة {seconds:.0f} ثانية…")
+    threading.Thread(
+        target=core.profile_and_report, args=(msg.chat.id, seconds, core.handler_codes(abot)),
+        name="profiler", daemon=True,
+    ).start()
+
+
+@abot.message_handler(commands=["backup"])
+async def cmd_backup(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    if core.backup_running():
+        await abot.send_message(msg.chat.id, "يوجد نسخ احتياطي جارٍ، حاول بعد قليل.")
+        return
+    await abot.send_message(msg.chat.id, "💾 بدأ النسخ الاحتياطي…")
+    try:
+        # النسخ والضغط في منفذ قاعدة البيانات؛ الحلقة لا تتوقف
+        res = await db(core.backup_now)
+    except Exception as e:
+        log(f"[BACKUP] failed: {e}")
+        await abot.send_message(msg.chat.id, f"❌ فشل النسخ الاحتياطي: {html.escape(str(e))}")
+        return
+    await abot.send_message(msg.chat.id, core.text_backup_done(res))
+
+
+@abot.message_handler(commands=["adddemo"])
+async def cmd_add_demo(msg: types.Message):
+    if not is_admin(msg.from_user.id):
+        return
+    demo = [
+        ("UC PUBG", 0.99),
+        ("Diamonds Free Fire", 0.79),
+        ("CP Call of Duty", 1.49),
+        ("Robux", 0.50),
+    ]
+    futures = [core.db_submit("INSERT INTO products(name, price) VALUES(?,?)", (name, price)) for name, price in demo]
+    await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+    core.PRODUCTS.invalidate()
+    await abot.send_message(msg.chat.id, "✅ تمت إضافة منتجات تجريبية.")
+
+
+# ===================== نقطة تشغيل البوت =====================
+
+async def warm_up() -> None:
+    """core.warm_up لهذا التشغيل: خيوط منفذ القاعدة بدل خيوط المعالجة، وجلسة aiohttp واحدة."""
+    clock = core.BOOT
+    started = time.perf_counter()
+    try:
+        stats = await db(core.warm_data)
+        # warm_pool ينتظر مهام DB_EXECUTOR، فلا يعمل داخله
+        stats["workers"] = await asyncio.to_thread(core.warm_pool, DB_EXECUTOR, DB_THREADS, core.warm_reader)
+        await abot.get_me()
+    except Exception as e:
+        log(f"[BOOT] warm-up failed: {e}")
+        stats = {}
+    clock.add("warm_up", time.perf_counter() - started)
+    clock.warm = stats
+    clock.ready.set()
+    log(f"[BOOT] ready: {clock.summary()} {stats}")
+
+
+async def run() -> None:
+    clock = core.BOOT
+    clock.mark("import")
+    core.health_server()
+    migrated = await db(core.db_init)
+    clock.mark("db_init" if migrated else "db_init(skip)")
+    core.DB_WRITER.start()
+    if os.path.exists(core.TENANTS_FILE):
+        log(f"[TENANTS] {core.TENANTS_FILE} ignored: multi-tenant mode runs on the sync runtime only")
+    pending = await db(core.UPDATE_LOG.load)
+    clock.mark("update_log")
+    # استعادة نقطة التفتيش: نكمل من آخر offset ونعيد ما انقطع تنفيذه
+    if core.UPDATE_LOG.offset:
+        abot.offset = core.UPDATE_LOG.offset + 1
+    if pending:
+        log(f"[UPD] replaying {len(pending)} unfinished updates")
+        for update in pending:
+            update.admitted = True
+        abot.inflight += len(pending)
+        spawn(abot.process_new_updates(pending))
+    await db(core.BROADCASTER.resume)
+    clock.mark("resume")
+    core.backup_scheduler()
+    core.order_expiry_scheduler()
+    core.outbox_compactor()
+    # التدفئة تجري مع أول getUpdates؛ /readyz يصبح 200 عند انتهائها
+    spawn(warm_up())
+    log(f"🚀 البوت يعمل الآن (asyncio)… ({clock.elapsed() * 1000:.0f}ms)")
+    try:
+        await abot.infinity_polling(timeout=60, request_timeout=90)
+    finally:
+        await abot.close_session()
+
+
+def main() -> None:
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("Bot stopped by user")
+    finally:
+        core.DB_WRITER.stop()
+        DB_EXECUTOR.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
-# ملف التشغيل الرئيسي
+# ملف تشغيل لوحة الويب — خادم WSGI إنتاجي (waitress) بدل خادم Flask التجريبي.
+# البوت نفسه عملية مستقلة: python bot.py (انظر Procfile). بديل: gunicorn 'app:create_app()'
+import os
+
+from waitress import serve
+
 from app import create_app
 
 
@@ -6,5 +11,9 @@ app = create_app()
 
 
 if __name__ == '__main__':
-# في وضع الإنتاج احرص على استخدام WSGI server مثل gunicorn
-app.run(host='0.0.0.0', port=5000, debug=True)
+    serve(
+        app,
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', '5000')),
+        threads=int(os.environ.get('DASHBOARD_THREADS', '8')),
+    )
@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
-export FLASK_APP=app
-export FLASK_ENV=development
-python -u run.py
+# لوحة الويب والبوت عمليتان منفصلتان على نفس data.db
+python -u bot.py &
+exec python -u run.py